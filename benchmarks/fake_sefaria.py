@@ -0,0 +1,237 @@
+"""
+A local stand-in for the Sefaria API, for load tests and benchmarks.
+
+Replays the fixtures in benchmarks/fixtures for api/v3/texts, api/related,
+api/calendars and api/search-wrapper, with injected latency and errors.
+Texts and links of refs without a fixture are synthesized from the first
+fixture, so any workload can be replayed.
+
+    python benchmarks/fake_sefaria.py serve --port 8765 --latency 50 --jitter 20 --error-rate 0.01
+    SEFARIA_API_BASE_URL=http://127.0.0.1:8765 sefaria_jewish_library
+
+The fixtures can be re-recorded from sefaria.org with:
+
+    python benchmarks/fake_sefaria.py record "Genesis 1:1" "Berakhot 2a:1" ...
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SEFARIA_URL = "https://www.sefaria.org"
+
+# Number of segments synthesized for a ref without a segment number, e.g. "Genesis 5"
+SYNTHETIC_SEGMENTS = 30
+
+
+def load_fixtures(fixtures_dir: str = FIXTURES_DIR) -> dict:
+    fixtures = {}
+    for name in ("texts", "related", "calendars", "search"):
+        with open(os.path.join(fixtures_dir, f"{name}.json"), encoding="utf-8") as f:
+            fixtures[name] = json.load(f)
+    return fixtures
+
+
+def _select_versions(versions: list[dict], params: list[str]) -> list[dict]:
+    """
+    Applies the v3 version params, e.g. version=english or version=hebrew|Some Title.
+    """
+    if not params:
+        params = ["primary"]
+    selected = []
+    for param in params:
+        language, _, title = param.partition("|")
+        for version in versions:
+            if language == "primary" and not version.get("isPrimary"):
+                continue
+            if language in ("hebrew", "english") and version["languageFamilyName"] != language:
+                continue
+            if title and version["versionTitle"] != title:
+                continue
+            selected.append(version)
+            break
+    return selected
+
+
+def _section_number(section: str) -> int:
+    """
+    Returns the position of a chapter or daf number, e.g. 3, "2a" or "2b".
+    """
+    if section[-1:] in ("a", "b"):
+        return int(section[:-1]) * 2 + (section[-1] == "b")
+    return int(section)
+
+
+def _synthesize_segments(address: str, segment: str):
+    """
+    Returns the text of an address shaped like the API returns it: a segment for "1:1", a list of
+    segments for "1", "1:1-3" or "1:3-30", and a list of sections for "1-2" or "1:30-2:2".
+    """
+    start, _, end = address.partition("-")
+    start_section, _, start_segment = start.partition(":")
+    if not end:
+        return segment if start_segment else [segment] * SYNTHETIC_SEGMENTS
+    end_section, _, end_segment = end.rpartition(":") if ":" in end else ("", "", end)
+    if start_segment and not end_section:
+        return [segment] * (int(end_segment) - int(start_segment) + 1)
+    if not start_segment:
+        # A range of whole sections
+        end_section, end_segment = end, ""
+    sections = []
+    count = _section_number(end_section) - _section_number(start_section) + 1
+    for n in range(count):
+        first = int(start_segment) if start_segment and n == 0 else 1
+        last = int(end_segment) if end_segment and n == count - 1 else SYNTHETIC_SEGMENTS
+        sections.append([segment] * max(0, last - first + 1))
+    return sections
+
+
+def synthesize_text(fixtures: dict, ref: str) -> dict:
+    """
+    Returns a text response for a ref without a fixture, built from the first text fixture.
+    """
+    data = copy.deepcopy(next(iter(fixtures["texts"].values())))
+    address = ref.rsplit(" ", 1)[-1]
+    for version in data["versions"]:
+        segment = version["text"] if isinstance(version["text"], str) else version["text"][0]
+        while isinstance(segment, list):
+            segment = segment[0] if segment else ""
+        version["text"] = _synthesize_segments(address, segment)
+    data["ref"] = data["title"] = data["sectionRef"] = ref
+    data["heRef"] = ref
+    return data
+
+
+def synthesize_related(fixtures: dict, ref: str) -> dict:
+    data = copy.deepcopy(next(iter(fixtures["related"].values())))
+    for link in data["links"]:
+        link["anchorRef"] = ref
+        link["anchorRefExpanded"] = [ref]
+    return data
+
+
+def create_app(fixtures: dict, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int | None = None):
+    """
+    Returns the Starlette app serving the fixtures. latency and jitter are in seconds:
+    each response is delayed by latency plus a uniform random [0, jitter), and
+    a fraction error_rate of the responses are HTTP 500 errors.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+
+    rng = random.Random(seed)
+    counters = {"requests": 0, "errors": 0}
+
+    async def inject(request):
+        counters["requests"] += 1
+        delay = latency + (rng.random() * jitter if jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if error_rate and rng.random() < error_rate:
+            counters["errors"] += 1
+            return PlainTextResponse("Injected error", status_code=500)
+        return None
+
+    async def texts(request):
+        error = await inject(request)
+        if error:
+            return error
+        ref = request.path_params["ref"]
+        data = fixtures["texts"].get(ref) or synthesize_text(fixtures, ref)
+        data = dict(data, versions=_select_versions(data["versions"], request.query_params.getlist("version")))
+        return JSONResponse(data)
+
+    async def related(request):
+        error = await inject(request)
+        if error:
+            return error
+        ref = request.path_params["ref"]
+        return JSONResponse(fixtures["related"].get(ref) or synthesize_related(fixtures, ref))
+
+    async def calendars(request):
+        error = await inject(request)
+        if error:
+            return error
+        data = dict(fixtures["calendars"])
+        params = request.query_params
+        if all(params.get(name) for name in ("year", "month", "day")):
+            data["date"] = f"{params['year']}-{int(params['month']):02d}-{int(params['day']):02d}"
+        if params.get("timezone"):
+            data["timezone"] = params["timezone"]
+        return JSONResponse(data)
+
+    async def search(request):
+        error = await inject(request)
+        if error:
+            return error
+        payload = await request.json()
+        data = copy.deepcopy(fixtures["search"])
+        data["hits"]["hits"] = data["hits"]["hits"][:payload.get("size", 10)]
+        return JSONResponse(data)
+
+    async def stats(request):
+        return JSONResponse(counters)
+
+    return Starlette(routes=[
+        Route("/api/v3/texts/{ref:path}", texts),
+        Route("/api/related/{ref:path}", related),
+        Route("/api/calendars", calendars),
+        Route("/api/search-wrapper", search, methods=["POST"]),
+        Route("/_stats", stats),
+    ])
+
+
+def record(refs: list[str], fixtures_dir: str = FIXTURES_DIR):
+    """
+    Records the texts and links of refs, today's calendar and a search from sefaria.org.
+    """
+    import httpx
+
+    fixtures = {"texts": {}, "related": {}}
+    with httpx.Client(base_url=SEFARIA_URL, timeout=30, follow_redirects=True) as client:
+        for ref in refs:
+            fixtures["texts"][ref] = client.get(f"/api/v3/texts/{ref}", params=[("version", "hebrew"), ("version", "english")]).json()
+            fixtures["related"][ref] = client.get(f"/api/related/{ref}").json()
+        fixtures["calendars"] = client.get("/api/calendars").json()
+        fixtures["search"] = client.post("/api/search-wrapper", json={
+            "query": "שמע", "type": "text", "field": "naive_lemmatizer", "size": 10,
+            "source_proj": True, "sort_fields": ["pagesheetrank"], "sort_method": "score", "slop": 2,
+        }).json()
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for name, data in fixtures.items():
+        with open(os.path.join(fixtures_dir, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Sefaria API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="serve the fixtures")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="latency of each response, in ms")
+    serve_parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many ms")
+    serve_parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of responses that are HTTP 500 errors")
+    serve_parser.add_argument("--seed", type=int, default=None)
+    serve_parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    record_parser = subparsers.add_parser("record", help="record fixtures from sefaria.org")
+    record_parser.add_argument("refs", nargs="+")
+    record_parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.refs, args.fixtures)
+        return
+
+    import uvicorn
+
+    app = create_app(load_fixtures(args.fixtures), args.latency / 1000, args.jitter / 1000, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Load test of the MCP server against the local Sefaria stand-in (fake_sefaria.py).
+
+Starts the stand-in and the server, drives the server over stdio or streamable HTTP
+with the MCP client, and reports the latency percentiles, throughput and memory of each
+tool, followed by a mixed workload of all tools:
+
+    python benchmarks/run.py --requests 200 --concurrency 16 --latency 50 --jitter 20 --error-rate 0.01
+    python benchmarks/run.py --transport http --workers 4 --sessions 8 --concurrency 64
+
+Use --json to save the report, and --baseline to compare it against a saved report.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+try:
+    from mcp.client.streamable_http import streamable_http_client
+except ImportError:
+    from mcp.client.streamable_http import streamablehttp_client as streamable_http_client
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "src")
+
+# Refs of the workloads; refs without a fixture are synthesized by the stand-in
+REFS = (
+    [f"Genesis 1:{verse}" for verse in range(1, 32)]
+    + [f"Exodus {chapter}" for chapter in range(1, 11)]
+    + [f"Berakhot {daf}{side}" for daf in range(2, 12) for side in "ab"]
+    + [f"Shulchan Arukh, Orach Chayim {siman}:1" for siman in range(1, 21)]
+)
+QUERIES = ["שמע", "קריאת שמע", "בראשית ברא", "תפילה", "שבת", "Shema", "Sabbath", "prayer"]
+
+# Relative weights of the tools in the mixed workload
+MIX = {
+    "get_text": 40,
+    "get_commentaries": 20,
+    "search_texts": 20,
+    "get_daily_learnings": 10,
+    "get_texts": 10,
+}
+
+
+def tool_arguments(tool: str, rng: random.Random) -> dict:
+    if tool == "get_text":
+        return {"reference": rng.choice(REFS)}
+    if tool == "get_texts":
+        return {"references": rng.sample(REFS, 5)}
+    if tool == "get_commentaries":
+        return {"reference": rng.choice(REFS[:31])}
+    if tool == "search_texts":
+        return {"query": rng.choice(QUERIES), "size": 10}
+    if tool == "get_daily_learnings":
+        return {"year": 2024, "month": rng.randint(1, 12), "day": rng.randint(1, 28)}
+    raise ValueError(f"Unknown tool: {tool}")
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(process: subprocess.Popen, port: int, name: str):
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"The {name} did not start")
+
+
+def start_fake_sefaria(args) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCHMARKS_DIR, "fake_sefaria.py"), "serve",
+        "--port", str(args.port), "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--seed", str(args.seed),
+    ])
+    wait_for_port(process, args.port, "Sefaria stand-in")
+    return process
+
+
+def server_environment(args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")])),
+        "PYTHONIOENCODING": "utf-8",
+        "SEFARIA_API_BASE_URL": f"http://127.0.0.1:{args.port}",
+        "SEFARIA_BACKEND": "remote",
+        "SEFARIA_SEARCH_BACKEND": "remote",
+        "SEFARIA_CACHE": "1" if args.cache else "0",
+        "SEFARIA_DISK_CACHE": "0",
+        "SEFARIA_LOG_LEVEL": "WARNING",
+        "SEFARIA_LOG_FILE": "",
+    })
+    return env
+
+
+async def server_memory(session: ClientSession) -> dict:
+    """
+    Reads the server's resident memory from the Prometheus output of get_diagnostics.
+    """
+    result = await session.call_tool("get_diagnostics", {"format": "prometheus"})
+    memory = {}
+    for line in result.content[0].text.splitlines():
+        if line.startswith("sefaria_process_"):
+            name, value = line.split()
+            memory[name.removeprefix("sefaria_process_")] = int(float(value))
+    return memory
+
+
+async def run_workload(sessions: list[ClientSession], tools: list[str], requests: int, concurrency: int, rng: random.Random) -> dict:
+    """
+    Sends requests tool calls, drawn from tools, with at most concurrency calls in flight,
+    spread over the sessions. Returns the latencies and error counts per tool.
+    """
+    calls = [(tool, tool_arguments(tool, rng)) for tool in tools[:requests]]
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    queue = iter(calls)
+
+    async def worker(session):
+        for tool, arguments in queue:
+            start = time.perf_counter()
+            try:
+                result = await session.call_tool(tool, arguments)
+                failed = result.isError or result.content[0].text.startswith("Error")
+            except Exception:
+                failed = True
+            latencies.setdefault(tool, []).append(time.perf_counter() - start)
+            errors[tool] = errors.get(tool, 0) + failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(sessions[i % len(sessions)]) for i in range(concurrency)))
+    return {"elapsed": time.perf_counter() - start, "latencies": latencies, "errors": errors}
+
+
+def summarize(phase: str, run: dict, memory_before: dict, memory_after: dict) -> list[dict]:
+    """
+    Returns a report row per tool of the phase, plus an "all" row when the phase mixed several tools.
+    """
+    groups = sorted(run["latencies"].items())
+    if len(groups) > 1:
+        groups.append(("all", [value for _, values in groups for value in values]))
+    rows = []
+    for tool, values in groups:
+        values = sorted(values)
+        rows.append({
+            "phase": phase,
+            "tool": tool,
+            "requests": len(values),
+            "errors": sum(run["errors"].values()) if tool == "all" else run["errors"].get(tool, 0),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "rps": len(values) / run["elapsed"],
+            "rss_mb": memory_after.get("rss_bytes", 0) / 2**20,
+            "max_rss_growth_mb": (memory_after.get("max_rss_bytes", 0) - memory_before.get("max_rss_bytes", 0)) / 2**20,
+        })
+    return rows
+
+
+def print_report(rows: list[dict], baseline: list[dict] | None = None):
+    previous = {(row["phase"], row["tool"]): row for row in baseline or []}
+    header = f"{'phase':<20} {'tool':<20} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>8} {'rss MB':>8} {'peak +MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['phase']:<20} {row['tool']:<20} {row['requests']:>6} {row['errors']:>5} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['rps']:>8.1f} "
+            f"{row['rss_mb']:>8.1f} {row['max_rss_growth_mb']:>9.1f}"
+        )
+        old = previous.get((row["phase"], row["tool"]))
+        if old:
+            print(
+                f"{'':<20} {'vs baseline':<20} {'':>6} {'':>5} "
+                + " ".join(f"{(row[k] / old[k] - 1) * 100 if old[k] else 0:>+8.0f}%" for k in ("p50_ms", "p95_ms", "p99_ms", "rps"))
+            )
+
+
+@contextlib.asynccontextmanager
+async def connect(args, errlog):
+    """
+    Starts the server and yields args.sessions initialized client sessions.
+    Over stdio every session is a server process of its own.
+    """
+    command = args.server_command or [sys.executable, "-c", "import sefaria_jewish_library; sefaria_jewish_library.main()"]
+    env = server_environment(args)
+    async with contextlib.AsyncExitStack() as stack:
+        if args.transport == "http":
+            port = free_port()
+            process = subprocess.Popen(
+                command + ["--transport", "http", "--port", str(port), "--workers", str(args.workers)],
+                env=env, stdout=errlog, stderr=errlog,
+            )
+            stack.callback(process.wait)
+            stack.callback(process.terminate)
+            wait_for_port(process, port, "server")
+            streams = [await stack.enter_async_context(streamable_http_client(f"http://127.0.0.1:{port}/mcp")) for _ in range(args.sessions)]
+        else:
+            params = StdioServerParameters(command=command[0], args=command[1:], env=env)
+            streams = [await stack.enter_async_context(stdio_client(params, errlog)) for _ in range(args.sessions)]
+        sessions = []
+        for read_stream, write_stream, *_ in streams:
+            session = await stack.enter_async_context(ClientSession(read_stream, write_stream))
+            await session.initialize()
+            sessions.append(session)
+        yield sessions
+
+
+async def benchmark(args) -> list[dict]:
+    rng = random.Random(args.seed)
+    rows = []
+    phases = [(tool, [tool] * args.requests) for tool in args.tools]
+    weighted = [tool for tool in MIX if tool in args.tools]
+    phases.append(("mixed", rng.choices(weighted, [MIX[tool] for tool in weighted], k=args.requests)))
+    with open(args.server_log, "a", encoding="utf-8") as errlog:
+        async with connect(args, errlog) as sessions:
+            for phase, tools in phases:
+                # With several server processes, the memory is the one of the process answering
+                memory_before = await server_memory(sessions[0])
+                run = await run_workload(sessions, tools, args.requests, args.concurrency, rng)
+                memory_after = await server_memory(sessions[0])
+                rows.extend(summarize(phase, run, memory_before, memory_after))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MCP server against a local Sefaria stand-in")
+    parser.add_argument("--requests", type=int, default=200, help="tool calls per phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="tool calls in flight")
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio")
+    parser.add_argument("--sessions", type=int, default=1, help="client sessions sharing the calls")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes, with --transport http")
+    parser.add_argument("--tools", nargs="+", default=list(MIX), choices=list(MIX))
+    parser.add_argument("--latency", type=float, default=50.0, help="latency of the stand-in, in ms")
+    parser.add_argument("--jitter", type=float, default=20.0, help="random extra latency of the stand-in, up to this many ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stand-in responses that are HTTP 500 errors")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="disable the server's response cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=None, help="port of the stand-in (default: a free port)")
+    parser.add_argument("--server-command", nargs="+", help="command starting the server (default: the package in src/)")
+    parser.add_argument("--server-log", default=os.devnull, help="file receiving the server's stderr")
+    parser.add_argument("--json", help="save the report to this file")
+    parser.add_argument("--baseline", help="compare against a report saved with --json")
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    fake_sefaria = start_fake_sefaria(args)
+    try:
+        rows = asyncio.run(benchmark(args))
+    finally:
+        fake_sefaria.terminate()
+        fake_sefaria.wait()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_report(rows, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}, "results": rows}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
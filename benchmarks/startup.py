@@ -0,0 +1,144 @@
+"""
+Cold start benchmark of the stdio server.
+
+Reports the import time of the server (python -X importtime), grouped by top-level package,
+then spawns the server repeatedly, with and without fast start, and measures the time from the
+spawn to its responses to initialize, tools/list and a first tool call (get_diagnostics, which
+makes no upstream request):
+
+    python benchmarks/startup.py --runs 10
+    python benchmarks/startup.py --target-ms 300
+
+With --target-ms, exits with status 1 when the median time to the tools/list response of the
+fast start is above the target. The responses of the fast start are saved by a first run,
+which is not measured.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "src")
+
+SERVER_COMMAND = [sys.executable, "-c", "import sefaria_jewish_library; sefaria_jewish_library.main()"]
+STEPS = ("initialize", "tools/list", "tools/call")
+
+
+def server_environment(cache_dir: str, fast_start: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [SRC_DIR, env.get("PYTHONPATH")])),
+        "PYTHONIOENCODING": "utf-8",
+        "SEFARIA_CACHE_DIR": cache_dir,
+        "SEFARIA_FAST_START": "1" if fast_start else "0",
+        "SEFARIA_LOG_LEVEL": "WARNING",
+        "SEFARIA_LOG_FILE": "",
+    })
+    return env
+
+
+def import_times(env: dict) -> tuple[float, dict[str, float]]:
+    """
+    Returns the total import time of the server, and the import time of each top-level package, in seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import sefaria_jewish_library.server"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    packages: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative_us, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(self_us) / 1e6
+    return sum(packages.values()), packages
+
+
+def time_startup(env: dict) -> dict[str, float]:
+    """
+    Spawns the server and returns the seconds from the spawn to each of its first responses.
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(SERVER_COMMAND, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    timings = {}
+
+    def send(message: dict):
+        process.stdin.write(json.dumps(message).encode() + b"\n")
+        process.stdin.flush()
+
+    def wait_for(request_id: int):
+        while True:
+            line = process.stdout.readline()
+            if not line:
+                raise RuntimeError("The server exited before answering")
+            if json.loads(line).get("id") == request_id:
+                return
+
+    try:
+        send({"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "startup-benchmark", "version": "0"},
+        }})
+        wait_for(1)
+        timings["initialize"] = time.perf_counter() - start
+        send({"jsonrpc": "2.0", "method": "notifications/initialized"})
+        send({"jsonrpc": "2.0", "id": 2, "method": "tools/list"})
+        wait_for(2)
+        timings["tools/list"] = time.perf_counter() - start
+        send({"jsonrpc": "2.0", "id": 3, "method": "tools/call", "params": {"name": "get_diagnostics", "arguments": {}}})
+        wait_for(3)
+        timings["tools/call"] = time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the stdio server")
+    parser.add_argument("--runs", type=int, default=5, help="server launches per mode")
+    parser.add_argument("--top", type=int, default=10, help="packages listed in the import time breakdown")
+    parser.add_argument("--target-ms", type=float, help="fail when the fast start answers tools/list later than this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        total, packages = import_times(server_environment(cache_dir, fast_start=False))
+        print(f"Import time of the server: {total * 1000:.0f}ms")
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"   {package:<28} {seconds * 1000:7.1f}ms")
+
+        medians = {}
+        for fast_start in (False, True):
+            env = server_environment(cache_dir, fast_start)
+            if fast_start:
+                time_startup(env)
+            runs = [time_startup(env) for _ in range(args.runs)]
+            mode = "fast start" if fast_start else "normal start"
+            medians[mode] = {step: statistics.median(run[step] for run in runs) for step in STEPS}
+
+    print(f"\nMedian time from spawn to response ({args.runs} runs):")
+    print(f"   {'':<14}" + "".join(f"{step:>14}" for step in STEPS))
+    for mode, timings in medians.items():
+        print(f"   {mode:<14}" + "".join(f"{timings[step] * 1000:12.0f}ms" for step in STEPS))
+
+    if args.target_ms is not None:
+        measured = medians["fast start"]["tools/list"] * 1000
+        if measured > args.target_ms:
+            print(f"\nFast start answers tools/list in {measured:.0f}ms, above the {args.target_ms:g}ms target")
+            sys.exit(1)
+        print(f"\nFast start answers tools/list in {measured:.0f}ms, within the {args.target_ms:g}ms target")
+
+
+if __name__ == "__main__":
+    main()
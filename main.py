@@ -1,4 +1,10 @@
-from mcp_sdk.mcp import MCPServer
-from sefaria_jewish_library import sefaria_jewish_library
+"""
+ASGI entry point for hosting the server over streamable HTTP, e.g.
 
-app = MCPServer(tools=[sefaria_jewish_library])
+    uvicorn main:app --host 0.0.0.0 --port 8000
+
+See sefaria_jewish_library.http_server for the endpoints and settings.
+"""
+from sefaria_jewish_library.http_server import create_app
+
+app = create_app()
@@ -1,9 +1,34 @@
-from . import server
-import asyncio
+import argparse
+import os
 
 def main():
     """Main entry point for the package."""
-    asyncio.run(server.main())
+    parser = argparse.ArgumentParser(prog="sefaria_jewish_library", description="Jewish Library MCP server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=os.environ.get("SEFARIA_TRANSPORT", "stdio"),
+                        help="stdio for a single client, http to serve many clients over streamable HTTP")
+    parser.add_argument("--host", help="HTTP host (default: SEFARIA_HTTP_HOST or 127.0.0.1)")
+    parser.add_argument("--port", type=int, help="HTTP port (default: SEFARIA_HTTP_PORT or 8000)")
+    parser.add_argument("--workers", type=int, help="HTTP worker processes (default: SEFARIA_HTTP_WORKERS or 1)")
+    args = parser.parse_args()
+
+    if args.transport == "http":
+        from . import http_server
+        http_server.run(
+            args.host or http_server.HTTP_HOST,
+            args.port or http_server.HTTP_PORT,
+            args.workers or http_server.HTTP_WORKERS,
+        )
+    else:
+        # The server and the MCP SDK are imported here rather than with the package, as
+        # fast_start answers the first requests while they are imported
+        from . import fast_start
+        fast_start.run()
+
+def __getattr__(name):
+    if name == "server":
+        import importlib
+        return importlib.import_module(f"{__name__}.server")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Optionally expose other important items at package level
 __all__ = ['main', 'server']
@@ -0,0 +1,701 @@
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from . import scheduler
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+CACHE_DIR = os.environ.get(
+    "SEFARIA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "sefaria_jewish_library"),
+)
+CACHE_MAX_ENTRIES = int(os.environ.get("SEFARIA_CACHE_MAX_ENTRIES", "2048"))
+# Memory budget of the in-memory tier, measured as the JSON size of the responses
+CACHE_MEMORY_BUDGET = int(float(os.environ.get("SEFARIA_CACHE_MEMORY_MB", "128")) * 1024 * 1024)
+CACHE_ENABLED = os.environ.get("SEFARIA_CACHE", "1") != "0"
+DISK_CACHE_ENABLED = os.environ.get("SEFARIA_DISK_CACHE", "1") != "0"
+# Persistent store: "files" (one file per entry) or "sqlite" (one database in WAL mode,
+# shared safely by all the server processes of a host)
+CACHE_BACKEND = os.environ.get("SEFARIA_CACHE_BACKEND", "files")
+CACHE_DB = os.environ.get("SEFARIA_CACHE_DB", os.path.join(CACHE_DIR, "cache.db"))
+# Seconds an SQLite cache operation waits for another process's write lock before giving up,
+# the entry then being treated as missing (or not written)
+CACHE_DB_BUSY_TIMEOUT = float(os.environ.get("SEFARIA_CACHE_DB_BUSY_TIMEOUT", "0.2"))
+CACHE_DISK_BUDGET = int(float(os.environ.get("SEFARIA_CACHE_DISK_BUDGET_MB", "256")) * 1024 * 1024)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Time to live per endpoint, in seconds. Texts and links practically never change;
+# calendar entries are keyed by their date so they can live for a while too;
+# search results are the most volatile.
+ENDPOINT_TTLS = {
+    "api/v3/texts/": 7 * DAY,
+    "api/related/": 7 * DAY,
+    "api/calendars": DAY,
+    "api/search-wrapper": 10 * 60,
+}
+DEFAULT_TTL = HOUR
+# How long after expiring an entry is still served while it is revalidated in the background
+STALE_WHILE_REVALIDATE = float(os.environ.get("SEFARIA_STALE_WHILE_REVALIDATE", str(DAY)))
+
+MISSING = object()
+
+
+def ttl_for(endpoint: str) -> int:
+    """
+    Returns the time to live for responses of the given endpoint.
+    """
+    return ENDPOINT_TTLS.get(endpoint, DEFAULT_TTL)
+
+
+def make_key(*parts) -> str:
+    """
+    Builds a stable string key out of the given parts.
+    """
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def entry_size(value) -> int:
+    """
+    Returns the approximate size of a cached value: the length of its JSON serialization.
+    """
+    return len(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def calendar_key(diaspora=True, custom=None, year=None, month=None, day=None, timezone=None) -> str:
+    """
+    Builds the cache key for a calendar day.
+    When no explicit date is given the API answers for today, so today's date is part of the key.
+    """
+    if year is not None and month is not None and day is not None:
+        try:
+            date = datetime.date(int(year), int(month), int(day)).isoformat()
+        except (TypeError, ValueError):
+            date = f"{year}-{month}-{day}"
+    else:
+        date = today(timezone).isoformat()
+    return make_key("api/calendars", diaspora, custom, date, timezone)
+
+
+def today(timezone=None) -> datetime.date:
+    """
+    Returns today's date in the given IANA timezone, or in local time.
+    """
+    if timezone:
+        try:
+            from zoneinfo import ZoneInfo
+            return datetime.datetime.now(ZoneInfo(timezone)).date()
+        except Exception:
+            pass
+    return datetime.date.today()
+
+
+class LRUCache:
+    """
+    In-memory cache of (expires_at, value) entries, bounded by their number and their size.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MEMORY_BUDGET):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str, stale: bool = False):
+        """
+        Returns the value, or MISSING if absent or expired. Expired entries are kept
+        until evicted, and returned with stale=True.
+        """
+        entry = self.get_entry(key)
+        if entry is MISSING or (entry[0] < time.time() and not stale):
+            return MISSING
+        return entry[1]
+
+    def get_entry(self, key: str):
+        """
+        Returns (expires_at, value) even if expired, or MISSING.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value, expires_at: float):
+        self.delete(key)
+        size = entry_size(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires_at, value)
+        self._sizes[key] = size
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            evicted, _entry = self._entries.popitem(last=False)
+            self.bytes -= self._sizes.pop(evicted)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self.bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskStore:
+    """
+    Persistent cache store keeping one JSON file per entry under a directory. The modification
+    time of a file is the expiry of its entry and its access time the last read, so the total size
+    of the entries is kept under a disk budget, like SQLiteStore's, from the file metadata alone.
+    """
+
+    # Access times are only refreshed when older than this
+    TOUCH_INTERVAL = 60
+    # Number of bytes written between two checks of the disk budget, at most
+    BUDGET_CHECK_BYTES = 1024 * 1024
+
+    def __init__(self, directory: str = CACHE_DIR, budget: int = CACHE_DISK_BUDGET):
+        self.directory = directory
+        self.budget = budget
+        self.evictions = 0
+        self._check_bytes = min(self.BUDGET_CHECK_BYTES, budget // 10)
+        # The budget is checked on the first write, which purges what previous runs left over
+        self._written = self._check_bytes
+        self._budget_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".json")
+
+    def get(self, key: str, stale: bool = False):
+        """
+        Returns (expires_at, value), or MISSING if the entry is absent, expired or unreadable.
+        Expired entries not purged yet are returned with stale=True.
+        """
+        path = self._path(key)
+        now = time.time()
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+                accessed_at = os.fstat(f.fileno()).st_atime
+        except (OSError, ValueError):
+            return MISSING
+        if entry.get("key") != key or (entry.get("expires_at", 0) < now and not stale):
+            return MISSING
+        if accessed_at < now - self.TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, entry["expires_at"]))
+            except OSError:
+                pass
+        return entry["expires_at"], entry["value"]
+
+    def set(self, key: str, value, expires_at: float):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+                size = f.tell()
+            os.utime(tmp_path, (time.time(), expires_at))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry to {path}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self._written += size
+        if self._written >= self._check_bytes:
+            self._written = 0
+            self.enforce_budget()
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _files(self) -> list[tuple[str, os.stat_result]]:
+        """
+        Returns the paths and stats of the entries, and of the temporary files of interrupted writes.
+        """
+        files = []
+        recent = time.time() - HOUR
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Temporary files of writes in progress are left alone
+                if not (name.endswith(".tmp") and stat.st_mtime > recent):
+                    files.append((path, stat))
+        return files
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except OSError:
+            return False
+
+    def purge_expired(self) -> int:
+        """
+        Removes expired entries from disk and returns how many were removed.
+        """
+        now = time.time()
+        return sum(self._remove(path) for path, stat in self._files() if stat.st_mtime < now)
+
+    def size(self) -> int:
+        """
+        Returns the total size of the entries in bytes.
+        """
+        return sum(stat.st_size for _path, stat in self._files())
+
+    def enforce_budget(self):
+        """
+        Brings the entries under 90% of the disk budget when they are over it: expired entries
+        (and files left over by interrupted writes) first, then the least recently read ones.
+        """
+        if not self._budget_lock.acquire(blocking=False):
+            # Another thread is already evicting
+            return
+        try:
+            files = self._files()
+            total = sum(stat.st_size for _path, stat in files)
+            if total <= self.budget:
+                return
+            now = time.time()
+            target = self.budget * 0.9
+            # Expired first, then by last access
+            files.sort(key=lambda item: (item[1].st_mtime >= now, item[1].st_atime))
+            for path, stat in files:
+                if total <= target and stat.st_mtime >= now:
+                    break
+                if self._remove(path):
+                    total -= stat.st_size
+                    self.evictions += 1
+        finally:
+            self._budget_lock.release()
+
+
+class SQLiteStore:
+    """
+    Persistent cache store in an SQLite database in WAL mode, which many processes can
+    read and write concurrently. The total size of the entries is kept under a disk
+    budget by dropping expired entries first, then the least recently used ones.
+    """
+
+    # Last access times are only refreshed when older than this, to keep reads read-only
+    TOUCH_INTERVAL = 60
+    # Number of bytes written between two checks of the disk budget, at most
+    BUDGET_CHECK_BYTES = 1024 * 1024
+
+    def __init__(self, path: str = CACHE_DB, budget: int = CACHE_DISK_BUDGET, busy_timeout: float = CACHE_DB_BUSY_TIMEOUT):
+        self.path = path
+        self.budget = budget
+        self.evictions = 0
+        # Operations given up because another process held the database locked
+        self.busy = 0
+        # Each process checks the budget after writing a tenth of it, so with
+        # several processes writing the budget is overshot only moderately
+        self._check_bytes = min(self.BUDGET_CHECK_BYTES, budget // 10)
+        self._written = self._check_bytes
+        # The connection is used from worker threads, one at a time
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+                CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+            """)
+        except sqlite3.Error as e:
+            raise OSError(f"Could not open cache database {path}: {e}") from e
+
+    def get(self, key: str, stale: bool = False):
+        """
+        Returns (expires_at, value), or MISSING if the entry is absent, expired or unreadable.
+        Expired entries not purged yet are returned with stale=True.
+        """
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (row[1] < now and not stale):
+                    return MISSING
+                if row[2] < now - self.TOUCH_INTERVAL:
+                    self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[1], json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            self._failed("read cache entry from", e)
+            return MISSING
+
+    def set(self, key: str, value, expires_at: float):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(key) + len(data.encode("utf-8"))
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                    (key, data, expires_at, time.time(), size),
+                )
+        except sqlite3.Error as e:
+            self._failed("write cache entry to", e)
+            return
+        self._written += size
+        if self._written >= self._check_bytes:
+            self._written = 0
+            self.enforce_budget()
+
+    def delete(self, key: str):
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except sqlite3.Error:
+            pass
+
+    def size(self) -> int:
+        """
+        Returns the total size of the entries in bytes.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def purge_expired(self) -> int:
+        """
+        Removes expired entries and returns how many were removed.
+        """
+        try:
+            with self._lock:
+                return self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),)).rowcount
+        except sqlite3.Error:
+            return 0
+
+    def enforce_budget(self):
+        """
+        Brings the entries under 90% of the disk budget when they are over it.
+        """
+        try:
+            with self._lock:
+                if self.size() <= self.budget:
+                    return
+                self.evictions += self.purge_expired()
+                target = self.budget * 0.9
+                while (total := self.size()) > target:
+                    # Drop the least recently used entries, a batch at a time
+                    removed = self._conn.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                        (max(1, int(self.count() * (total - target) / total) + 1),),
+                    ).rowcount
+                    self.evictions += removed
+                    if not removed:
+                        break
+                self._conn.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error as e:
+            self._failed("evict cache entries from", e)
+
+    def _failed(self, action: str, error: Exception):
+        """
+        Logs a failed operation; a database locked by another process is expected under
+        contention, and only counted, the operation being treated as a cache miss.
+        """
+        if isinstance(error, sqlite3.OperationalError) and ("locked" in str(error) or "busy" in str(error)):
+            self.busy += 1
+            logger.debug(f"Could not {action} {self.path}: {error}")
+        else:
+            logger.warning(f"Could not {action} {self.path}: {error}")
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional persistent store.
+    """
+
+    def __init__(self, memory: LRUCache, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+        self.not_modified = 0
+        self._revalidating: dict[str, asyncio.Task] = {}
+
+    def get(self, key: str, memory: bool = True):
+        """
+        Returns the value for key, or MISSING. With memory=False, a value read from disk is not
+        kept in memory, for values cached in memory in another form (see texts.SegmentCache).
+        """
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self.memory_hits += 1
+            return value
+        return self._disk_hit(key, self.disk.get(key) if self.disk is not None else MISSING, memory)
+
+    async def get_async(self, key: str, memory: bool = True):
+        """
+        Like get, reading the disk in a worker thread so the event loop is not blocked.
+        """
+        value = self.memory.get(key)
+        if value is not MISSING:
+            self.memory_hits += 1
+            return value
+        entry = await asyncio.to_thread(self.disk.get, key) if self.disk is not None else MISSING
+        return self._disk_hit(key, entry, memory)
+
+    def _disk_hit(self, key: str, entry, memory: bool):
+        if entry is MISSING:
+            self.misses += 1
+            return MISSING
+        expires_at, value = entry
+        self.disk_hits += 1
+        if memory:
+            self.memory.set(key, value, expires_at)
+        return value
+
+    def set(self, key: str, value, ttl: float, memory: bool = True):
+        expires_at = time.time() + ttl
+        if memory:
+            self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            self.disk.set(key, value, expires_at)
+
+    async def set_async(self, key: str, value, ttl: float, memory: bool = True):
+        """
+        Like set, writing the disk in a worker thread so the event loop is not blocked.
+        """
+        expires_at = time.time() + ttl
+        if memory:
+            self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, value, expires_at)
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def get_expired(self, key: str):
+        """
+        Returns (expires_at, value) for key even if it has expired, or MISSING.
+        """
+        entry = self.memory.get_entry(key)
+        if entry is MISSING and self.disk is not None:
+            entry = self.disk.get(key, stale=True)
+        return entry
+
+    async def get_expired_async(self, key: str):
+        """
+        Like get_expired, reading the disk in a worker thread.
+        """
+        entry = self.memory.get_entry(key)
+        if entry is MISSING and self.disk is not None:
+            entry = await asyncio.to_thread(self.disk.get, key, True)
+        return entry
+
+    def get_stale(self, key: str):
+        """
+        Returns the value for key even if it has expired, or MISSING.
+        """
+        entry = self.get_expired(key)
+        return entry if entry is MISSING else entry[1]
+
+    async def get_stale_async(self, key: str):
+        """
+        Like get_stale, reading the disk in a worker thread.
+        """
+        entry = await self.get_expired_async(key)
+        return entry if entry is MISSING else entry[1]
+
+    async def _revalidate(self, revalidate, stale):
+        self.revalidations += 1
+        value = await revalidate(stale)
+        if value is stale:
+            # Not modified: only the expiry gets refreshed when the value is set again
+            self.not_modified += 1
+        return value
+
+    def _revalidate_in_background(self, key: str, ttl: float, revalidate, stale, memory: bool = True):
+        if key in self._revalidating:
+            return
+
+        async def run():
+            try:
+                with scheduler.lane(scheduler.BACKGROUND):
+                    value = await self._revalidate(revalidate, stale)
+                if value is not None:
+                    await self.set_async(key, value, ttl, memory)
+            except Exception as e:
+                logger.debug(f"Background revalidation of {key} failed: {e}")
+            finally:
+                del self._revalidating[key]
+
+        # Run outside the caller's context, so the refresh is not bound by the caller's deadline
+        self._revalidating[key] = asyncio.create_task(run(), context=contextvars.Context())
+
+    async def get_or_fetch(self, key: str, ttl: float, fetch, revalidate=None, memory: bool = True):
+        """
+        Returns the cached value for key, or awaits fetch() and caches its result.
+        None results are treated as failures and are not cached; when the fetch fails
+        (e.g. while the circuit to Sefaria is open), an expired entry is served instead.
+
+        With revalidate, expired entries are refreshed with revalidate(value) instead of fetch(),
+        which returns the same value when it has not changed (e.g. on a 304 response), or the new one.
+        Entries expired for less than STALE_WHILE_REVALIDATE are returned at once and revalidated
+        in the background.
+        With memory=False, the value is only cached on disk.
+        """
+        value = await self.get_async(key, memory)
+        if value is not MISSING:
+            return value
+        if revalidate is not None:
+            entry = await self.get_expired_async(key)
+            if entry is not MISSING:
+                expires_at, stale = entry
+                if time.time() - expires_at < STALE_WHILE_REVALIDATE:
+                    self.stale_hits += 1
+                    self._revalidate_in_background(key, ttl, revalidate, stale, memory)
+                    return stale
+                fetch = lambda: self._revalidate(revalidate, stale)
+        try:
+            value = await fetch()
+        except Exception:
+            stale = await self.get_stale_async(key)
+            if stale is MISSING:
+                raise
+            logger.info(f"Serving stale cache entry for {key}")
+            self.stale_hits += 1
+            return stale
+        if value is not None:
+            await self.set_async(key, value, ttl, memory)
+            return value
+        stale = await self.get_stale_async(key)
+        if stale is MISSING:
+            return None
+        logger.info(f"Serving stale cache entry for {key}")
+        self.stale_hits += 1
+        return stale
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "revalidations": self.revalidations,
+            "not_modified": self.not_modified,
+            "hit_ratio": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.memory.evictions,
+            "memory_entries": len(self.memory),
+            "memory_max_entries": self.memory.max_entries,
+            "memory_bytes": self.memory.bytes,
+            "memory_max_bytes": self.memory.max_bytes,
+            "disk_evictions": getattr(self.disk, "evictions", 0),
+            "disk_busy": getattr(self.disk, "busy", 0),
+        }
+
+
+class NullCache(TieredCache):
+    """
+    Cache that stores nothing, used when caching is disabled.
+    """
+
+    def __init__(self):
+        super().__init__(LRUCache(max_entries=0))
+
+    def get(self, key: str, memory: bool = True):
+        self.misses += 1
+        return MISSING
+
+    async def get_async(self, key: str, memory: bool = True):
+        return self.get(key, memory)
+
+    def set(self, key: str, value, ttl: float, memory: bool = True):
+        pass
+
+    async def set_async(self, key: str, value, ttl: float, memory: bool = True):
+        pass
+
+    def get_expired(self, key: str):
+        return MISSING
+
+    async def get_expired_async(self, key: str):
+        return MISSING
+
+
+_cache: TieredCache | None = None
+
+
+def get_cache() -> TieredCache:
+    """
+    Returns the process-wide response cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        if not CACHE_ENABLED:
+            _cache = NullCache()
+        else:
+            disk = None
+            if DISK_CACHE_ENABLED:
+                try:
+                    if CACHE_BACKEND == "sqlite":
+                        disk = SQLiteStore(CACHE_DB, CACHE_DISK_BUDGET, CACHE_DB_BUSY_TIMEOUT)
+                    else:
+                        disk = DiskStore(CACHE_DIR, CACHE_DISK_BUDGET)
+                except OSError as e:
+                    logger.warning(f"Disk cache disabled, could not use {CACHE_DB if CACHE_BACKEND == 'sqlite' else CACHE_DIR}: {e}")
+            _cache = TieredCache(LRUCache(CACHE_MAX_ENTRIES, CACHE_MEMORY_BUDGET), disk)
+    return _cache
+
+
+def stats() -> dict:
+    """
+    Returns hit/miss/eviction counters of the process-wide cache.
+    """
+    return get_cache().stats()
@@ -0,0 +1,524 @@
+"""
+Local corpus backend: an SQLite store of texts and links, bulk-imported from
+Sefaria's public JSON export (https://github.com/Sefaria/Sefaria-Export).
+
+Import an export checkout with:
+
+    python -m sefaria_jewish_library.corpus import path/to/Sefaria-Export
+
+and run the server with SEFARIA_BACKEND=local to serve get_text and
+get_commentaries from it.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+from urllib.parse import parse_qs
+
+from .refs import format_he_section, format_section, parse_section
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+DATA_DIR = os.environ.get(
+    "SEFARIA_DATA_DIR",
+    os.path.join(os.path.expanduser("~"), ".local", "share", "sefaria_jewish_library"),
+)
+CORPUS_DB = os.environ.get("SEFARIA_CORPUS_DB", os.path.join(DATA_DIR, "corpus.db"))
+
+# "remote": always ask sefaria.org (default)
+# "local": read from the local corpus, fall back to sefaria.org for refs it does not have
+# "offline": read from the local corpus only
+BACKEND = os.environ.get("SEFARIA_BACKEND", "remote").lower()
+
+LANGUAGES = {"he": "hebrew", "en": "english"}
+
+# The Sefaria endpoints the local corpus can answer
+ENDPOINTS = ("api/v3/texts/", "api/related/")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    index_title TEXT NOT NULL,
+    he_title TEXT,
+    categories TEXT,
+    section_names TEXT
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    version_title TEXT,
+    UNIQUE (book_id, lang)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    version_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    ref TEXT NOT NULL,
+    address TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (version_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_ref ON segments (version_id, ref);
+CREATE TABLE IF NOT EXISTS links (
+    ref1 TEXT NOT NULL,
+    ref2 TEXT NOT NULL,
+    type TEXT,
+    category1 TEXT,
+    category2 TEXT
+);
+CREATE INDEX IF NOT EXISTS links_ref1 ON links (ref1);
+CREATE INDEX IF NOT EXISTS links_ref2 ON links (ref2);
+"""
+
+_ADDRESS_RE = re.compile(r"^(?P<title>.+?)\s+(?P<address>\d+[ab]?(?:[:.]\d+[ab]?)*(?:-\d+[ab]?(?:[:.]\d+[ab]?)*)?)$")
+
+
+def _flatten(text, address=()):
+    """
+    Yields (address, segment) pairs of a jagged nested text array, skipping empty segments.
+    """
+    if isinstance(text, list):
+        for i, item in enumerate(text):
+            yield from _flatten(item, address + (i,))
+    elif isinstance(text, str) and text:
+        yield address, text
+
+
+def _nest(rows, level: int):
+    """
+    Rebuilds a nested list out of (address, text) rows, grouping by address from the given level.
+    """
+    rows = list(rows)
+    if len(rows) == 1 and len(rows[0][0]) == level:
+        return rows[0][1]
+    return [
+        _nest(group, level + 1) if len(group[0][0]) > level + 1 else group[0][1]
+        for group in (list(g) for _k, g in itertools.groupby(rows, key=lambda row: row[0][level]))
+    ]
+
+
+class CorpusStore:
+    """
+    Read access to an imported corpus database.
+    The store is shared by the event loop and worker threads (searches, parallels),
+    so every thread reads through its own connection.
+    """
+
+    def __init__(self, path: str = CORPUS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._books = {
+            row["title"]: row
+            for row in self.conn.execute("SELECT * FROM books")
+        }
+        # Longest titles first, so "Rashi on Genesis" wins over "Genesis"
+        self._titles = sorted(self._books, key=len, reverse=True)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The read-only connection of the calling thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False only so close() can close the connections of every thread
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def find_book(self, ref: str):
+        """
+        Splits a ref into its book row and address string, or returns (None, None).
+        """
+        ref = ref.strip()
+        if ref in self._books:
+            return self._books[ref], ""
+        match = _ADDRESS_RE.match(ref)
+        if match and match.group("title") in self._books:
+            return self._books[match.group("title")], match.group("address")
+        for title in self._titles:
+            if ref.startswith(title + " "):
+                return self._books[title], ref[len(title) + 1:]
+        return None, None
+
+    def _parse_address(self, book, address: str):
+        """
+        Returns (start, end) lists of 0-based indices, or None if the address is malformed.
+        """
+        section_names = json.loads(book["section_names"] or "[]")
+        if not address:
+            return [], []
+        start_text, _, end_text = address.partition("-")
+        try:
+            start_parts = re.split(r"[:.]", start_text)
+            start = [parse_section(p, section_names[i] if i < len(section_names) else "") for i, p in enumerate(start_parts)]
+            if not end_text:
+                return start, start
+            end_parts = re.split(r"[:.]", end_text)
+            offset = len(start_parts) - len(end_parts)
+            if offset < 0:
+                return None
+            end = start[:offset] + [
+                parse_section(p, section_names[offset + i] if offset + i < len(section_names) else "")
+                for i, p in enumerate(end_parts)
+            ]
+        except (ValueError, IndexError):
+            return None
+        return start, end
+
+    def format_ref(self, book, address) -> str:
+        section_names = json.loads(book["section_names"] or "[]")
+        parts = [format_section(i, section_names[n] if n < len(section_names) else "") for n, i in enumerate(address)]
+        return f"{book['title']} {':'.join(parts)}" if parts else book["title"]
+
+    def format_he_ref(self, book, address) -> str:
+        section_names = json.loads(book["section_names"] or "[]")
+        parts = [format_he_section(i, section_names[n] if n < len(section_names) else "") for n, i in enumerate(address)]
+        title = book["he_title"] or book["title"]
+        return f"{title} {':'.join(parts)}" if parts else title
+
+    def he_ref(self, ref: str) -> str:
+        """
+        Returns the Hebrew form of a ref, or the ref itself if it is not in the corpus.
+        """
+        book, address = self.find_book(ref)
+        if book is None:
+            return ref
+        parsed = self._parse_address(book, address)
+        if parsed is None:
+            return ref
+        return self.format_he_ref(book, parsed[0])
+
+    def _version_id(self, book, lang: str):
+        row = self.conn.execute(
+            "SELECT id, version_title FROM versions WHERE book_id = ? AND lang = ?", (book["id"], lang)
+        ).fetchone()
+        return row
+
+    def _seq_bounds(self, version_id: int, ref: str):
+        return self.conn.execute(
+            "SELECT MIN(seq), MAX(seq) FROM segments WHERE version_id = ? AND (ref = ? OR (ref > ? AND ref < ?))",
+            (version_id, ref, ref + ":", ref + ";"),
+        ).fetchone()
+
+    def get_text(self, ref: str, lang: str = "he"):
+        """
+        Returns an api/v3/texts shaped response for the ref, or None if the corpus does not have it.
+        """
+        book, address = self.find_book(ref)
+        if book is None:
+            return None
+        parsed = self._parse_address(book, address)
+        if parsed is None:
+            return None
+        start, end = parsed
+        version = self._version_id(book, lang)
+        if version is None:
+            return None
+        version_id = version["id"]
+
+        if start:
+            first = self._seq_bounds(version_id, self.format_ref(book, start))[0]
+            last = self._seq_bounds(version_id, self.format_ref(book, end))[1]
+        else:
+            first, last = self.conn.execute(
+                "SELECT MIN(seq), MAX(seq) FROM segments WHERE version_id = ?", (version_id,)
+            ).fetchone()
+        if first is None or last is None or last < first:
+            return None
+
+        rows = [
+            (tuple(json.loads(row["address"])), row["text"])
+            for row in self.conn.execute(
+                "SELECT address, text FROM segments WHERE version_id = ? AND seq BETWEEN ? AND ? ORDER BY seq",
+                (version_id, first, last),
+            )
+        ]
+        level = len(start) if start == end else len(list(itertools.takewhile(lambda p: p[0] == p[1], zip(start, end))))
+        return {
+            "ref": ref,
+            "heRef": self.format_he_ref(book, start),
+            "title": book["index_title"],
+            "book": book["title"],
+            "categories": json.loads(book["categories"] or "[]"),
+            "versions": [{
+                "versionTitle": version["version_title"],
+                "language": lang,
+                "languageFamilyName": LANGUAGES.get(lang, lang),
+                "text": _nest(rows, level),
+            }],
+            "source": "local",
+        }
+
+    def get_links(self, ref: str):
+        """
+        Returns an api/related shaped response with the links of the ref, or None if the corpus does not have it.
+        """
+        book, address = self.find_book(ref)
+        if book is None:
+            return None
+        parsed = self._parse_address(book, address)
+        if parsed is None:
+            return None
+        anchor = self.format_ref(book, parsed[0])
+        links = []
+        for ref_column, other_column, category_column in (("ref1", "ref2", "category2"), ("ref2", "ref1", "category1")):
+            rows = self.conn.execute(
+                f"SELECT {ref_column} AS anchor, {other_column} AS other, type, {category_column} AS category "
+                f"FROM links WHERE {ref_column} = ? OR ({ref_column} > ? AND {ref_column} < ?)",
+                (anchor, anchor + ":", anchor + ";"),
+            )
+            for row in rows:
+                links.append({
+                    "anchorRef": row["anchor"],
+                    "sourceRef": row["other"],
+                    "sourceHeRef": self.he_ref(row["other"]),
+                    "type": row["type"],
+                    "category": row["category"],
+                })
+        return {"links": links, "source": "local"}
+
+
+_store: CorpusStore | None = None
+_store_lock = threading.Lock()
+_missing = False
+
+
+def enabled() -> bool:
+    """
+    Returns whether requests should try the local corpus: the local backend is on
+    and the corpus was not found missing.
+    """
+    return BACKEND in ("local", "offline") and not _missing
+
+
+def get_store() -> CorpusStore | None:
+    """
+    Returns the local corpus store, or None when the local backend is off or no corpus was imported.
+    A missing corpus is reported once.
+    """
+    global _store, _missing
+    if _store is None and enabled():
+        # The first lookups can come from several threads at once
+        with _store_lock:
+            if _store is None and not _missing:
+                if not os.path.exists(CORPUS_DB):
+                    logger.warning(f"Local backend selected but no corpus found at {CORPUS_DB}")
+                    _missing = True
+                    return None
+                _store = CorpusStore(CORPUS_DB)
+    return _store
+
+
+def lookup(endpoint: str, ref: str, param: str = None):
+    """
+    Answers an api/v3/texts/ or api/related/ request from the local corpus, or returns None.
+    It reads the database, so the server calls it in a thread.
+    """
+    store = get_store()
+    if store is None or not ref:
+        return None
+    if endpoint == "api/v3/texts/":
+        # One response can hold several versions (version=hebrew&version=english)
+        data = None
+        for version in parse_qs(param or "").get("version", ["primary"]):
+            language, _, title = version.partition("|")
+            text = store.get_text(ref, "en" if language in ("english", "en") else "he")
+            if text is None or (title and text["versions"][0]["versionTitle"] != title):
+                return None
+            if data is None:
+                data = text
+            else:
+                data["versions"].extend(text["versions"])
+        return data
+    if endpoint == "api/related/":
+        return store.get_links(ref)
+    return None
+
+
+# Import
+
+
+def _iter_nodes(title: str, text):
+    """
+    Yields (node title, jagged array) pairs, walking the named nodes of complex texts.
+    """
+    if isinstance(text, dict):
+        for key, value in text.items():
+            yield from _iter_nodes(f"{title}, {key}" if key else title, value)
+    else:
+        yield title, text
+
+
+def _load_schema(export_dir: str, title: str) -> dict:
+    path = os.path.join(export_dir, "schemas", title.replace(" ", "_") + ".json")
+    if not os.path.exists(path):
+        path = os.path.join(export_dir, "schemas", title + ".json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _pick_version_files(export_dir: str):
+    """
+    Yields one version file per (book directory, language), preferring merged.json.
+    """
+    json_dir = os.path.join(export_dir, "json")
+    for root, _dirs, files in os.walk(json_dir):
+        language = os.path.basename(root)
+        if language not in ("Hebrew", "English"):
+            continue
+        versions = sorted(f for f in files if f.endswith(".json"))
+        if not versions:
+            continue
+        chosen = "merged.json" if "merged.json" in versions else versions[0]
+        yield os.path.join(root, chosen)
+
+
+def _create(conn: sqlite3.Connection):
+    conn.executescript(SCHEMA)
+
+
+def import_texts(conn: sqlite3.Connection, export_dir: str) -> int:
+    """
+    Imports the text versions of an export. Books already in the store are replaced.
+    Returns the number of imported segments.
+    """
+    count = 0
+    for path in _pick_version_files(export_dir):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping {path}: {e}")
+            continue
+        index_title = data.get("title")
+        if not index_title or "text" not in data:
+            continue
+        lang = "en" if data.get("language") == "en" else "he"
+        schema = _load_schema(export_dir, index_title)
+        he_title = data.get("heTitle") or schema.get("heTitle")
+        categories = json.dumps(data.get("categories") or schema.get("categories") or [], ensure_ascii=False)
+        section_names = data.get("sectionNames") or schema.get("sectionNames") or []
+
+        for node_title, text in _iter_nodes(index_title, data["text"]):
+            conn.execute(
+                "INSERT INTO books (title, index_title, he_title, categories, section_names) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (title) DO UPDATE SET he_title = COALESCE(excluded.he_title, he_title), "
+                "categories = excluded.categories, section_names = excluded.section_names",
+                (node_title, index_title, he_title, categories, json.dumps(section_names)),
+            )
+            book_id = conn.execute("SELECT id FROM books WHERE title = ?", (node_title,)).fetchone()[0]
+            old = conn.execute("SELECT id FROM versions WHERE book_id = ? AND lang = ?", (book_id, lang)).fetchone()
+            if old:
+                conn.execute("DELETE FROM segments WHERE version_id = ?", (old[0],))
+                conn.execute("DELETE FROM versions WHERE id = ?", (old[0],))
+            version_id = conn.execute(
+                "INSERT INTO versions (book_id, lang, version_title) VALUES (?, ?, ?)",
+                (book_id, lang, data.get("versionTitle")),
+            ).lastrowid
+
+            def rows():
+                for seq, (address, segment) in enumerate(_flatten(text)):
+                    parts = [
+                        format_section(i, section_names[n] if n < len(section_names) else "")
+                        for n, i in enumerate(address)
+                    ]
+                    yield version_id, seq, f"{node_title} {':'.join(parts)}", json.dumps(address), segment
+
+            before = conn.total_changes
+            conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?)", rows())
+            count += conn.total_changes - before
+    return count
+
+
+def import_links(conn: sqlite3.Connection, export_dir: str) -> int:
+    """
+    Imports the links CSV files of an export, replacing previously imported links.
+    Returns the number of imported links.
+    """
+    if not os.path.isdir(os.path.join(export_dir, "links")):
+        return 0
+    conn.execute("DELETE FROM links")
+    before = conn.total_changes
+    conn.executemany("INSERT INTO links VALUES (?, ?, ?, ?, ?)", iter_export_links(export_dir))
+    return conn.total_changes - before
+
+
+def iter_export_links(export_dir: str):
+    """
+    Yields (ref1, ref2, type, category1, category2) for the links CSV files of an export.
+    Ranged citations are anchored at their start.
+    """
+    links_dir = os.path.join(export_dir, "links")
+    for name in sorted(os.listdir(links_dir)):
+        if not name.endswith(".csv"):
+            continue
+        with open(os.path.join(links_dir, name), encoding="utf-8", newline="") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # header
+            for row in reader:
+                if len(row) >= 7:
+                    yield row[0].split("-")[0], row[1].split("-")[0], row[2], row[5], row[6]
+
+
+def import_export(export_dir: str, db_path: str = CORPUS_DB, texts: bool = True, links: bool = True) -> dict:
+    """
+    Bulk-imports a Sefaria export directory into the corpus database.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        _create(conn)
+        result = {}
+        with conn:
+            if texts:
+                result["segments"] = import_texts(conn, export_dir)
+            if links:
+                result["links"] = import_links(conn, export_dir)
+        conn.execute("ANALYZE")
+        return result
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sefaria_jewish_library.corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="import a Sefaria-Export checkout")
+    import_parser.add_argument("export_dir")
+    import_parser.add_argument("--db", default=CORPUS_DB)
+    import_parser.add_argument("--no-texts", action="store_true")
+    import_parser.add_argument("--no-links", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        result = import_export(args.export_dir, args.db, texts=not args.no_texts, links=not args.no_links)
+        print(f"Imported {result} into {args.db}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Fast start of the stdio server.
+
+Every MCP client launch spawns a new server process, and importing the MCP SDK takes most of its
+startup time. With SEFARIA_FAST_START=1, the process answers the initialize and tools/list requests
+from the responses saved by a previous run, while the server is imported in a background thread.
+The server then takes over stdin and stdout: the requests read so far are replayed to it, and its
+responses to the requests already answered are dropped. The first run, and the first run after the
+package, the MCP SDK or the SEFARIA_* configuration changed, starts normally and saves the responses.
+
+Only the standard library is imported until the server takes over.
+"""
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+FAST_START = os.environ.get("SEFARIA_FAST_START", "0") == "1"
+# Same directory as the response cache, without importing it
+STARTUP_DIR = os.environ.get(
+    "SEFARIA_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "sefaria_jewish_library"),
+)
+
+
+def responses_path() -> str:
+    """
+    Returns the path of the saved startup responses, named after what they depend on:
+    the package sources, the installed MCP SDK and the SEFARIA_* variables.
+    """
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    sources = [os.path.join(package_dir, name) for name in sorted(os.listdir(package_dir)) if name.endswith(".py")]
+    spec = importlib.util.find_spec("mcp")
+    if spec is not None and spec.origin:
+        sources.append(spec.origin)
+    for path in sources:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}\n".encode())
+    for name, value in sorted(os.environ.items()):
+        if name.startswith("SEFARIA_"):
+            digest.update(f"{name}={value}\n".encode())
+    return os.path.join(STARTUP_DIR, f"startup-{digest.hexdigest()[:16]}.json")
+
+
+def load() -> dict | None:
+    try:
+        with open(responses_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(responses: dict):
+    """
+    Saves the startup responses for the next fast starts, unless they already are.
+    """
+    path = responses_path()
+    if os.path.exists(path):
+        return
+    try:
+        os.makedirs(STARTUP_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(responses, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not save the startup responses to {path}: {e}")
+
+
+def _respond(request_id, result: dict):
+    sys.stdout.buffer.write(json.dumps({"jsonrpc": "2.0", "id": request_id, "result": result}).encode() + b"\n")
+    sys.stdout.buffer.flush()
+
+
+def answer_startup_requests(responses: dict, importer: threading.Thread) -> tuple[list[bytes], set] | None:
+    """
+    Answers the initialize and tools/list requests from stdin until another request comes,
+    or the server is imported.
+
+    Returns:
+        tuple: the lines to replay to the server and the ids of the requests already answered,
+        or None when stdin was closed
+    """
+    replay = []
+    answered = set()
+    while True:
+        line = sys.stdin.buffer.readline()
+        if not line:
+            return None
+        try:
+            message = json.loads(line)
+        except ValueError:
+            message = None
+        method = message.get("method") if isinstance(message, dict) else None
+        params = (message.get("params") or {}) if method else {}
+        if method == "initialize" and "id" in message:
+            result = dict(responses["initialize"])
+            if params.get("protocolVersion") in responses["protocol_versions"]:
+                result["protocolVersion"] = params["protocolVersion"]
+            _respond(message["id"], result)
+            answered.add(message["id"])
+            # The server still needs the initialize request, for the client's capabilities
+            replay.append(line)
+        elif method == "tools/list" and "id" in message and not params.get("cursor"):
+            _respond(message["id"], responses["tools/list"])
+        elif method == "notifications/initialized":
+            replay.append(line)
+        else:
+            replay.append(line)
+            return replay, answered
+        if not importer.is_alive():
+            return replay, answered
+
+
+async def replayed_input(lines: list[bytes]):
+    """
+    Yields the lines already read from stdin, then the following ones.
+    """
+    import anyio
+    from io import TextIOWrapper
+
+    for line in lines:
+        yield line.decode("utf-8", errors="replace")
+    async for line in anyio.wrap_file(TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")):
+        yield line
+
+
+class FilteredOutput:
+    """
+    Stdout of the server, without its responses to the requests answered before it started.
+    """
+
+    def __init__(self, answered: set):
+        import anyio
+        from io import TextIOWrapper
+
+        self.answered = set(answered)
+        self.stdout = anyio.wrap_file(TextIOWrapper(sys.stdout.buffer, encoding="utf-8"))
+
+    async def write(self, text: str):
+        if self.answered:
+            message = json.loads(text)
+            if "method" not in message and message.get("id") in self.answered:
+                self.answered.discard(message["id"])
+                return
+        await self.stdout.write(text)
+
+    async def flush(self):
+        await self.stdout.flush()
+
+
+def run():
+    """
+    Runs the stdio server, answering its first requests while it is imported when fast starts are
+    enabled and the startup responses were saved.
+    """
+    responses = load() if FAST_START else None
+    stdin = stdout = None
+    if responses is not None:
+        importer = threading.Thread(target=importlib.import_module, args=(f"{__package__}.server",), daemon=True)
+        importer.start()
+        startup = answer_startup_requests(responses, importer)
+        if startup is None:
+            return
+        replay, answered = startup
+        importer.join()
+        stdin, stdout = replayed_input(replay), FilteredOutput(answered)
+
+    import asyncio
+    from . import server
+
+    asyncio.run(server.main(stdin, stdout))
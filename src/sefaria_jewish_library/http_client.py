@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import metrics, resilience, scheduler
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+# Pool sizing for the shared client. Every handler goes through the same
+# client, so these bound the total number of sockets opened to Sefaria.
+MAX_CONNECTIONS = int(os.environ.get("SEFARIA_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("SEFARIA_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.environ.get("SEFARIA_KEEPALIVE_EXPIRY", "30"))
+PER_HOST_CONCURRENCY = int(os.environ.get("SEFARIA_PER_HOST_CONCURRENCY", "8"))
+HTTP_TIMEOUT = float(os.environ.get("SEFARIA_HTTP_TIMEOUT", "30"))
+
+USER_AGENT = "sefaria_jewish_library/0.1.0"
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+
+def http2_available() -> bool:
+    """
+    Returns True when the optional h2 package is installed, so the client can negotiate HTTP/2.
+    """
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the shared keep-alive client, creating it on first use.
+
+    The client is bound to the running event loop; if the loop changed (e.g. a second
+    asyncio.run in the same process) a fresh client and fresh host limits are created.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            http2=http2_available(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+        )
+        _client_loop = loop
+        _host_limits.clear()
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    limit = _host_limits.get(host)
+    if limit is None:
+        limit = _host_limits[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+    return limit
+
+
+def endpoint_name(url: str) -> str:
+    """
+    Returns the API endpoint of a url without the ref, e.g. "api/v3/texts" for
+    https://www.sefaria.org/api/v3/texts/Genesis 1:1, used to label upstream metrics.
+    """
+    parts = urlsplit(url).path.strip("/").split("/")
+    return "/".join(parts[:3] if parts[:2] == ["api", "v3"] else parts[:2])
+
+
+def _hedge_delay(endpoint: str) -> float | None:
+    """
+    Returns how long to wait before hedging a request to the endpoint: its p95 latency
+    once enough requests were measured, or None when hedging is disabled.
+    """
+    if not resilience.HEDGE_ENABLED:
+        return None
+    histogram = metrics.get_metrics().latencies.get(("upstream", endpoint))
+    if histogram is None or histogram.count < resilience.HEDGE_MIN_SAMPLES:
+        return resilience.HEDGE_DELAY
+    return histogram.quantile(0.95)
+
+
+async def request(method: str, url: str, idempotent: bool | None = None, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the shared client, honoring the rate limit of its endpoint
+    (see scheduler) and the per-host concurrency limit.
+
+    The timeout is shortened to the deadline of the current tool call. Idempotent requests
+    (GET by default) are retried on transport errors and 5xx statuses, and hedged when enabled;
+    see resilience.
+    Raises httpx.HTTPStatusError for bad status codes, and httpx.HTTPError subclasses otherwise.
+    """
+    client = get_client()
+    endpoint = endpoint_name(url)
+    if idempotent is None:
+        idempotent = method in ("GET", "HEAD")
+
+    async def send() -> httpx.Response:
+        await scheduler.acquire(endpoint)
+        async with _host_limit(url):
+            timeout = resilience.request_timeout(HTTP_TIMEOUT)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, timeout=timeout, **kwargs)
+            except httpx.HTTPError:
+                metrics.observe("upstream", endpoint, time.perf_counter() - start, error=True)
+                raise
+            metrics.observe("upstream", endpoint, time.perf_counter() - start, error=response.is_error)
+        scheduler.observe(endpoint, response)
+        if response.status_code != 304:  # Not Modified answers a conditional request
+            response.raise_for_status()
+        return response
+
+    return await resilience.call(endpoint, send, idempotent, _hedge_delay(endpoint))
+
+
+async def aclose():
+    """
+    Closes the shared client and its pooled connections.
+    """
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+    _host_limits.clear()
@@ -0,0 +1,110 @@
+"""
+Streamable HTTP transport: serves the tools of server.py to many concurrent MCP
+sessions from one long-lived process, so every session shares the response cache,
+the request coalescing and the pooled connections to Sefaria.
+
+    sefaria_jewish_library --transport http --port 8000 --workers 4
+
+The MCP endpoint is /mcp. /metrics exposes the get_diagnostics metrics in the
+Prometheus format and /healthz answers "ok".
+
+With more than one worker process, each worker has its own in-memory cache and
+connection pool (the disk cache is shared), and the sessions are stateless, since
+a load balancer may route the requests of a session to any worker.
+"""
+import contextlib
+import logging
+import os
+
+from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from . import http_client, metrics, warmup
+from .logging_config import configure_logging
+from .server import server
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+HTTP_HOST = os.environ.get("SEFARIA_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("SEFARIA_HTTP_PORT", "8000"))
+HTTP_WORKERS = int(os.environ.get("SEFARIA_HTTP_WORKERS", "1"))
+# Stateless sessions need no sticky routing; forced on with several workers
+HTTP_STATELESS = os.environ.get("SEFARIA_HTTP_STATELESS", "0") == "1"
+# Answer with plain JSON instead of SSE streams
+HTTP_JSON_RESPONSE = os.environ.get("SEFARIA_HTTP_JSON_RESPONSE", "0") == "1"
+
+
+class _MCPEndpoint:
+    """
+    ASGI endpoint handing the requests to the session manager.
+    """
+
+    def __init__(self, session_manager: StreamableHTTPSessionManager):
+        self.session_manager = session_manager
+
+    async def __call__(self, scope, receive, send):
+        await self.session_manager.handle_request(scope, receive, send)
+
+
+async def handle_metrics(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def handle_health(request):
+    return PlainTextResponse("ok")
+
+
+def create_app(stateless: bool | None = None, json_response: bool | None = None) -> Starlette:
+    """
+    Returns the ASGI app serving the MCP server over streamable HTTP.
+
+    Args:
+        stateless: Whether sessions are stateless, by default SEFARIA_HTTP_STATELESS,
+            or True when running several workers
+        json_response: Whether to answer with JSON instead of SSE streams,
+            by default SEFARIA_HTTP_JSON_RESPONSE
+    """
+    configure_logging()
+    if stateless is None:
+        stateless = HTTP_STATELESS or HTTP_WORKERS > 1
+    if json_response is None:
+        json_response = HTTP_JSON_RESPONSE
+    session_manager = StreamableHTTPSessionManager(server, json_response=json_response, stateless=stateless)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        logger.info(f"Starting Jewish Library MCP server on streamable HTTP (pid {os.getpid()}, stateless={stateless})...")
+        warmup_task = warmup.start()
+        try:
+            async with session_manager.run():
+                yield
+        finally:
+            if warmup_task is not None:
+                warmup_task.cancel()
+            logger.info(f"Metrics:\n{metrics.render_text()}")
+            await http_client.aclose()
+
+    return Starlette(
+        routes=[
+            Route("/mcp", endpoint=_MCPEndpoint(session_manager)),
+            Route("/metrics", endpoint=handle_metrics),
+            Route("/healthz", endpoint=handle_health),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def run(host: str = HTTP_HOST, port: int = HTTP_PORT, workers: int = HTTP_WORKERS):
+    """
+    Serves the app with uvicorn, in workers processes sharing the listening socket.
+    """
+    import uvicorn
+
+    if workers > 1:
+        # The workers import the app themselves, and make their sessions stateless
+        os.environ["SEFARIA_HTTP_WORKERS"] = str(workers)
+        uvicorn.run(f"{__name__}:create_app", factory=True, host=host, port=port, workers=workers, log_level="warning")
+    else:
+        uvicorn.run(create_app(), host=host, port=port, log_level="warning")
@@ -0,0 +1,341 @@
+"""
+Cross-reference graph: a persistent SQLite store of the links between texts, with their type
+(commentary, quotation, targum, halakha...) and the category of the linked texts, and a bounded
+multi-hop traversal over it (a verse, its commentaries and their supercommentaries; a Talmud
+passage, the Mishneh Torah and the Shulchan Arukh citing it...).
+
+The graph is filled on demand with the links of each visited text, fetched once through the
+related API (or the local corpus) and then answered from the store. It can also be filled up front
+from the links of a Sefaria export, or of an imported corpus, after which no request is needed:
+
+    python -m sefaria_jewish_library.link_graph import-export path/to/Sefaria-Export
+    python -m sefaria_jewish_library.link_graph import-corpus
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from . import corpus, refs, scheduler
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+LINK_GRAPH_DB = os.environ.get("SEFARIA_LINK_GRAPH_DB", os.path.join(corpus.DATA_DIR, "links.db"))
+# Links fetched from the related API are fetched again after this many days
+LINK_GRAPH_TTL = float(os.environ.get("SEFARIA_LINK_GRAPH_TTL_DAYS", "30")) * 24 * 3600
+# Limits of a traversal
+MAX_DEPTH = int(os.environ.get("SEFARIA_LINK_GRAPH_MAX_DEPTH", "4"))
+MAX_NODES = int(os.environ.get("SEFARIA_LINK_GRAPH_MAX_NODES", "200"))
+# Texts whose links are fetched at the same time
+FETCH_CONCURRENCY = int(os.environ.get("SEFARIA_LINK_GRAPH_CONCURRENCY", "8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    ref TEXT NOT NULL UNIQUE,
+    he_ref TEXT,
+    category TEXT,
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS edges (
+    src INTEGER NOT NULL,
+    dst INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (src, dst, type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Link fields of the output of a traversal
+LINK_FIELDS = ("ref", "heRef", "parent", "depth", "type", "category")
+
+Link = collections.namedtuple("Link", "ref he_ref category type")
+
+
+class LinkGraph:
+    """
+    SQLite store of the graph. Refs are interned as node ids, and every link is stored as an
+    edge in both directions, so the links of a text are one index range scan.
+    """
+
+    def __init__(self, path: str = LINK_GRAPH_DB):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # The connection is used from worker threads, one at a time
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        # After a bulk import, texts without links are not looked up
+        self.complete = row is not None and row[0] == "1"
+
+    def close(self):
+        self.conn.close()
+
+    def is_known(self, ref: str) -> bool:
+        """
+        Returns whether the links of the ref are in the store and fresh.
+        """
+        if self.complete:
+            return True
+        with self._lock:
+            row = self.conn.execute("SELECT fetched_at FROM nodes WHERE ref = ?", (ref,)).fetchone()
+        return row is not None and row[0] is not None and row[0] > time.time() - LINK_GRAPH_TTL
+
+    def links(self, ref: str) -> list[Link]:
+        """
+        Returns the links of the ref, and after a bulk import those of its segments too.
+        """
+        if self.complete:
+            condition, params = "(n.ref = ? OR (n.ref > ? AND n.ref < ?))", (ref, ref + ":", ref + ";")
+        else:
+            condition, params = "n.ref = ?", (ref,)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT m.id, m.ref, m.he_ref, m.category, e.type FROM nodes n "
+                "JOIN edges e ON e.src = n.id JOIN nodes m ON m.id = e.dst "
+                f"WHERE {condition} ORDER BY m.id",
+                params,
+            ).fetchall()
+        return [Link(row[1], row[2], row[3], row[4]) for row in rows if not _within(row[1], ref)]
+
+    def add_links(self, ref: str, links: list[dict]):
+        """
+        Stores the links of a related API response of the ref and marks them as fetched.
+        """
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute(
+                "INSERT INTO nodes (ref, fetched_at) VALUES (?, ?) ON CONFLICT (ref) DO UPDATE SET fetched_at = excluded.fetched_at",
+                (ref, time.time()),
+            )
+            for link in links:
+                other = link.get("sourceRef")
+                if not other:
+                    continue
+                self.conn.execute(
+                    "INSERT INTO nodes (ref, he_ref, category) VALUES (?, ?, ?) ON CONFLICT (ref) DO UPDATE SET "
+                    "he_ref = coalesce(excluded.he_ref, he_ref), category = coalesce(excluded.category, category)",
+                    (other, link.get("sourceHeRef"), link.get("category")),
+                )
+                self._add_edge(ref, other, link.get("type") or "")
+
+    def _add_edge(self, ref1: str, ref2: str, link_type: str):
+        for src, dst in ((ref1, ref2), (ref2, ref1)):
+            self.conn.execute(
+                "INSERT OR IGNORE INTO edges SELECT a.id, b.id, ? FROM nodes a, nodes b WHERE a.ref = ? AND b.ref = ?",
+                (link_type, src, dst),
+            )
+
+    def import_links(self, rows) -> int:
+        """
+        Replaces the store with the given (ref1, ref2, type, category1, category2) links, and marks it complete.
+        Returns the number of imported links.
+        """
+        count = 0
+        with self._lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM edges")
+            self.conn.execute("DELETE FROM nodes")
+            for ref1, ref2, link_type, category1, category2 in rows:
+                self.conn.execute("INSERT OR IGNORE INTO nodes (ref, category) VALUES (?, ?)", (ref1, category1 or None))
+                self.conn.execute("INSERT OR IGNORE INTO nodes (ref, category) VALUES (?, ?)", (ref2, category2 or None))
+                self._add_edge(ref1, ref2, link_type or "")
+                count += 1
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        self.complete = True
+        return count
+
+    def stats(self) -> dict:
+        return {
+            "nodes": self.conn.execute("SELECT count(*) FROM nodes").fetchone()[0],
+            "edges": self.conn.execute("SELECT count(*) FROM edges").fetchone()[0] // 2,
+            "complete": self.complete,
+        }
+
+
+_graph: LinkGraph | None = None
+
+
+def get_graph() -> LinkGraph:
+    """
+    Returns the process-wide link graph, kept in memory when its database cannot be opened.
+    """
+    global _graph
+    if _graph is None:
+        try:
+            _graph = LinkGraph(LINK_GRAPH_DB)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Link graph kept in memory, could not use {LINK_GRAPH_DB}: {e}")
+            _graph = LinkGraph(":memory:")
+    return _graph
+
+
+async def fetch_links(ref: str) -> bool:
+    """
+    Fetches the links of the ref into the graph, unless they are known.
+    Returns False when they could not be retrieved.
+    """
+    graph = get_graph()
+    # The store is read and written in a thread, not to block the other requests
+    if await asyncio.to_thread(graph.is_known, ref):
+        return True
+    from .sefaria_handler import get_request_json_data
+    data = await get_request_json_data("api/related/", ref)
+    if not data or "links" not in data:
+        return False
+    await asyncio.to_thread(graph.add_links, ref, data["links"])
+    return True
+
+
+def _within(ref: str, container: str) -> bool:
+    return ref == container or ref.startswith(container + ":")
+
+
+def _matches(link: Link, filters) -> bool:
+    names = [link.ref, link.he_ref or "", link.category or ""]
+    return any(f.lower() in name.lower() for f in filters for name in names if name)
+
+
+async def traverse(
+    reference: str,
+    depth: int = 2,
+    max_fanout: int = 10,
+    types: list[str] = None,
+    path: list[str] = None,
+    max_nodes: int = MAX_NODES,
+    order: str = "bfs"
+) -> list[dict]:
+    """
+    Walks the links of a text, breadth-first or depth-first.
+
+    Args:
+        reference (str): The text to start from
+        depth (int, optional): Number of hops, at most MAX_DEPTH. defaults to 2.
+        max_fanout (int, optional): Maximum number of links followed from each text. defaults to 10.
+        types (list, optional): Only follow links of these types, e.g. ["commentary"]
+        path (list, optional): Filter of each hop, matched against the reference or the category of the
+            linked text, e.g. ["Mishneh Torah", "Shulchan Arukh"]; sets the depth to its length
+        max_nodes (int, optional): Maximum number of linked texts returned
+        order (str, optional): "bfs" or "dfs"
+
+    Returns:
+        list: a dict with ref, heRef, parent, depth, type and category for each linked text, in visiting order
+    Raises refs.InvalidRef for references that cannot exist.
+    """
+    start = refs.canonicalize(reference)
+    if path:
+        depth = len(path)
+    depth = max(0, min(depth, MAX_DEPTH))
+    max_nodes = min(max_nodes, MAX_NODES)
+    types = {t.lower() for t in types} if types else None
+    graph = get_graph()
+    semaphore = asyncio.Semaphore(max(1, FETCH_CONCURRENCY))
+
+    def unknown(nodes):
+        return [ref for ref in dict.fromkeys(nodes) if not graph.is_known(ref)]
+
+    async def prefetch(nodes):
+        async def fetch(ref):
+            async with semaphore:
+                return await fetch_links(ref)
+        nodes = await asyncio.to_thread(unknown, list(nodes))
+        with scheduler.lane(scheduler.BATCH):
+            await asyncio.gather(*(fetch(ref) for ref in nodes))
+
+    seen = {start}
+    visited = []
+    # (ref, level, parent, link) entries; a deque used as a queue (bfs) or a stack (dfs)
+    frontier = collections.deque([(start, 0, None, None)])
+    while frontier and len(visited) < max_nodes:
+        if order == "bfs" and frontier[0][1] < depth and not await asyncio.to_thread(graph.is_known, frontier[0][0]):
+            # Fetch the links of the whole level at once
+            await prefetch([ref for ref, level, _parent, _link in frontier if level < depth])
+        ref, level, parent, link = frontier.popleft() if order == "bfs" else frontier.pop()
+        if link is not None:
+            visited.append({
+                "ref": link.ref, "heRef": link.he_ref, "parent": parent,
+                "depth": level, "type": link.type, "category": link.category,
+            })
+        if level >= depth:
+            continue
+        await fetch_links(ref)
+        children = []
+        for child in await asyncio.to_thread(graph.links, ref):
+            if child.ref in seen or _within(child.ref, start):
+                continue
+            if types and child.type.lower() not in types:
+                continue
+            if path and not _matches(child, [path[level]]):
+                continue
+            seen.add(child.ref)
+            children.append(child)
+            if len(children) >= max_fanout:
+                break
+        entries = [(child.ref, level + 1, ref, child) for child in children]
+        # Popped from the end as a stack, so pushed in reverse to visit in order
+        frontier.extend(entries if order == "bfs" else reversed(entries))
+    return visited
+
+
+def format_links(reference: str, links: list[dict], order: str = "bfs") -> str:
+    """
+    Formats the result of a traversal, one linked text per line, indented by depth.
+    """
+    if not links:
+        return f"No linked texts found for {reference}."
+    lines = [f"Linked texts of {reference} ({len(links)}):"]
+    for link in links:
+        details = ", ".join(value for value in (link["type"], link["category"]) if value)
+        line = "  " * (link["depth"] - 1) + f"- {link['ref']}"
+        if link["heRef"]:
+            line += f" ({link['heRef']})"
+        if details:
+            line += f" [{details}]"
+        if order == "bfs" and link["depth"] > 1:
+            line += f" <- {link['parent']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sefaria_jewish_library.link_graph")
+    parser.add_argument("--db", default=LINK_GRAPH_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("import-export", help="import the links of a Sefaria-Export checkout")
+    export_parser.add_argument("export_dir")
+    corpus_parser = subparsers.add_parser("import-corpus", help="import the links of an imported corpus")
+    corpus_parser.add_argument("--corpus", default=corpus.CORPUS_DB)
+    subparsers.add_parser("stats", help="print the size of the graph")
+    args = parser.parse_args(argv)
+
+    graph = LinkGraph(args.db)
+    try:
+        if args.command == "import-export":
+            count = graph.import_links(corpus.iter_export_links(args.export_dir))
+            print(f"Imported {count} links into {args.db}", file=sys.stderr)
+        elif args.command == "import-corpus":
+            conn = sqlite3.connect(f"file:{args.corpus}?mode=ro", uri=True)
+            try:
+                count = graph.import_links(conn.execute("SELECT ref1, ref2, type, category1, category2 FROM links"))
+            finally:
+                conn.close()
+            print(f"Imported {count} links into {args.db}", file=sys.stderr)
+        print(graph.stats(), file=sys.stderr)
+    finally:
+        graph.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOG_LEVEL = os.environ.get("SEFARIA_LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("SEFARIA_LOG_FILE", "sefaria_jewish_library.log")
+# Fraction of upstream response payloads that are logged at DEBUG level
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("SEFARIA_LOG_PAYLOAD_SAMPLE", "0"))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def configure_logging():
+    """
+    Routes all logging through a queue, so callers only enqueue records and a background
+    thread does the formatting and the stderr/file I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """
+    Flushes the queued records and stops the background logging thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_payload(logger: logging.Logger, message: str, payload):
+    """
+    Logs an upstream payload at DEBUG level, for a sampled fraction of calls only.
+    payload may be a callable, so the payload text is only built when it is logged.
+    """
+    if PAYLOAD_SAMPLE_RATE <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    if PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    logger.debug(f"{message}: {payload() if callable(payload) else payload}")
@@ -0,0 +1,171 @@
+"""
+In-process metrics: per-tool and per-upstream-endpoint latency histograms and error counters.
+
+Recording a value is a bisect and two increments, cheap enough for every call.
+The metrics are rendered by the get_diagnostics tool, as text or in the Prometheus text format.
+"""
+import bisect
+import os
+import sys
+import time
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    def cumulative(self):
+        """
+        Yields (upper bound, cumulative count) pairs, ending with +Inf.
+        """
+        seen = 0
+        for bound, count in zip((*BUCKETS, float("inf")), self.counts):
+            seen += count
+            yield bound, seen
+
+
+class Metrics:
+    """
+    Latency histograms and error counters, keyed by (kind, name), e.g. ("tool", "get_text").
+    """
+
+    def __init__(self):
+        self.latencies: dict[tuple[str, str], Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self.started_at = time.time()
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False):
+        histogram = self.latencies.get((kind, name))
+        if histogram is None:
+            histogram = self.latencies[(kind, name)] = Histogram()
+        histogram.observe(seconds)
+        if error:
+            self.errors[(kind, name)] = self.errors.get((kind, name), 0) + 1
+
+    def reset(self):
+        self.latencies.clear()
+        self.errors.clear()
+        self.started_at = time.time()
+
+
+_metrics = Metrics()
+
+observe = _metrics.observe
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def process_stats() -> dict:
+    """
+    Returns the resident memory of the process in bytes: current (Linux only) and peak.
+    """
+    stats = {}
+    try:
+        with open("/proc/self/statm") as f:
+            stats["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return stats
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    stats["max_rss_bytes"] = max_rss if sys.platform == "darwin" else max_rss * 1024
+    return stats
+
+
+def _extra_stats() -> dict[str, dict]:
+    from . import cache, resilience, scheduler, singleflight, texts
+    return {
+        "cache": cache.stats(),
+        "segments": texts.stats(),
+        "singleflight": singleflight.stats(),
+        "resilience": resilience.stats(),
+        "scheduler": scheduler.stats(),
+        "process": process_stats(),
+    }
+
+
+def render_text() -> str:
+    """
+    Renders the metrics as a human readable report.
+    """
+    lines = [f"Uptime: {time.time() - _metrics.started_at:.0f}s"]
+    for kind, title in (("tool", "Tools"), ("upstream", "Upstream endpoints"), ("queue", "Upstream queue waits")):
+        entries = sorted((name, h) for (k, name), h in _metrics.latencies.items() if k == kind)
+        lines.append(f"\n{title}:")
+        if not entries:
+            lines.append("   (no calls yet)")
+        for name, h in entries:
+            errors = _metrics.errors.get((kind, name), 0)
+            lines.append(
+                f"   {name}: {h.count} calls, {errors} errors, "
+                f"avg {h.total / h.count * 1000:.1f}ms, "
+                f"p50 <{h.quantile(0.5) * 1000:.0f}ms, p95 <{h.quantile(0.95) * 1000:.0f}ms, p99 <{h.quantile(0.99) * 1000:.0f}ms"
+            )
+    for name, stats in _extra_stats().items():
+        lines.append(f"\n{name.capitalize()}:")
+        for key, value in stats.items():
+            lines.append(f"   {key}: {round(value, 4) if isinstance(value, float) else value}")
+    return "\n".join(lines)
+
+
+def render_prometheus() -> str:
+    """
+    Renders the metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for kind in ("tool", "upstream", "queue"):
+        metric = f"sefaria_{kind}_latency_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for (k, name), h in sorted(_metrics.latencies.items()):
+            if k != kind:
+                continue
+            for bound, count in h.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{{kind}="{name}",le="{le}"}} {count}')
+            lines.append(f'{metric}_sum{{{kind}="{name}"}} {h.total}')
+            lines.append(f'{metric}_count{{{kind}="{name}"}} {h.count}')
+        errors = f"sefaria_{kind}_errors_total"
+        lines.append(f"# TYPE {errors} counter")
+        for (k, name), count in sorted(_metrics.errors.items()):
+            if k == kind:
+                lines.append(f'{errors}{{{kind}="{name}"}} {count}')
+    for group, stats in _extra_stats().items():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"sefaria_{group}_{key} {value}")
+    return "\n".join(lines) + "\n"
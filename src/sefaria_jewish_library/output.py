@@ -0,0 +1,55 @@
+"""
+Compact JSON output of the tools, as an alternative to their formatted text.
+
+Tools taking a "format" argument return, with format "json", one line of JSON instead of text,
+holding only the fields the caller lists in "fields" (all of them by default). Empty fields are
+left out, and Hebrew is written as UTF-8 rather than escaped, to keep responses small.
+"""
+import json
+import os
+
+# Default format of the tools supporting JSON output
+OUTPUT_FORMAT = os.environ.get("SEFARIA_OUTPUT_FORMAT", "text")
+
+
+def schema_properties(fields: tuple[str, ...]) -> dict:
+    """
+    Returns the "format" and "fields" input schema properties of a tool whose records have the given fields.
+    """
+    return {
+        "format": {
+            "type": "string",
+            "enum": ["text", "json"],
+            "description": "Output format: readable text, or compact JSON with only the selected fields.",
+            "default": OUTPUT_FORMAT,
+        },
+        "fields": {
+            "type": "array",
+            "items": {"type": "string", "enum": list(fields)},
+            "description": f"Fields of each result in the JSON output (default: all of {', '.join(fields)}).",
+        },
+    }
+
+
+def select_fields(fields, available: tuple[str, ...]) -> tuple[str, ...]:
+    """
+    Returns the requested fields, or all the available ones when none are requested.
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return available
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(available)})")
+    return tuple(dict.fromkeys(fields))
+
+
+def is_json(output_format: str | None) -> bool:
+    return (output_format or OUTPUT_FORMAT) == "json"
+
+
+def dumps(value) -> str:
+    """
+    Serializes a tool result as compact JSON.
+    """
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
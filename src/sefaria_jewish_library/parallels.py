@@ -0,0 +1,413 @@
+"""
+Parallel passages: TF-IDF similarity over the segments of the local corpus.
+
+Every segment of the corpus is a row of a sparse TF-IDF matrix (sublinear term frequencies,
+smoothed IDF, rows normalized to unit length), over the normalized words of the search index
+or over character n-grams. The matrix is stored by column, one column per term, as NumPy arrays
+memory-mapped at load time, so the server starts without reading it and a query only touches
+the columns of its terms. The cosine similarities of a batch of queries to every segment are
+one sparse matrix product.
+
+Requires numpy and scipy (pip install "sefaria_jewish_library[parallels]"). Build the matrix
+after importing a corpus with:
+
+    python -m sefaria_jewish_library.parallels build
+"""
+import argparse
+import bisect
+import collections
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+from array import array
+
+from . import corpus
+from .search_index import _HEBREW_RE, _TAG_RE, normalize, prefix_variants, tokenize
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+PARALLELS_INDEX = os.environ.get("SEFARIA_PARALLELS_INDEX", os.path.join(corpus.DATA_DIR, "parallels"))
+
+INDEX_FORMAT = 1
+# Terms in fewer segments than MIN_DF, or in more than MAX_DF of them, are left out
+MIN_DF = 2
+MAX_DF = 0.5
+# Length of the character n-grams of the "char" analyzer
+NGRAM = 4
+# Queries scored per matrix product
+BATCH_SIZE = 32
+SNIPPET_CHARS = 300
+
+# Fields of a parallel passage in the JSON output
+PARALLEL_FIELDS = ("ref", "heRef", "path", "score", "text")
+
+
+def dependencies_available() -> bool:
+    """
+    Returns True when numpy and scipy are installed.
+    """
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def analyze(text: str, lang: str, analyzer: str = "word") -> list[str]:
+    """
+    Returns the terms of a text: its normalized words (and their forms without Hebrew prefixes),
+    or the character n-grams of its normalized words.
+    """
+    words = [normalize(match.group()) for match in tokenize(text)]
+    words = [word for word in words if word]
+    if analyzer == "char":
+        padded = f" {' '.join(words)} "
+        return [padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)]
+    if lang == "he":
+        return [variant for word in words for variant in prefix_variants(word)]
+    return words
+
+
+class ParallelsIndex:
+    """
+    The TF-IDF matrix of the corpus, with the sorted terms of its columns and the
+    (version, seq) key of each of its rows.
+    """
+
+    def __init__(self, matrix, terms: list[str], idf, keys, versions: dict[int, dict], analyzer: str):
+        self.matrix = matrix
+        self.terms = terms
+        self.idf = idf
+        self.keys = keys
+        self.versions = versions
+        self.analyzer = analyzer
+
+    @classmethod
+    def load(cls, directory: str = PARALLELS_INDEX) -> "ParallelsIndex":
+        import numpy as np
+        from scipy.sparse import csc_matrix
+
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported parallels index format in {directory}")
+        with open(os.path.join(directory, "terms.txt"), encoding="utf-8") as f:
+            terms = f.read().split("\n") if meta["shape"][1] else []
+
+        def load_array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        # Same dtypes as saved, so scipy keeps the memory maps instead of copying them
+        matrix = csc_matrix(
+            (load_array("data"), load_array("indices"), load_array("indptr")), shape=tuple(meta["shape"]), copy=False
+        )
+        versions = {int(version_id): version for version_id, version in meta["versions"].items()}
+        return cls(matrix, terms, load_array("idf"), load_array("keys"), versions, meta["analyzer"])
+
+    def vectorize(self, texts: list[tuple[str, str]]):
+        """
+        Returns the normalized TF-IDF rows of (text, lang) queries, as a sparse matrix.
+        """
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        indptr, indices, data = [0], [], []
+        for text, lang in texts:
+            counts = collections.Counter(analyze(text, lang, self.analyzer))
+            row = {}
+            for term, count in counts.items():
+                column = bisect.bisect_left(self.terms, term)
+                if column < len(self.terms) and self.terms[column] == term:
+                    row[column] = (1 + np.log(count)) * self.idf[column]
+            norm = np.sqrt(sum(weight * weight for weight in row.values())) or 1.0
+            for column in sorted(row):
+                indices.append(column)
+                data.append(row[column] / norm)
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(texts), self.matrix.shape[1]),
+        )
+
+    def row_mask(self, filters=None, exclude=()):
+        """
+        Returns a boolean mask of the rows whose book path matches one of the filters (all rows
+        without filters), leaving out the (version_id, first_seq, last_seq) ranges in exclude.
+        """
+        import numpy as np
+
+        version_ids = self.keys >> 32
+        if filters:
+            filters = [f.lower() for f in filters]
+            allowed = [vid for vid, version in self.versions.items() if any(f in version["path"].lower() for f in filters)]
+            mask = np.isin(version_ids, allowed)
+        else:
+            mask = np.ones(len(self.keys), dtype=bool)
+        for version_id, first, last in exclude:
+            start, end = np.searchsorted(self.keys, [version_id << 32 | first, version_id << 32 | last], side="left")
+            mask[start:end + 1] = False
+        return mask
+
+    def top_k(self, queries, k: int = 10, mask=None) -> list[list[tuple[int, float]]]:
+        """
+        Returns the k most similar rows (row, cosine similarity) of each query row, best first.
+        The queries are scored in batches, each with one product of the matrix columns of their terms.
+        """
+        import numpy as np
+
+        results = []
+        for start in range(0, queries.shape[0], BATCH_SIZE):
+            batch = queries[start:start + BATCH_SIZE]
+            columns = np.unique(batch.indices)
+            # Only the columns of the terms of the batch are read from the memory map
+            scores = (self.matrix[:, columns] @ batch[:, columns].T).tocsc()
+            for i in range(batch.shape[0]):
+                rows = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+                values = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+                if mask is not None:
+                    keep = mask[rows]
+                    rows, values = rows[keep], values[keep]
+                if len(values) > k:
+                    best = np.argpartition(-values, k)[:k]
+                    rows, values = rows[best], values[best]
+                order = np.argsort(-values, kind="stable")
+                results.append([(int(rows[j]), float(values[j])) for j in order])
+        return results
+
+    def stats(self) -> dict:
+        return {"segments": self.matrix.shape[0], "terms": self.matrix.shape[1], "entries": int(self.matrix.nnz)}
+
+
+def build(db_path: str = corpus.CORPUS_DB, directory: str = PARALLELS_INDEX, analyzer: str = "word") -> dict:
+    """
+    Builds the TF-IDF matrix of the corpus and saves it to directory, replacing the previous one.
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        versions = {}
+        vocabulary: dict[str, int] = {}
+        indptr, indices, counts, keys = array("q", [0]), array("q"), array("f"), array("q")
+        for version_id, lang, index_title, categories in conn.execute(
+            "SELECT v.id, v.lang, b.index_title, b.categories FROM versions v JOIN books b ON b.id = v.book_id ORDER BY v.id"
+        ).fetchall():
+            versions[version_id] = {"lang": lang, "path": "/".join(json.loads(categories or "[]") + [index_title])}
+            for seq, text in conn.execute("SELECT seq, text FROM segments WHERE version_id = ? ORDER BY seq", (version_id,)):
+                for term, count in collections.Counter(analyze(text, lang, analyzer)).items():
+                    indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                    counts.append(count)
+                indptr.append(len(indices))
+                keys.append(version_id << 32 | seq)
+    finally:
+        conn.close()
+
+    rows = len(keys)
+    indices = np.frombuffer(indices, dtype=np.int64)
+    counts = np.frombuffer(counts, dtype=np.float32)
+    indptr = np.frombuffer(indptr, dtype=np.int64)
+    document_frequency = np.bincount(indices, minlength=len(vocabulary))
+    kept = (document_frequency >= min(MIN_DF, rows)) & (document_frequency <= max(1, MAX_DF * rows))
+    terms = sorted(term for term, column in vocabulary.items() if kept[column])
+    # Old column -> column of the sorted kept terms, or -1
+    old_columns = np.array([vocabulary[term] for term in terms], dtype=np.int64)
+    remap = np.full(len(vocabulary), -1, dtype=np.int64)
+    remap[old_columns] = np.arange(len(terms))
+    columns = remap[indices]
+    keep = columns >= 0
+    idf = (np.log((1 + rows) / (1 + document_frequency[old_columns])) + 1).astype(np.float32)
+    cumulative = np.concatenate(([0], np.cumsum(keep)))
+    matrix = csr_matrix(
+        ((1 + np.log(counts[keep])) * idf[columns[keep]], columns[keep], cumulative[indptr]),
+        shape=(rows, len(terms)), dtype=np.float32,
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = csr_matrix(matrix.multiply(1 / norms[:, None]), dtype=np.float32).tocsc()
+    matrix.sort_indices()
+    index_dtype = np.int32 if matrix.nnz < 2 ** 31 and rows < 2 ** 31 else np.int64
+
+    # Written next to the index and swapped in, so a running server keeps a complete index
+    tmp_directory = directory.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, values in (
+        ("data", matrix.data.astype(np.float32)),
+        ("indices", matrix.indices.astype(index_dtype)),
+        ("indptr", matrix.indptr.astype(index_dtype)),
+        ("idf", idf),
+        ("keys", np.frombuffer(keys, dtype=np.int64)),
+    ):
+        np.save(os.path.join(tmp_directory, f"{name}.npy"), values)
+    with open(os.path.join(tmp_directory, "terms.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(terms))
+    with open(os.path.join(tmp_directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": INDEX_FORMAT, "analyzer": analyzer, "shape": [rows, len(terms)],
+            "versions": {str(version_id): version for version_id, version in versions.items()},
+        }, f, ensure_ascii=False)
+    old_directory = directory.rstrip(os.sep) + ".old"
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+    return {"segments": rows, "terms": len(terms), "entries": int(matrix.nnz)}
+
+
+_index: ParallelsIndex | None = None
+
+
+def get_index() -> ParallelsIndex:
+    """
+    Returns the loaded parallels index.
+    Raises RuntimeError when numpy or scipy is missing, or no local corpus or index is available.
+    """
+    global _index
+    if _index is None:
+        if not dependencies_available():
+            raise RuntimeError('find_parallels requires numpy and scipy: pip install "sefaria_jewish_library[parallels]"')
+        if corpus.get_store() is None:
+            raise RuntimeError("find_parallels requires a local corpus (SEFARIA_BACKEND=local or offline)")
+        if not os.path.exists(os.path.join(PARALLELS_INDEX, "meta.json")):
+            raise RuntimeError(f"No parallels index found at {PARALLELS_INDEX}, build it with: python -m sefaria_jewish_library.parallels build")
+        _index = ParallelsIndex.load(PARALLELS_INDEX)
+    return _index
+
+
+def _segments_of(store: corpus.CorpusStore, ref: str):
+    """
+    Returns the (version_id, lang, first_seq, last_seq) ranges of a ref in each version of its book.
+    """
+    book, address = store.find_book(ref)
+    if book is None:
+        return []
+    parsed = store._parse_address(book, address)
+    if parsed is None:
+        return []
+    start, end = parsed
+    ranges = []
+    for version_id, lang in store.conn.execute("SELECT id, lang FROM versions WHERE book_id = ?", (book["id"],)):
+        if start:
+            first = store._seq_bounds(version_id, store.format_ref(book, start))[0]
+            last = store._seq_bounds(version_id, store.format_ref(book, end))[1]
+        else:
+            first, last = store.conn.execute(
+                "SELECT MIN(seq), MAX(seq) FROM segments WHERE version_id = ?", (version_id,)
+            ).fetchone()
+        if first is not None and last is not None and first <= last:
+            ranges.append((version_id, lang, first, last))
+    return ranges
+
+
+def find_parallels(
+    reference: str = None,
+    text: str = None,
+    k: int = 10,
+    filters: list[str] = None,
+    per_segment: bool = False
+) -> list[tuple[str, list[dict]]]:
+    """
+    Finds the segments of the corpus most similar to a ref or to a passage.
+
+    Args:
+        reference (str, optional): A ref of the corpus; its own segments are left out of the results
+        text (str, optional): A passage, when no reference is given
+        k (int, optional): Number of parallels per query. defaults to 10.
+        filters (list, optional): Only segments whose book path contains one of these, as for search_texts
+        per_segment (bool, optional): Find parallels for every segment of the reference instead of the whole reference
+
+    Returns:
+        list: (query, parallels) pairs, each parallel a dict with ref, heRef, path, score and text
+    """
+    index = get_index()
+    store = corpus.get_store()
+    exclude = []
+    if reference:
+        ranges = _segments_of(store, reference)
+        if not ranges:
+            raise ValueError(f"{reference} is not in the local corpus")
+        # The texts of each segment (or of the whole reference) in all the versions of the book
+        texts: dict[str, list[str]] = {}
+        langs = set()
+        for version_id, lang, first, last in ranges:
+            exclude.append((version_id, first, last))
+            langs.add(lang)
+            for row in store.conn.execute(
+                "SELECT ref, text FROM segments WHERE version_id = ? AND seq BETWEEN ? AND ? ORDER BY seq", (version_id, first, last)
+            ):
+                texts.setdefault(row["ref"] if per_segment else reference, []).append(row["text"])
+        lang = "he" if "he" in langs else "en"
+        queries = [(name, " ".join(parts), lang) for name, parts in texts.items()]
+    elif text:
+        queries = [(None, text, "he" if _HEBREW_RE.search(text) else "en")]
+    else:
+        raise ValueError("Missing reference or text parameter")
+
+    vectors = index.vectorize([(query_text, lang) for _name, query_text, lang in queries])
+    # The versions of a segment are separate rows, so more rows are ranked than kept
+    results = index.top_k(vectors, k * max(1, len({v["lang"] for v in index.versions.values()})), index.row_mask(filters, exclude))
+    parallels = []
+    for (name, _query_text, _lang), hits in zip(queries, results):
+        found = {}
+        for row, score in hits:
+            key = int(index.keys[row])
+            segment = store.conn.execute(
+                "SELECT ref, text FROM segments WHERE version_id = ? AND seq = ?", (key >> 32, key & 0xFFFFFFFF)
+            ).fetchone()
+            if segment is None or segment["ref"] in found:
+                continue
+            plain = _TAG_RE.sub("", segment["text"])
+            found[segment["ref"]] = {
+                "ref": segment["ref"],
+                "heRef": store.he_ref(segment["ref"]),
+                "path": index.versions[key >> 32]["path"],
+                "score": round(score, 4),
+                "text": plain[:SNIPPET_CHARS] + ("..." if len(plain) > SNIPPET_CHARS else ""),
+            }
+            if len(found) >= k:
+                break
+        parallels.append((name, list(found.values())))
+    return parallels
+
+
+def format_parallels(parallels: list[tuple[str, list[dict]]]) -> str:
+    """
+    Formats the result of find_parallels.
+    """
+    sections = []
+    for name, found in parallels:
+        lines = [f"Parallels of {name}:" if name else "Parallels of the passage:"]
+        if not found:
+            lines.append("No parallel passages found.")
+        for parallel in found:
+            lines.append(
+                f"Reference: {parallel['ref']}\n Hebrew Reference: {parallel['heRef']}\n"
+                f" Score: {parallel['score']}\n Text: {parallel['text']}\n"
+            )
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sefaria_jewish_library.parallels")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the TF-IDF matrix of the corpus")
+    build_parser.add_argument("--db", default=corpus.CORPUS_DB)
+    build_parser.add_argument("--index", default=PARALLELS_INDEX)
+    build_parser.add_argument("--analyzer", choices=["word", "char"], default="word",
+                              help=f"terms: normalized words, or character {NGRAM}-grams")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        stats = build(args.db, args.index, args.analyzer)
+        print(f"Parallels index {args.index} built: {stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""
+Local parsing and canonicalization of references, before any I/O.
+
+Refs are resolved against a title index of English and Hebrew titles and their
+alternate names (data/titles.json, extended with the titles of the local corpus),
+so that e.g. 'Gen. 1.1', 'בראשית פרק א פסוק א' and 'Genesis 1:1' all become the
+canonical 'Genesis 1:1', and refs that cannot exist are rejected without a request.
+"""
+import functools
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+TITLE_INDEX = os.path.join(os.path.dirname(__file__), "data", "titles.json")
+EXTRA_TITLE_INDEX = os.environ.get("SEFARIA_TITLE_INDEX")
+
+
+class InvalidRef(ValueError):
+    """
+    Raised for references that cannot exist, e.g. 'Genesis 51:1' or 'Berakhot 65a'.
+    """
+
+
+_HEBREW_UNITS = "אבגדהוזחט"
+_HEBREW_TENS = "יכלמנסעפצ"
+_HEBREW_HUNDREDS = "קרשת"
+_HEBREW_VALUES = {
+    **{letter: (i + 1) for i, letter in enumerate(_HEBREW_UNITS)},
+    **{letter: (i + 1) * 10 for i, letter in enumerate(_HEBREW_TENS)},
+    **{letter: (i + 1) * 100 for i, letter in enumerate(_HEBREW_HUNDREDS)},
+    "ך": 20, "ם": 40, "ן": 50, "ף": 80, "ץ": 90,
+}
+
+# Words that only name the kind of section that follows, e.g. 'פרק א פסוק ב'
+_SECTION_WORDS = {
+    "chapter", "verse", "siman", "seif", "daf", "mishnah", "halakhah", "line", "ch", "v",
+    "פרק", "פסוק", "סימן", "סעיף", "סעי", "דף", "משנה", "הלכה", "אות", "שורה",
+}
+_AMUD_WORDS = {"עמוד", "amud"}
+_AMUD_ABBREVIATIONS = {"עא": "a", "עב": "b"}
+
+_MARKS_RE = re.compile("[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]")
+_QUOTES_RE = re.compile("[\"'׳״`’]")
+_TOKEN_RE = re.compile(r"\d+[ab]?|[א-ת]+|[A-Za-z]+|[.:]|-")
+
+
+def hebrew_numeral(n: int) -> str:
+    """
+    Formats a positive integer as a Hebrew numeral, e.g. 15 -> 'טו'.
+    """
+    result = ""
+    while n >= 400:
+        result += "ת"
+        n -= 400
+    if n >= 100:
+        result += _HEBREW_HUNDREDS[n // 100 - 1]
+        n %= 100
+    if n in (15, 16):
+        return result + ("טו" if n == 15 else "טז")
+    if n >= 10:
+        result += _HEBREW_TENS[n // 10 - 1]
+        n %= 10
+    if n:
+        result += _HEBREW_UNITS[n - 1]
+    return result
+
+
+def parse_hebrew_numeral(word: str) -> int | None:
+    """
+    Parses a Hebrew numeral such as 'קכג' or 'טו', or returns None if the word is not one.
+    """
+    if not word or len(word) > 5 or any(letter not in _HEBREW_VALUES for letter in word):
+        return None
+    values = [_HEBREW_VALUES[letter] for letter in word]
+    # Numerals are written largest first; 15 and 16 are written טו and טז
+    if any(a < b for a, b in zip(values, values[1:])) and word[-2:] not in ("טו", "טז"):
+        return None
+    return sum(values)
+
+
+def is_daf(section_name: str) -> bool:
+    return section_name in ("Daf", "Folio")
+
+
+def format_section(index: int, section_name: str) -> str:
+    """
+    Formats a 0-based section index, e.g. 0 -> '1', or 2 -> '2a' for a daf.
+    """
+    if is_daf(section_name):
+        return f"{index // 2 + 1}{'ab'[index % 2]}"
+    return str(index + 1)
+
+
+def format_he_section(index: int, section_name: str) -> str:
+    """
+    Formats a 0-based section index in Hebrew, e.g. 0 -> 'א', or 2 -> 'ב א' for a daf.
+    """
+    if is_daf(section_name):
+        return f"{hebrew_numeral(index // 2 + 1)} {'אב'[index % 2]}"
+    return hebrew_numeral(index + 1)
+
+
+def parse_section(part: str, section_name: str) -> int:
+    """
+    Converts one address part ('3', '2a') into a 0-based index.
+    """
+    if part[-1] in "ab":
+        return (int(part[:-1]) - 1) * 2 + (part[-1] == "b")
+    if is_daf(section_name):
+        # A bare daf number means its first side
+        return (int(part) - 1) * 2
+    return int(part) - 1
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes a title for lookups: no niqqud, quotes or commas, single spaces, lower case.
+    """
+    title = _QUOTES_RE.sub("", _MARKS_RE.sub("", title))
+    title = title.replace(",", " ").replace(".", " ").replace("_", " ")
+    return " ".join(title.split()).lower()
+
+
+class Title:
+    """
+    An entry of the title index.
+    """
+
+    __slots__ = ("title", "he_title", "sections", "length")
+
+    def __init__(self, title: str, he_title: str | None, sections: list[str], length: int | None = None):
+        self.title = title
+        self.he_title = he_title
+        self.sections = sections
+        self.length = length
+
+
+class TitleIndex:
+    """
+    Maps normalized English and Hebrew titles and alternate names to titles.
+    """
+
+    def __init__(self):
+        self.names: dict[str, Title] = {}
+        self.commentators: dict[str, str] = {}
+        self.he_commentators: dict[str, str] = {}
+        self.max_words = 1
+
+    def add(self, entry: Title, names=()):
+        for name in (entry.title, entry.he_title, *names):
+            if not name:
+                continue
+            key = normalize_title(name)
+            # The first entry for a name wins, so e.g. 'ברכות' stays the Bavli tractate
+            self.names.setdefault(key, entry)
+            self.max_words = max(self.max_words, len(key.split()))
+
+    def load(self, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for item in data.get("titles", []):
+            entry = Title(item["title"], item.get("he"), item.get("sections") or [], item.get("length"))
+            self.add(entry, item.get("alt", []) + item.get("he_alt", []))
+        # Commentators are listed under Sefaria's canonical title, with their Hebrew title first among their other names
+        for commentator, names in data.get("commentators", {}).items():
+            for name in (commentator, *names):
+                self.commentators[normalize_title(name)] = commentator
+            he_names = [name for name in names if not name.isascii()]
+            if he_names:
+                self.he_commentators.setdefault(commentator, he_names[0])
+
+    def add_corpus_titles(self, store):
+        """
+        Adds the titles of a local corpus store, including commentary and complex-text titles.
+        """
+        for book in store._books.values():
+            if normalize_title(book["title"]) in self.names:
+                continue
+            self.add(Title(book["title"], book["he_title"], json.loads(book["section_names"] or "[]")))
+
+    def lookup(self, words: list[str]):
+        """
+        Finds the longest run of leading words that is a title.
+        Returns (Title, number of words used), or (None, 0).
+        """
+        for count in range(min(len(words), self.max_words), 0, -1):
+            entry = self.names.get(" ".join(words[:count]))
+            if entry is not None:
+                return entry, count
+        return None, 0
+
+    def lookup_commentary(self, words: list[str], reference: str):
+        """
+        Resolves '<commentator> on <book>' / '<commentator> על <book>' titles.
+        A commentator missing from the title index is kept as written in the reference,
+        since Sefaria's titles cannot be rebuilt from normalized words.
+        Returns (Title, number of words used), or (None, 0).
+        """
+        for separator in ("on", "על"):
+            if separator not in words:
+                continue
+            position = words.index(separator)
+            commentator = self.commentators.get(" ".join(words[:position]))
+            if commentator is None and separator == "on" and position:
+                commentator = " ".join(_title_words(reference, position).split())
+            if commentator is None:
+                continue
+            base, count = self.lookup(words[position + 1:])
+            if base is None:
+                continue
+            he_commentator = self.he_commentators.get(commentator)
+            entry = Title(
+                f"{commentator} on {base.title}",
+                f"{he_commentator} על {base.he_title}" if he_commentator and base.he_title else None,
+                base.sections + ["Comment"],
+                base.length,
+            )
+            return entry, position + 1 + count
+        return None, 0
+
+
+class Ref:
+    """
+    A parsed reference: a title and 0-based start and end addresses.
+    """
+
+    __slots__ = ("index", "start", "end")
+
+    def __init__(self, index: Title, start: list[int], end: list[int]):
+        self.index = index
+        self.start = start
+        self.end = end
+
+    def __eq__(self, other):
+        return isinstance(other, Ref) and self.normal() == other.normal()
+
+    def __hash__(self):
+        return hash(self.normal())
+
+    def __repr__(self):
+        return f"Ref({self.normal()!r})"
+
+    def _section_name(self, level: int) -> str:
+        sections = self.index.sections
+        return sections[level] if level < len(sections) else ""
+
+    def _format(self, address, first_level=0, he=False) -> list[str]:
+        format_part = format_he_section if he else format_section
+        return [format_part(i, self._section_name(first_level + n)) for n, i in enumerate(address)]
+
+    @property
+    def title(self) -> str:
+        return self.index.title
+
+    def is_range(self) -> bool:
+        return self.start != self.end
+
+    def is_segment(self) -> bool:
+        return bool(self.index.sections) and len(self.start) == len(self.index.sections) and not self.is_range()
+
+    def normal(self) -> str:
+        """
+        Returns the canonical form, e.g. 'Genesis 1:1-3' or 'Berakhot 2a:3'.
+        """
+        if not self.start:
+            return self.title
+        start = ":".join(self._format(self.start))
+        if not self.is_range():
+            return f"{self.title} {start}"
+        common = 0
+        while common < len(self.start) and self.start[common] == self.end[common]:
+            common += 1
+        end = ":".join(self._format(self.end[common:], common))
+        return f"{self.title} {start}-{end}"
+
+    def he_normal(self) -> str:
+        """
+        Returns the Hebrew form, e.g. 'בראשית א:א'.
+        """
+        title = self.index.he_title or self.title
+        if not self.start:
+            return title
+        start = ":".join(self._format(self.start, he=True))
+        if not self.is_range():
+            return f"{title} {start}"
+        common = 0
+        while common < len(self.start) and self.start[common] == self.end[common]:
+            common += 1
+        return f"{title} {start}-{':'.join(self._format(self.end[common:], common, he=True))}"
+
+    def split(self) -> list["Ref"]:
+        """
+        Splits a range whose ends differ only in their last part into one ref per part,
+        e.g. Genesis 1:1-3 -> Genesis 1:1, Genesis 1:2, Genesis 1:3. Other refs are returned as is.
+        """
+        if not self.is_range() or self.start[:-1] != self.end[:-1]:
+            return [self]
+        return [
+            Ref(self.index, self.start[:-1] + [i], self.start[:-1] + [i])
+            for i in range(self.start[-1], self.end[-1] + 1)
+        ]
+
+    def follows(self, other: "Ref") -> bool:
+        """
+        Returns True if this ref is the segment right after the end of other, in the same section.
+        Sections are not merged: a range of sections comes back shaped differently from its parts.
+        """
+        return (
+            self.index.title == other.index.title
+            and self.is_segment()
+            and len(self.start) == len(other.end)
+            and self.start[:-1] == other.end[:-1]
+            and self.start[-1] == other.end[-1] + 1
+        )
+
+
+_index: TitleIndex | None = None
+
+
+def get_title_index() -> TitleIndex:
+    """
+    Returns the title index, loading it on first use.
+    """
+    global _index
+    if _index is None:
+        index = TitleIndex()
+        index.load(TITLE_INDEX)
+        if EXTRA_TITLE_INDEX:
+            try:
+                index.load(EXTRA_TITLE_INDEX)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load title index {EXTRA_TITLE_INDEX}: {e}")
+        from . import corpus
+        store = corpus.get_store()
+        if store is not None:
+            index.add_corpus_titles(store)
+        _index = index
+    return _index
+
+
+def _tokenize(text: str) -> list[str]:
+    text = _QUOTES_RE.sub("", _MARKS_RE.sub("", text))
+    text = text.replace("–", "-").replace("—", "-")
+    return _TOKEN_RE.findall(text)
+
+
+def _parse_address(tokens: list[str], entry: Title):
+    """
+    Parses the address tokens following a title into 0-based (start, end) indices.
+    Returns None if the tokens are not an address at all, raises InvalidRef if the address cannot exist.
+    """
+    parts = [[]]  # [[(number, side)], ...] for the start and, after a '-', the end
+    amud_next = False
+    for token in tokens:
+        current = parts[-1]
+        lowered = token.lower()
+        if token == "-":
+            if len(parts) > 1 or not current:
+                raise InvalidRef("Malformed range")
+            parts.append([])
+        elif lowered in _SECTION_WORDS:
+            continue
+        elif lowered in _AMUD_WORDS:
+            amud_next = True
+        elif token in _AMUD_ABBREVIATIONS or (amud_next and token in ("א", "ב")):
+            side = _AMUD_ABBREVIATIONS.get(token) or ("a" if token == "א" else "b")
+            if not current or current[-1][1] is not None:
+                raise InvalidRef("Misplaced amud")
+            current[-1] = (current[-1][0], side)
+            amud_next = False
+        elif token in (".", ":"):
+            # In Hebrew daf refs 'ב.' is 2a and 'ב:' is 2b; otherwise these just separate parts
+            if len(current) == 1 and current[0][1] is None and current[0][2:] == ("he",) and is_daf(_section_name(entry, 0)):
+                current[-1] = (current[-1][0], "a" if token == "." else "b")
+        elif token[0].isdigit():
+            side = token[-1] if token[-1] in "ab" else None
+            current.append((int(token.rstrip("ab")), side))
+        elif re.match("[א-ת]", token):
+            value = parse_hebrew_numeral(token)
+            if value is None:
+                return None
+            current.append((value, None, "he"))
+        else:
+            return None
+
+    start = [part[:2] for part in parts[0]]
+    end = [part[:2] for part in parts[1]] if len(parts) > 1 else None
+    if not start or (end is not None and not end):
+        if end is not None:
+            raise InvalidRef("Malformed range")
+        return [], []
+    depth = len(entry.sections)
+    if depth and len(start) > depth:
+        raise InvalidRef(f"Too many sections for {entry.title} (at most {depth})")
+    if end is not None and len(end) > len(start):
+        raise InvalidRef("Range end is more specific than its start")
+
+    def to_indices(address, first_level):
+        indices = []
+        for n, (number, side) in enumerate(address):
+            name = _section_name(entry, first_level + n)
+            if number < 1:
+                raise InvalidRef("Section numbers start at 1")
+            if side is not None and not is_daf(name):
+                raise InvalidRef(f"{entry.title} has no daf sides")
+            if first_level + n == 0 and entry.length and number > entry.length:
+                raise InvalidRef(f"{entry.title} has only {entry.length} {(entry.sections or ['sections'])[0].lower()}s")
+            indices.append((number - 1) * 2 + (side == "b") if is_daf(name) else number - 1)
+        return indices
+
+    start_indices = to_indices(start, 0)
+    if end is None:
+        # A bare daf is both its sides
+        if len(start) == 1 and is_daf(_section_name(entry, 0)) and start[0][1] is None:
+            return start_indices, [start_indices[0] + 1]
+        return start_indices, start_indices
+    offset = len(start) - len(end)
+    end_indices = start_indices[:offset] + to_indices(end, offset)
+    if end_indices < start_indices:
+        raise InvalidRef("Range ends before it starts")
+    if is_daf(_section_name(entry, offset)) and end[0][1] is None and len(end) == 1:
+        end_indices[-1] += 1
+    return start_indices, end_indices
+
+
+def _section_name(entry: Title, level: int) -> str:
+    return entry.sections[level] if level < len(entry.sections) else ""
+
+
+def parse(reference: str) -> Ref | None:
+    """
+    Parses a reference in English or Hebrew.
+    Returns None if its title is not in the title index, and raises InvalidRef if it cannot exist.
+    """
+    if not reference or not reference.strip():
+        raise InvalidRef("Empty reference")
+    index = get_title_index()
+    words = normalize_title(reference).split()
+    entry, count = index.lookup(words)
+    commentary, commentary_count = index.lookup_commentary(words, reference)
+    if commentary is not None and commentary_count > count:
+        entry, count = commentary, commentary_count
+    if entry is None:
+        return None
+    # Everything after the title words is parsed as an address
+    remainder = _strip_title_words(reference, count)
+    parsed = _parse_address(_tokenize(remainder), entry)
+    if parsed is None:
+        return None
+    return Ref(entry, *parsed)
+
+
+def _title_words(reference: str, count: int) -> str:
+    """
+    Returns the first count title words of a reference as written, as counted by normalize_title.
+    """
+    return reference[:len(reference) - len(_strip_title_words(reference, count))].strip(" ,._")
+
+
+def _strip_title_words(reference: str, count: int) -> str:
+    """
+    Returns what follows the first count title words of a reference, as counted by normalize_title.
+    """
+    words = 0
+    position = 0
+    for match in re.finditer(r"[^\s,._]+", reference):
+        if words == count:
+            return reference[match.start():]
+        # Words made only of quotes or marks disappear in normalize_title
+        if normalize_title(match.group()):
+            words += 1
+        position = match.end()
+    return reference[position:]
+
+
+@functools.lru_cache(maxsize=4096)
+def canonicalize(reference: str) -> str:
+    """
+    Returns the canonical form of a reference, or the reference with normalized whitespace
+    if its title is unknown. Raises InvalidRef for references that cannot exist.
+    """
+    ref = parse(reference)
+    if ref is None:
+        return " ".join(reference.split())
+    return ref.normal()
+
+
+def split_range(reference: str) -> list[str]:
+    """
+    Splits a range into its parts, e.g. 'Genesis 1:1-3' -> ['Genesis 1:1', 'Genesis 1:2', 'Genesis 1:3'].
+    """
+    ref = parse(reference)
+    if ref is None:
+        return [" ".join(reference.split())]
+    return [part.normal() for part in ref.split()]
+
+
+def merge_refs(references: list[str]) -> list[tuple[str, list[str]]]:
+    """
+    Merges runs of consecutive segments of the same section into range refs,
+    e.g. Genesis 1:1, Genesis 1:2, Genesis 1:3 -> Genesis 1:1-3.
+    Returns (request ref, [covered refs]) pairs in order.
+    """
+    merged: list[tuple[Ref | None, list[str]]] = []
+    for reference in references:
+        try:
+            ref = parse(reference)
+        except InvalidRef:
+            ref = None
+        if ref is not None and merged and merged[-1][0] is not None and ref.follows(merged[-1][0]):
+            last, covered = merged[-1]
+            merged[-1] = (Ref(last.index, last.start, ref.end), covered + [reference])
+            continue
+        merged.append((ref, [reference]))
+    return [
+        (ref.normal() if ref is not None and len(covered) > 1 else covered[0], covered)
+        for ref, covered in merged
+    ]
@@ -0,0 +1,267 @@
+"""
+Deadlines, retries, hedged requests and circuit breakers for the upstream requests.
+
+- Every tool call runs under a deadline (SEFARIA_TOOL_DEADLINE, per tool with
+  SEFARIA_TOOL_DEADLINES="get_texts=120,get_text=20"). The deadline is kept in a context
+  variable, so the upstream requests made for the tool get the time that is left as their timeout.
+- Idempotent requests failing with a transport error, a 5xx or a 429 status are retried with
+  exponential backoff and full jitter, within the deadline (and after the Retry-After pause
+  of the scheduler).
+- With SEFARIA_HEDGE=1, an idempotent request still unanswered after the p95 latency of its
+  endpoint is sent a second time, and the first answer wins.
+- A circuit breaker per endpoint opens after consecutive failures, failing requests fast
+  (and letting the cache serve stale entries) until a probe request succeeds after a cooldown.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+TOOL_DEADLINE = float(os.environ.get("SEFARIA_TOOL_DEADLINE", "60"))
+TOOL_DEADLINES = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (
+        item.partition("=") for item in os.environ.get("SEFARIA_TOOL_DEADLINES", "").split(",") if "=" in item
+    )
+}
+
+RETRIES = int(os.environ.get("SEFARIA_RETRIES", "2"))
+RETRY_BACKOFF = float(os.environ.get("SEFARIA_RETRY_BACKOFF", "0.2"))
+RETRY_BACKOFF_MAX = float(os.environ.get("SEFARIA_RETRY_BACKOFF_MAX", "2"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+HEDGE_ENABLED = os.environ.get("SEFARIA_HEDGE", "0") == "1"
+# Hedge delay until the endpoint has enough latency samples for its p95
+HEDGE_DELAY = float(os.environ.get("SEFARIA_HEDGE_DELAY", "1"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("SEFARIA_HEDGE_MIN_SAMPLES", "20"))
+
+BREAKER_THRESHOLD = int(os.environ.get("SEFARIA_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("SEFARIA_BREAKER_COOLDOWN", "30"))
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("sefaria_deadline", default=None)
+
+_stats = {"retries": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0, "circuit_rejections": 0}
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """
+    Raised instead of sending a request when the deadline of the tool call has passed.
+    """
+
+
+class CircuitOpenError(httpx.TransportError):
+    """
+    Raised instead of sending a request while the circuit of its endpoint is open.
+    """
+
+
+def tool_deadline(name: str) -> float:
+    """
+    Returns the deadline of the given tool, in seconds.
+    """
+    return TOOL_DEADLINES.get(name, TOOL_DEADLINE)
+
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """
+    Sets the deadline of the requests made in the block, seconds from now; an enclosing
+    earlier deadline still applies.
+    """
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """
+    Returns the seconds left before the current deadline, or None without a deadline.
+    """
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def request_timeout(default: float) -> float:
+    """
+    Returns the timeout of a request: the default, or less when the deadline is closer.
+    Raises DeadlineExceeded when the deadline has passed.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        _stats["deadline_exceeded"] += 1
+        raise DeadlineExceeded("Deadline exceeded before the request was sent")
+    return min(default, left)
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff(attempt: int) -> float:
+    """
+    Returns the delay before the given retry (0 for the first one): exponential backoff with full jitter.
+    """
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after threshold consecutive failures. While open, requests are rejected;
+    after the cooldown one probe request is let through, and closes the circuit if it succeeds.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self._probing and time.monotonic() - self.opened_at >= self.cooldown:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Upstream recovered, closing the circuit")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                logger.warning(f"Upstream failing ({self.failures} consecutive failures), opening the circuit")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        """
+        Lets another request probe, when the probe request was cancelled.
+        """
+        self._probing = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker()
+    return breaker
+
+
+def is_failure(error: Exception) -> bool:
+    """
+    Returns whether an error counts against the circuit: upstream errors, not client errors.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError) and not isinstance(error, (CircuitOpenError, DeadlineExceeded))
+
+
+async def hedged(send, delay: float):
+    """
+    Awaits send(); if it has not answered after delay seconds, sends a second request and
+    returns the first successful answer, cancelling the other request.
+    """
+    first = asyncio.ensure_future(send())
+    try:
+        done, _pending = await asyncio.wait({first}, timeout=delay)
+    except asyncio.CancelledError:
+        # asyncio.wait does not cancel what it waits for
+        first.cancel()
+        raise
+    if done:
+        return first.result()
+    _stats["hedges"] += 1
+    second = asyncio.ensure_future(send())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _stats["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call(endpoint: str, send, idempotent: bool, hedge_delay: float | None = None):
+    """
+    Runs send() under the circuit breaker of the endpoint, retrying idempotent requests
+    and hedging them when hedge_delay is given.
+    """
+    breaker = get_breaker(endpoint)
+    attempt = 0
+    while True:
+        if not breaker.allow():
+            _stats["circuit_rejections"] += 1
+            raise CircuitOpenError(f"Circuit open for {endpoint}: Sefaria is failing, retry later")
+        try:
+            if idempotent and hedge_delay is not None:
+                response = await hedged(send, hedge_delay)
+            else:
+                response = await send()
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except httpx.HTTPError as e:
+            if is_failure(e):
+                breaker.record_failure()
+            else:
+                # Sefaria answered, even if with a client error
+                breaker.record_success()
+            if not idempotent or attempt >= RETRIES or not is_retryable(e) or breaker.is_open:
+                raise
+            delay = backoff(attempt)
+            left = remaining()
+            if left is not None and left <= delay:
+                raise
+            attempt += 1
+            _stats["retries"] += 1
+            logger.debug(f"Retrying {endpoint} in {delay:.2f}s after {e!r}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return response
+
+
+def stats() -> dict:
+    """
+    Returns the counters of retries, hedges and circuit rejections, and the number of open circuits.
+    """
+    return dict(_stats, open_circuits=sum(breaker.is_open for breaker in _breakers.values()))
@@ -0,0 +1,264 @@
+"""
+Scheduling of the upstream requests: rate limits, priority lanes and fair queuing.
+
+- Every request to Sefaria takes a token from the bucket of its endpoint family (the texts,
+  related, calendar and search APIs), refilled at SEFARIA_RATE_LIMIT requests per second
+  (per family with SEFARIA_RATE_LIMITS="api/search-wrapper=2,api/v3/texts=30") up to
+  SEFARIA_RATE_BURST tokens.
+- Requests waiting for a token are served by lane: interactive tool calls first, then batch
+  fan-outs (get_texts, commentary texts, learning schedules, link traversals), then background
+  work (warm-up, revalidation of expired cache entries). Within a lane, client sessions take turns.
+- A 429 or 503 answer pauses its family for the Retry-After delay (or an exponential backoff
+  without one) and halves its rate, which recovers gradually with the following answers.
+"""
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+import httpx
+
+from . import metrics, resilience
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+# Lanes by decreasing priority
+LANES = (INTERACTIVE, BATCH, BACKGROUND)
+
+# Requests per second per endpoint family; 0 disables rate limiting
+RATE_LIMIT = float(os.environ.get("SEFARIA_RATE_LIMIT", "20"))
+RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, _, rate in (
+        item.partition("=") for item in os.environ.get("SEFARIA_RATE_LIMITS", "").split(",") if "=" in item
+    )
+}
+RATE_BURST = float(os.environ.get("SEFARIA_RATE_BURST", "40"))
+
+THROTTLE_STATUS_CODES = {429, 503}
+# Pause of a throttled family when Sefaria sends no Retry-After, doubled while it keeps throttling
+THROTTLE_BACKOFF = float(os.environ.get("SEFARIA_THROTTLE_BACKOFF", "1"))
+THROTTLE_BACKOFF_MAX = float(os.environ.get("SEFARIA_THROTTLE_BACKOFF_MAX", "60"))
+# Answers after which a throttled family is back to its full rate
+RATE_RECOVERY = 20
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("sefaria_lane", default=INTERACTIVE)
+_session: contextvars.ContextVar[str | None] = contextvars.ContextVar("sefaria_session", default=None)
+
+_stats = {"throttled_responses": 0, "max_queued": 0}
+
+
+@contextlib.contextmanager
+def lane(name: str):
+    """
+    Sends the upstream requests made in the block, and in the tasks it starts, in the given lane.
+    """
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+@contextlib.contextmanager
+def session(session_id: str | None):
+    """
+    Attributes the upstream requests made in the block to a client session, for fair queuing.
+    """
+    token = _session.set(session_id)
+    try:
+        yield
+    finally:
+        _session.reset(token)
+
+
+def flight_key(key: str) -> str:
+    """
+    Returns the single-flight key of a request made in the caller's lane. Requests are only shared
+    within a lane, so an interactive tool call never waits on a request queued in a lower lane.
+    """
+    return f"{_lane.get()}:{key}"
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """
+    Returns the delay in seconds of the Retry-After header of a response (seconds or an HTTP date),
+    or None without a valid one.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class EndpointFamily:
+    """
+    Token bucket of an endpoint family, and the requests waiting for its tokens by lane and session.
+    A rate of 0 lets requests through without limit, except while the family is paused.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float = RATE_BURST):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttles = 0
+        # Per lane, the waiting requests of each session, in the order the sessions take turns
+        self.queues: dict[str, OrderedDict[str | None, deque[asyncio.Future]]] = {name: OrderedDict() for name in LANES}
+        self._dispatcher: asyncio.Task | None = None
+
+    def queued(self, lane_name: str | None = None) -> int:
+        lanes = LANES if lane_name is None else (lane_name,)
+        return sum(len(waiters) for name in lanes for waiters in self.queues[name].values())
+
+    def _delay(self) -> float:
+        """
+        Returns the seconds until a token is available, refilling the bucket.
+        """
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.max_rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def _take(self):
+        if self.max_rate > 0:
+            self.tokens -= 1
+
+    def _next(self) -> asyncio.Future | None:
+        """
+        Returns the next waiting request: of the first lane with waiting requests, of the session
+        whose turn it is, skipping the requests given up in the meantime.
+        """
+        for name in LANES:
+            sessions = self.queues[name]
+            while sessions:
+                session_id, waiters = next(iter(sessions.items()))
+                future = waiters.popleft()
+                if waiters:
+                    sessions.move_to_end(session_id)
+                else:
+                    del sessions[session_id]
+                if not future.done():
+                    return future
+        return None
+
+    async def _dispatch(self):
+        while True:
+            delay = self._delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            future = self._next()
+            if future is None:
+                return
+            self._take()
+            future.set_result(None)
+
+    async def acquire(self, lane_name: str = INTERACTIVE, session_id: str | None = None):
+        """
+        Waits for a token, in turn with the other requests of the family.
+        Raises resilience.DeadlineExceeded when the deadline of the tool call passes first.
+        """
+        start = time.perf_counter()
+        if not self.queued() and self._delay() == 0:
+            self._take()
+            metrics.observe("queue", f"{self.name} {lane_name}", time.perf_counter() - start)
+            return
+        left = resilience.remaining()
+        if left is not None and self.paused_until - time.monotonic() >= left:
+            raise resilience.DeadlineExceeded(f"{self.name} is throttled beyond the deadline")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queues[lane_name].setdefault(session_id, deque()).append(future)
+        _stats["max_queued"] = max(_stats["max_queued"], self.queued())
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        try:
+            async with asyncio.timeout(left):
+                await future
+        except TimeoutError:
+            raise resilience.DeadlineExceeded(f"Deadline exceeded while waiting to send a request to {self.name}") from None
+        finally:
+            metrics.observe("queue", f"{self.name} {lane_name}", time.perf_counter() - start, error=future.cancelled())
+
+    def throttle(self, delay: float | None):
+        """
+        Pauses the family for delay seconds (a growing backoff when None) and halves its rate.
+        """
+        self.throttles += 1
+        if delay is None:
+            delay = min(THROTTLE_BACKOFF_MAX, THROTTLE_BACKOFF * 2 ** (self.throttles - 1))
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + delay)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+        if self.max_rate > 0:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+        logger.warning(f"Sefaria is throttling {self.name}, pausing it for {delay:.1f}s at {self.rate:g} requests/s")
+
+    def record_success(self):
+        self.throttles = 0
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / RATE_RECOVERY)
+
+
+_families: dict[str, EndpointFamily] = {}
+
+
+def get_family(endpoint: str) -> EndpointFamily:
+    family = _families.get(endpoint)
+    if family is None:
+        family = _families[endpoint] = EndpointFamily(endpoint, RATE_LIMITS.get(endpoint, RATE_LIMIT))
+    return family
+
+
+async def acquire(endpoint: str):
+    """
+    Waits until a request to the endpoint may be sent, in the lane and session of the caller.
+    """
+    await get_family(endpoint).acquire(_lane.get(), _session.get())
+
+
+def observe(endpoint: str, response: httpx.Response):
+    """
+    Adapts the rate of the endpoint family to an answer of Sefaria.
+    """
+    family = get_family(endpoint)
+    if response.status_code in THROTTLE_STATUS_CODES:
+        _stats["throttled_responses"] += 1
+        family.throttle(retry_after(response))
+    elif response.status_code < 500:
+        family.record_success()
+
+
+def stats() -> dict:
+    """
+    Returns the number of waiting requests per lane, the throttled answers and the paused families.
+    """
+    now = time.monotonic()
+    return dict(
+        {f"queued_{name}": sum(family.queued(name) for family in _families.values()) for name in LANES},
+        **_stats,
+        paused_families=sum(family.paused_until > now for family in _families.values()),
+    )
@@ -0,0 +1,414 @@
+"""
+Local full-text search over the imported corpus, an alternate backend for search_texts.
+
+The index is split into one shard per (book, language). Each shard maps a normalized
+term to its positional postings, stored as varint delta-encoded bytes:
+
+    doc_delta, position_count, position_delta, position_delta, ...
+
+Build or update the index after importing a corpus with:
+
+    python -m sefaria_jewish_library.search_index build
+
+Only books whose text changed since the last build are re-indexed.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+from array import array
+
+from . import corpus
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+SEARCH_INDEX = os.environ.get("SEFARIA_SEARCH_INDEX", os.path.join(corpus.DATA_DIR, "search_index.pickle"))
+SEARCH_BACKEND = os.environ.get(
+    "SEFARIA_SEARCH_BACKEND",
+    "local" if corpus.BACKEND in ("local", "offline") else "remote",
+).lower()
+
+INDEX_FORMAT = 1
+SNIPPET_WINDOW = 12
+
+# Cantillation marks and vowel points, excluding maqaf (05BE), paseq (05C0) and sof pasuq (05C3)
+_MARKS = "\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7"
+_TOKEN_RE = re.compile(rf"(?:[\w{_MARKS}]|[\"'׳״](?=\w))+")
+_STRIP_RE = re.compile(rf"[{_MARKS}\"'׳״]")
+_TAG_RE = re.compile(r"<[^>]+>")
+_HEBREW_RE = re.compile(r"[א-ת]")
+_FINAL_LETTERS = str.maketrans("ךםןףץ", "כמנפצ")
+
+HEBREW_PREFIXES = "והבלמשכ"
+MAX_PREFIX_LETTERS = 3
+
+
+def normalize(token: str) -> str:
+    """
+    Normalizes a token: strips niqqud, cantillation and geresh marks, folds final letters and case.
+    """
+    return _STRIP_RE.sub("", token).translate(_FINAL_LETTERS).lower()
+
+
+def prefix_variants(term: str):
+    """
+    Yields the term followed by the forms left after stripping Hebrew prefix letters (ו/ה/ב/ל/מ/ש/כ).
+    """
+    yield term
+    for _ in range(MAX_PREFIX_LETTERS):
+        if len(term) <= 2 or term[0] not in HEBREW_PREFIXES:
+            break
+        term = term[1:]
+        yield term
+
+
+def tokenize(text: str):
+    """
+    Returns the word spans of a text, with markup removed.
+    """
+    return list(_TOKEN_RE.finditer(_TAG_RE.sub("", text)))
+
+
+def query_terms(query: str) -> list[str]:
+    return [term for term in (normalize(m.group()) for m in _TOKEN_RE.finditer(query)) if term]
+
+
+def _encode_varints(values, out: bytearray):
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def _decode_varints(data: bytes):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+
+
+def encode_postings(postings: list[tuple[int, list[int]]]) -> bytes:
+    """
+    Encodes [(doc, [positions])] sorted by doc into delta-encoded varint bytes.
+    """
+    out = bytearray()
+    last_doc = 0
+    for doc, positions in postings:
+        _encode_varints((doc - last_doc, len(positions)), out)
+        last_pos = 0
+        for position in positions:
+            _encode_varints((position - last_pos,), out)
+            last_pos = position
+        last_doc = doc
+    return bytes(out)
+
+
+def decode_postings(data: bytes) -> dict[int, list[int]]:
+    """
+    Decodes postings bytes into a {doc: [positions]} dict.
+    """
+    postings = {}
+    values = _decode_varints(data)
+    doc = 0
+    for doc_delta in values:
+        doc += doc_delta
+        count = next(values)
+        positions = []
+        position = 0
+        for _ in range(count):
+            position += next(values)
+            positions.append(position)
+        postings[doc] = positions
+    return postings
+
+
+def match_phrase(positions: list[list[int]], slop: int) -> list[list[int]]:
+    """
+    Returns the in-order matches of the query terms, allowing at most `slop` words between consecutive terms.
+    Each match is the list of matched positions.
+    """
+    matches = []
+
+    def extend(match) -> bool:
+        if len(match) == len(positions):
+            matches.append(match)
+            return True
+        last = match[-1]
+        for position in positions[len(match)]:
+            if position <= last:
+                continue
+            if position - last - 1 > slop:
+                break
+            if extend(match + [position]):
+                return True
+        return False
+
+    for start in positions[0]:
+        extend([start])
+    return matches
+
+
+def segments_digest(conn: sqlite3.Connection, version_id: int) -> str:
+    """
+    Returns a checksum of the segments of a version, in order.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for seq, text in conn.execute("SELECT seq, text FROM segments WHERE version_id = ? ORDER BY seq", (version_id,)):
+        digest.update(f"{seq}\0{text}\0".encode())
+    return digest.hexdigest()
+
+
+class Shard:
+    """
+    The index of one book in one language.
+    """
+
+    __slots__ = ("title", "lang", "path", "version_id", "fingerprint", "seqs", "terms")
+
+    def __init__(self, title, lang, path, version_id, fingerprint):
+        self.title = title
+        self.lang = lang
+        self.path = path
+        self.version_id = version_id
+        self.fingerprint = fingerprint
+        self.seqs = array("I")
+        self.terms: dict[str, bytes] = {}
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "Shard":
+        shard = cls.__new__(cls)
+        for slot in cls.__slots__:
+            setattr(shard, slot, state[slot])
+        return shard
+
+    def build(self, rows):
+        """
+        Indexes (seq, text) rows of the book.
+        """
+        postings: dict[str, list[tuple[int, list[int]]]] = {}
+        for doc, (seq, text) in enumerate(rows):
+            self.seqs.append(seq)
+            doc_terms: dict[str, list[int]] = {}
+            for position, match in enumerate(tokenize(text)):
+                term = normalize(match.group())
+                if not term:
+                    continue
+                variants = prefix_variants(term) if self.lang == "he" else (term,)
+                for variant in variants:
+                    doc_terms.setdefault(variant, []).append(position)
+            for term, positions in doc_terms.items():
+                postings.setdefault(term, []).append((doc, positions))
+        self.terms = {sys.intern(term): encode_postings(p) for term, p in postings.items()}
+
+
+class SearchIndex:
+    """
+    Positional inverted index over the local corpus.
+    """
+
+    def __init__(self, shards: dict | None = None):
+        self.shards: dict[tuple[str, str], Shard] = shards or {}
+
+    @classmethod
+    def load(cls, path: str = SEARCH_INDEX) -> "SearchIndex":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported search index format in {path}")
+        return cls({key: Shard.from_dict(state) for key, state in data["shards"].items()})
+
+    def save(self, path: str = SEARCH_INDEX):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            # Shards are stored as plain dicts so the file does not depend on class import paths
+            shards = {key: shard.to_dict() for key, shard in self.shards.items()}
+            pickle.dump({"format": INDEX_FORMAT, "shards": shards}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def update(self, conn: sqlite3.Connection) -> dict:
+        """
+        Brings the index up to date with the corpus database, re-indexing only changed books.
+        """
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0}
+        seen = set()
+        versions = conn.execute(
+            "SELECT v.id, v.lang, b.title, b.index_title, b.categories, COUNT(s.seq), TOTAL(LENGTH(s.text)) "
+            "FROM versions v JOIN books b ON b.id = v.book_id JOIN segments s ON s.version_id = v.id "
+            "GROUP BY v.id"
+        ).fetchall()
+        for version_id, lang, title, index_title, categories, count, length in versions:
+            key = (title, lang)
+            seen.add(key)
+            path = "/".join(json.loads(categories or "[]") + [index_title])
+            # Re-imports give a book new version ids, so only the text itself decides whether it changed
+            fingerprint = (count, int(length), segments_digest(conn, version_id))
+            shard = self.shards.get(key)
+            if shard is not None and shard.fingerprint == fingerprint:
+                shard.version_id = version_id
+                shard.path = path
+                stats["unchanged"] += 1
+                continue
+            shard = Shard(title, lang, path, version_id, fingerprint)
+            shard.build(conn.execute(
+                "SELECT seq, text FROM segments WHERE version_id = ? ORDER BY seq", (version_id,)
+            ))
+            self.shards[key] = shard
+            stats["indexed"] += 1
+        for key in set(self.shards) - seen:
+            del self.shards[key]
+            stats["removed"] += 1
+        return stats
+
+    def search(self, query: str, slop: int = 2, filters=None, size: int = 10):
+        """
+        Returns the matching (score, shard, doc, match positions), best first, and the total hit count.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0
+        lang = "he" if _HEBREW_RE.search(query) else "en"
+        filters = [f.lower() for f in filters or []]
+        hits = []
+        for order, shard in enumerate(self.shards.values()):
+            if shard.lang != lang:
+                continue
+            if filters and not any(f in shard.path.lower() for f in filters):
+                continue
+            encoded = [shard.terms.get(term) for term in terms]
+            if not all(encoded):
+                continue
+            postings = [decode_postings(data) for data in encoded]
+            docs = set(postings[0]).intersection(*postings[1:])
+            for doc in docs:
+                matches = match_phrase([p[doc] for p in postings], slop)
+                if matches:
+                    span = min(m[-1] - m[0] for m in matches)
+                    score = len(matches) / (1 + span)
+                    hits.append((-score, order, doc, shard, matches[0]))
+        hits.sort(key=lambda hit: hit[:3])
+        return [(-score, shard, doc, match) for score, _order, doc, shard, match in hits[:size]], len(hits)
+
+
+def snippet(text: str, positions: list[int], window: int = SNIPPET_WINDOW) -> str:
+    """
+    Returns the words around the matched positions, with the matched words in <b> tags.
+    """
+    plain = _TAG_RE.sub("", text)
+    spans = list(_TOKEN_RE.finditer(plain))
+    if not spans:
+        return ""
+    matched = set(positions)
+    first = max(positions[0] - window, 0)
+    last = min(positions[-1] + window, len(spans) - 1)
+    parts = []
+    cursor = spans[first].start()
+    for position in range(first, last + 1):
+        span = spans[position]
+        parts.append(plain[cursor:span.start()])
+        parts.append(f"<b>{span.group()}</b>" if position in matched else span.group())
+        cursor = span.end()
+    return "".join(parts).strip()
+
+
+_index: SearchIndex | None = None
+_index_lock = threading.Lock()
+_missing = False
+
+
+def enabled() -> bool:
+    """
+    Returns whether searches should try the local index: the local search backend is on
+    and the index was not found missing.
+    """
+    return SEARCH_BACKEND == "local" and not _missing
+
+
+def get_index() -> SearchIndex | None:
+    """
+    Returns the loaded search index, or None when the local search backend is off or no index was built.
+    A missing index is reported once.
+    """
+    global _index, _missing
+    if _index is None and enabled():
+        # The first searches can come from several threads at once
+        with _index_lock:
+            if _index is None and not _missing:
+                if not os.path.exists(SEARCH_INDEX):
+                    logger.warning(f"Local search selected but no index found at {SEARCH_INDEX}")
+                    _missing = True
+                    return None
+                _index = SearchIndex.load(SEARCH_INDEX)
+    return _index
+
+
+def search(query: str, slop: int = 2, filters=None, size: int = 10):
+    """
+    Runs a search on the local index, returning a search-wrapper shaped response, or None if unavailable.
+    """
+    index = get_index()
+    store = corpus.get_store()
+    if index is None or store is None:
+        return None
+    results, total = index.search(query, slop, filters, size)
+    hits = []
+    for _score, shard, doc, match in results:
+        row = store.conn.execute(
+            "SELECT ref, text FROM segments WHERE version_id = ? AND seq = ?", (shard.version_id, shard.seqs[doc])
+        ).fetchone()
+        if row is None:
+            continue
+        hits.append({
+            "_source": {"ref": row["ref"], "heRef": store.he_ref(row["ref"]), "path": shard.path},
+            "highlight": {"naive_lemmatizer": [snippet(row["text"], match)]},
+        })
+    return {"hits": {"total": {"value": total}, "hits": hits}, "source": "local"}
+
+
+def build(db_path: str = corpus.CORPUS_DB, index_path: str = SEARCH_INDEX) -> dict:
+    """
+    Builds the search index for the corpus, or updates the existing one.
+    """
+    try:
+        index = SearchIndex.load(index_path)
+    except (OSError, ValueError, pickle.UnpicklingError):
+        index = SearchIndex()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        stats = index.update(conn)
+    finally:
+        conn.close()
+    index.save(index_path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sefaria_jewish_library.search_index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build or update the search index")
+    build_parser.add_argument("--db", default=corpus.CORPUS_DB)
+    build_parser.add_argument("--index", default=SEARCH_INDEX)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        stats = build(args.db, args.index)
+        print(f"Search index {args.index} updated: {stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,80 @@
-import requests
+import asyncio
+import datetime
+import httpx
+import itertools
 import json
 import logging
+import os
+from urllib.parse import quote, urlencode
 
-SEFARIA_API_BASE_URL = "https://sefaria.org"
+from . import cache, corpus, http_client, output, refs, scheduler, search_index, singleflight, texts
+from .logging_config import log_payload
 
-def get_request_json_data(endpoint, ref=None, param=None):
+logger = logging.getLogger('sefaria_jewish_library')
+
+SEFARIA_API_BASE_URL = os.environ.get("SEFARIA_API_BASE_URL", "https://sefaria.org").rstrip("/")
+# The calendar and search APIs are served from the www subdomain; overriding
+# SEFARIA_API_BASE_URL (e.g. with a local stand-in server) redirects them too
+SEFARIA_WWW_BASE_URL = os.environ.get("SEFARIA_API_BASE_URL", "https://www.sefaria.org").rstrip("/")
+
+# Concurrency and size limits of the get_texts batch tool
+BATCH_CONCURRENCY = int(os.environ.get("SEFARIA_BATCH_CONCURRENCY", "8"))
+MAX_BATCH_SIZE = int(os.environ.get("SEFARIA_MAX_BATCH_SIZE", "200"))
+
+# Maximum number of days of a get_learning_schedule range
+MAX_SCHEDULE_DAYS = int(os.environ.get("SEFARIA_MAX_SCHEDULE_DAYS", "62"))
+
+# Minimum number of hits fetched per search, so the next page is usually served from the cache
+SEARCH_PREFETCH = int(os.environ.get("SEFARIA_SEARCH_PREFETCH", "20"))
+
+# Default budgets of a get_text page
+PAGE_SEGMENTS = int(os.environ.get("SEFARIA_PAGE_SEGMENTS", "50"))
+PAGE_CHARS = int(os.environ.get("SEFARIA_PAGE_CHARS", "8000"))
+
+def _cache_key(endpoint, ref=None, param=None):
+    if endpoint == "api/calendars" and not param:
+        # Without parameters the API answers for today
+        return cache.calendar_key(diaspora=None)
+    return cache.make_key(endpoint, ref, param)
+
+async def fetch_shared(endpoint, key, fetch, revalidate=None, memory=True):
+    """
+    Returns the cached response for key, or fetches it, sharing one upstream request
+    between all concurrent callers asking for the same key in the same scheduler lane.
+    Expired responses are refreshed with revalidate(stale) when given.
+    With memory=False, the response is only cached on disk.
+    """
+    if revalidate is not None:
+        conditional = revalidate
+        revalidate = lambda stale: singleflight.do(scheduler.flight_key(f"{key}:revalidate"), lambda: conditional(stale))
+    return await cache.get_cache().get_or_fetch(
+        key, cache.ttl_for(endpoint), lambda: singleflight.do(scheduler.flight_key(key), fetch), revalidate, memory
+    )
+
+async def get_request_json_data(endpoint, ref=None, param=None, memory=True):
     """
     Helper function to make GET requests to the Sefaria API and parse the JSON response.
+    Refs are canonicalized first, so differently spelled refs share one cache entry.
+    Texts and links are read from the local corpus when the local backend is enabled,
+    and other responses are served from the response cache when possible
+    (from its disk tier only with memory=False).
     """
+    if ref:
+        try:
+            ref = refs.canonicalize(ref)
+        except refs.InvalidRef as e:
+            logger.warning(f"Invalid reference {ref}: {e}")
+            return None
+
+    if corpus.enabled() and ref and endpoint in corpus.ENDPOINTS:
+        # The corpus is read in a thread, not to block the other requests
+        data = await asyncio.to_thread(corpus.lookup, endpoint, ref, param)
+        if data is not None:
+            return data
+    if corpus.BACKEND == "offline" and endpoint in corpus.ENDPOINTS:
+        logger.info(f"{ref} is not in the local corpus")
+        return None
+
     url = f"{SEFARIA_API_BASE_URL}/{endpoint}"
 
     if ref:
@@ -16,34 +83,92 @@ def get_request_json_data(endpoint, ref=None, param=None):
     if param:
         url += f"?{param}"
 
+    key = _cache_key(endpoint, ref, param)
+    # ETag and Last-Modified of the cached response, kept next to it for conditional requests
+    validators_key = f"{key}:validators"
+    response_cache = cache.get_cache()
+
+    async def get(headers=None):
+        response = await http_client.request("GET", url, headers=headers)  # Raises for bad status codes
+        validators = {
+            name: response.headers[header]
+            for name, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+            if header in response.headers
+        }
+        if validators:
+            await response_cache.set_async(validators_key, validators, cache.ttl_for(endpoint) + cache.STALE_WHILE_REVALIDATE)
+        return response
+
+    async def fetch():
+        try:
+            response = await get()
+            data = response.json()
+            return data
+        # ValueError: a body that is not JSON, e.g. a maintenance page
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Error during API request: {e}")
+            return None
+
+    async def revalidate(stale):
+        validators = await response_cache.get_async(validators_key)
+        headers = {}
+        if validators is not cache.MISSING:
+            if "etag" in validators:
+                headers["If-None-Match"] = validators["etag"]
+            if "last_modified" in validators:
+                headers["If-Modified-Since"] = validators["last_modified"]
+        try:
+            response = await get(headers)
+            if response.status_code == 304:
+                return stale
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Error during API request: {e}")
+            return None
+
+    return await fetch_shared(endpoint, key, fetch, revalidate, memory)
+
+async def get_text_segments(reference) -> texts.CompactText | None:
+    """
+    Retrieves the primary version of a text (the Hebrew one, or the commentary's own) as a CompactText.
+    Compact texts are kept in the segment cache, in place of the API responses in the memory cache.
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        data = response.json()
-        return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error during API request: {e}")
+        reference = refs.canonicalize(reference)
+    except refs.InvalidRef as e:
+        logger.warning(f"Invalid reference {reference}: {e}")
+        return None
+    segment_cache = texts.get_segment_cache()
+    compact = segment_cache.get(reference)
+    if compact is not None:
+        return compact
+    data = await get_request_json_data("api/v3/texts/", reference, memory=False)
+    if not (data and data.get("versions")):
+        logger.warning(f"Could not retrieve text for {reference}")
         return None
+    compact = texts.CompactText.from_segments(reference, iter_segment_refs(reference, data['versions'][0]['text']))
+    segment_cache.set(reference, compact, cache.ttl_for("api/v3/texts/"))
+    return compact
 
-def get_commentary_text(ref):
+async def get_commentary_text(ref):
     """
     Retrieves the title and text of a commentary.
     """
-    data = get_request_json_data("api/v3/texts/", ref)
+    data = await get_request_json_data("api/v3/texts/", ref)
 
     if data and "versions" in data and len(data['versions']) > 0:
         title = data['title']
         text = data['versions'][0]['text']
         return title, text
     else:
-        print(f"Could not retrieve commentary text for {ref}")
+        logger.warning(f"Could not retrieve commentary text for {ref}")
         return None, None
 
-def get_parasha_data():
+async def get_parasha_data():
     """
     Retrieves the weekly Parasha data using the Calendars API.
     """
-    data = get_request_json_data("api/calendars")
+    data = await get_request_json_data("api/calendars")
 
     if data:
         calendar_items = data.get('calendar_items', [])
@@ -53,7 +178,7 @@ def get_parasha_data():
                 parasha_name = item.get('displayValue', {}).get('en')
                 return parasha_ref, parasha_name
     
-    print("Could not retrieve Parasha data.")
+    logger.warning("Could not retrieve Parasha data.")
     return None, None
 
 def get_first_verse(parasha_ref):
@@ -65,78 +190,439 @@ def get_first_verse(parasha_ref):
     else:
         return None
 
-def get_hebrew_text(parasha_ref):
+async def get_hebrew_text(parasha_ref):
     """
     Retrieves the Hebrew text and version title for the given verse.
     """
-    data = get_request_json_data("api/v3/texts/", parasha_ref)
+    data = await get_request_json_data("api/v3/texts/", parasha_ref)
 
     if data and "versions" in data and len(data['versions']) > 0:
         he_pasuk = data['versions'][0]['text']
         return  he_pasuk
     else:
-        print(f"Could not retrieve Hebrew text for {parasha_ref}")
+        logger.warning(f"Could not retrieve Hebrew text for {parasha_ref}")
         return None
 
-def get_english_text(parasha_ref):
+async def get_english_text(parasha_ref):
     """
     Retrieves the English text and version title for the given verse.
     """
-    data = get_request_json_data("api/v3/texts/", parasha_ref, "version=english")
+    data = await get_request_json_data("api/v3/texts/", parasha_ref, "version=english")
 
     if data and "versions" in data and len(data['versions']) > 0:
         en_vtitle = data['versions'][0]['versionTitle']
         en_pasuk = data['versions'][0]['text']
         return en_vtitle, en_pasuk
     else:
-        print(f"Could not retrieve English text for {parasha_ref}")
+        logger.warning(f"Could not retrieve English text for {parasha_ref}")
         return None, None
 
-async def get_commentaries(parasha_ref)-> list[str]:
+LANGUAGE_NAMES = {"he": "hebrew", "en": "english"}
+
+def _matches_version(version: dict, spec: str) -> bool:
+    language, _, title = spec.partition("|")
+    language = LANGUAGE_NAMES.get(language, language)
+    if language not in ("primary", "source") and language not in (
+        version.get('languageFamilyName'), LANGUAGE_NAMES.get(version.get('language'))
+    ):
+        return False
+    return not title or version.get('versionTitle') == title
+
+async def get_text_versions(ref, versions=("hebrew", "english")) -> list[dict]:
     """
-    Retrieves and filters commentaries on the given verse.
+    Retrieves several versions of a text in a single request.
+    
+    Args:
+        ref (str): The reference of the text
+        versions (list, optional): The versions, as a language ("hebrew", "english") optionally followed
+            by a version title, e.g. "english|The Contemporary Torah, Jewish Publication Society, 2006"
+    
+    Returns:
+        list: the versions found (dicts with versionTitle, languageFamilyName and text), in the requested order
+    """
+    versions = list(dict.fromkeys(versions))
+    param = urlencode([("version", spec) for spec in versions], quote_via=quote)
+    data = await get_request_json_data("api/v3/texts/", ref, param)
+    if not data or not data.get('versions'):
+        logger.warning(f"Could not retrieve versions {versions} of {ref}")
+        return []
+    found = []
+    for spec in versions:
+        version = next((v for v in data['versions'] if _matches_version(v, spec) and v not in found), None)
+        if version is None:
+            logger.warning(f"Version {spec} of {ref} is not available")
+        else:
+            found.append(version)
+    return found
+
+def _matches_commentator(linked_text, commentators) -> bool:
+    titles = linked_text.get('collectiveTitle') or {}
+    names = [
+        titles.get('en', ''), titles.get('he', ''),
+        linked_text.get('sourceRef') or '', linked_text.get('sourceHeRef') or '',
+    ]
+    return any(c.lower() in name.lower() for c in commentators for name in names if name)
+
+async def get_commentary_links(parasha_ref, commentators=None) -> list[dict]:
+    """
+    Retrieves the commentary links of the given verse, optionally only those of the given commentators
+    (matched against the commentary title or reference, e.g. "Rashi" or "רמב\"ן").
+    Raises refs.InvalidRef for references that cannot exist.
     """
-    data = get_request_json_data("api/related/", parasha_ref)
+    parasha_ref = refs.canonicalize(parasha_ref)
+    data = await get_request_json_data("api/related/", parasha_ref)
 
-    commentaries = []
+    links = []
     if data and "links" in data:
         for linked_text in data["links"]:
             if linked_text.get('type') == 'commentary':
-                commentaries.append(linked_text.get('sourceHeRef'))
+                if commentators and not _matches_commentator(linked_text, commentators):
+                    continue
+                links.append(linked_text)
 
-    return commentaries
+    return links
 
-async def get_text(reference: str) -> str:
+async def get_commentaries(parasha_ref, commentators=None)-> list[str]:
     """
-    Retrieves the text for a given reference.
+    Retrieves and filters commentaries on the given verse.
     """
-    return str(get_hebrew_text(reference))
+    links = await get_commentary_links(parasha_ref, commentators)
+    return [linked_text.get('sourceHeRef') for linked_text in links]
 
-async def get_daily_learnings(
+def iter_segments(text):
+    """
+    Yields the segments of a (possibly nested) text array in order, skipping empty ones.
+    """
+    if isinstance(text, list):
+        for item in text:
+            yield from iter_segments(item)
+    elif text:
+        yield text
+
+def iter_segment_refs(reference: str, text):
+    """
+    Lazily flattens a (possibly nested) text array into (segment ref, segment) pairs, skipping empty segments.
+    Segment refs are derived from the parsed reference; for unknown titles they are numbered within the reference.
+    """
+    try:
+        ref = refs.parse(reference)
+    except refs.InvalidRef:
+        ref = None
+    if ref is None:
+        for n, segment in enumerate(iter_segments(text), 1):
+            yield f"{reference} ({n})", segment
+        return
+
+    # Nested lists start at the level where the start and end of the ref part ways; the first item
+    # of the first list at each level is the start of the ref, the following ones count from the beginning
+    level = len(ref.start) if not ref.is_range() else next(
+        i for i, (a, b) in enumerate(zip(ref.start, ref.end)) if a != b
+    )
+
+    def walk(item, address, first):
+        if isinstance(item, list):
+            depth = len(address)
+            base = ref.start[depth] if first and depth < len(ref.start) else 0
+            for i, child in enumerate(item):
+                yield from walk(child, address + [base + i], first and i == 0)
+        elif item:
+            yield refs.Ref(ref.index, address, address).normal(), item
+
+    yield from walk(text, list(ref.start[:level]), True)
+
+def align_versions(reference: str, texts: list) -> list[tuple[str, list[str]]]:
+    """
+    Aligns the segments of several versions of a text by segment ref.
+    
+    Returns:
+        list: (segment ref, [segment of each version, or "" where a version lacks it]) pairs, in text order
+    """
+    aligned = {}
+    for i, text in enumerate(texts):
+        for segment_ref, segment in iter_segment_refs(reference, text):
+            aligned.setdefault(segment_ref, [""] * len(texts))[i] = segment
+    return list(aligned.items())
+
+async def get_text_page(
+    reference: str,
+    offset: int = 0,
+    max_segments: int | None = PAGE_SEGMENTS,
+    max_chars: int | None = PAGE_CHARS,
+    versions: list[str] | None = None,
+    text_format: str = texts.TEXT_FORMAT
+) -> dict:
+    """
+    Retrieves one page of the segments of a text, so large texts can be read piece by piece.
+    
+    Args:
+        reference (str): The reference of the text
+        offset (int, optional): Number of segments to skip. Use the next_offset of the previous page.
+        max_segments (int, optional): Maximum number of segments on the page, None for no limit.
+        max_chars (int, optional): Maximum number of characters on the page, None for no limit. A page always has at least one segment.
+        versions (list, optional): Versions to read side by side (see get_text_versions), fetched in one request.
+            Defaults to the Hebrew text only.
+        text_format (str, optional): Rendering of the segments, one of texts.TEXT_FORMATS.
+    
+    Returns:
+        dict: the ref, the (segment ref, segment) pairs of the page, its offset, and the next offset or None on the last page.
+            With versions, each segment is the list of the versions' segments, and "versions" lists the (language, version title) pairs.
+    """
+    reference = refs.canonicalize(reference)
+    version_titles = None
+    if versions:
+        found = await get_text_versions(reference, versions)
+        if not found:
+            raise ValueError(f"Could not retrieve text for {reference}")
+        version_titles = [(v.get('languageFamilyName') or v.get('language'), v.get('versionTitle')) for v in found]
+        all_segments = (
+            (segment_ref, [texts.clean(segment, text_format) for segment in segments])
+            for segment_ref, segments in align_versions(reference, [v['text'] for v in found])
+        )
+    else:
+        compact = await get_text_segments(reference)
+        if compact is None:
+            raise ValueError(f"Could not retrieve text for {reference}")
+        all_segments = compact.segments(text_format)
+    segments = itertools.islice(all_segments, max(0, offset), None)
+    page = []
+    chars = 0
+    next_offset = None
+    for segment_ref, segment in segments:
+        size = len(segment) if isinstance(segment, str) else sum(map(len, segment))
+        if page and (
+            (max_segments is not None and len(page) >= max_segments)
+            or (max_chars is not None and chars + size > max_chars)
+        ):
+            next_offset = offset + len(page)
+            break
+        page.append((segment_ref, segment))
+        chars += size
+    result = {"ref": reference, "segments": page, "offset": offset, "next_offset": next_offset}
+    if version_titles is not None:
+        result["versions"] = version_titles
+    return result
+
+def format_text_page(page: dict) -> str:
+    """
+    Formats a page of get_text_page with one line per segment (one line per version and segment when
+    reading several versions) and a footer pointing to the next page.
+    """
+    if "versions" in page:
+        lines = [f"{language}: {title}" for language, title in page["versions"]] + [""]
+        lines += [f"[{segment_ref}]\n" + "\n".join(segment) for segment_ref, segment in page["segments"]]
+    else:
+        lines = [f"[{segment_ref}] {segment}" for segment_ref, segment in page["segments"]]
+    if not page["segments"]:
+        return f"No segments of {page['ref']} from offset {page['offset']}."
+    first = page["offset"] + 1
+    last = page["offset"] + len(page["segments"])
+    if page["next_offset"] is not None:
+        lines.append(f"\n(segments {first}-{last} of {page['ref']}; more with offset={page['next_offset']})")
+    else:
+        lines.append(f"\n(segments {first}-{last} of {page['ref']}; end of text)")
+    return "\n".join(lines)
+
+def trim_text(text, max_chars: int) -> str:
+    """
+    Joins the segments of a text and trims the result to max_chars characters.
+    """
+    joined = " ".join(iter_segments(text))
+    if max_chars and len(joined) > max_chars:
+        return joined[:max_chars] + "..."
+    return joined
+
+async def get_commentaries_with_text(
+    parasha_ref,
+    commentators=None,
+    max_commentaries: int = 10,
+    max_chars: int = 500,
+    max_concurrency: int = BATCH_CONCURRENCY,
+    text_format: str = texts.TEXT_FORMAT
+) -> list[tuple[str, str | None]]:
+    """
+    Retrieves the commentaries on the given verse together with their texts, fetched concurrently.
+    
+    Args:
+        parasha_ref (str): The reference of the verse
+        commentators (list, optional): Only include these commentators, e.g. ["Rashi", "Ramban"]
+        max_commentaries (int, optional): Maximum number of commentaries to fetch. defaults to 10.
+        max_chars (int, optional): Maximum characters of text per commentary. defaults to 500.
+        max_concurrency (int, optional): Maximum number of texts fetched at the same time.
+    
+    Returns:
+        list: (Hebrew reference, text or None if it could not be retrieved) for each commentary
+    """
+    links = (await get_commentary_links(parasha_ref, commentators))[:max_commentaries]
+    commentary_texts = await get_commentary_texts(links, max_chars, max_concurrency, text_format)
+    return [(linked_text.get('sourceHeRef'), text) for linked_text, text in zip(links, commentary_texts)]
+
+async def get_commentary_texts(
+    links,
+    max_chars: int = 500,
+    max_concurrency: int = BATCH_CONCURRENCY,
+    text_format: str = texts.TEXT_FORMAT
+) -> list[str | None]:
+    """
+    Retrieves the texts of the given commentary links concurrently, rendered in text_format and
+    trimmed to max_chars, or None for those that could not be retrieved.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch(linked_text):
+        async with semaphore:
+            compact = await get_text_segments(linked_text.get('sourceRef') or linked_text.get('sourceHeRef'))
+        return trim_text(compact.render(text_format, " "), max_chars) if compact is not None else None
+
+    with scheduler.lane(scheduler.BATCH):
+        return list(await asyncio.gather(*(fetch(linked_text) for linked_text in links)))
+
+COMMENTARY_FIELDS = ("ref", "heRef", "commentator", "heCommentator", "category", "text")
+
+def commentary_record(linked_text: dict, fields=COMMENTARY_FIELDS, text=None) -> dict:
+    """
+    Returns the requested COMMENTARY_FIELDS of a commentary link, with its text if given.
+    """
+    titles = linked_text.get('collectiveTitle') or {}
+    values = {
+        "ref": linked_text.get('sourceRef'),
+        "heRef": linked_text.get('sourceHeRef'),
+        "commentator": titles.get('en'),
+        "heCommentator": titles.get('he'),
+        "category": linked_text.get('category'),
+        "text": text,
+    }
+    return {field: values[field] for field in fields if values[field]}
+
+async def get_commentaries_json(
+    parasha_ref,
+    commentators=None,
+    fields=None,
+    include_text: bool = False,
+    max_commentaries: int = 10,
+    max_chars: int = 500,
+    text_format: str = texts.TEXT_FORMAT
+) -> str:
+    """
+    Retrieves the commentaries on the given verse as compact JSON, with the requested COMMENTARY_FIELDS.
+    With include_text, the texts of the first max_commentaries commentaries are included, rendered in text_format.
+    """
+    fields = output.select_fields(fields, COMMENTARY_FIELDS if include_text else COMMENTARY_FIELDS[:-1])
+    links = await get_commentary_links(parasha_ref, commentators)
+    commentary_texts = [None] * len(links)
+    if include_text and "text" in fields:
+        links = links[:max_commentaries]
+        commentary_texts = await get_commentary_texts(links, max_chars, text_format=text_format)
+    return output.dumps([commentary_record(linked_text, fields, text) for linked_text, text in zip(links, commentary_texts)])
+
+async def get_text(
+    reference: str,
+    offset: int = None,
+    max_segments: int = None,
+    max_chars: int = None,
+    languages: list[str] = None,
+    versions: list[str] = None,
+    text_format: str = texts.TEXT_FORMAT
+) -> str:
+    """
+    Retrieves the text for a given reference, with one line per segment rendered in text_format (see texts).
+    When any of offset, max_segments or max_chars is given, returns one page of segments (see get_text_page).
+    When languages (e.g. ["hebrew", "english"]) or versions (e.g. ["english|Version title"]) ask for more than
+    the Hebrew text, all of them are fetched in one request and returned side by side, segment by segment.
+    Raises refs.InvalidRef for references that cannot exist.
+    """
+    specs = list(dict.fromkeys((versions or []) + (languages or [])))
+    if specs and specs != ["hebrew"]:
+        paged = offset is not None or max_segments is not None or max_chars is not None
+        page = await get_text_page(
+            reference,
+            offset if offset is not None else 0,
+            max_segments if max_segments is not None or not paged else PAGE_SEGMENTS,
+            max_chars if max_chars is not None or not paged else PAGE_CHARS,
+            specs,
+            text_format,
+        )
+        return format_text_page(page)
+    if offset is not None or max_segments is not None or max_chars is not None:
+        page = await get_text_page(
+            reference,
+            offset if offset is not None else 0,
+            max_segments if max_segments is not None else PAGE_SEGMENTS,
+            max_chars if max_chars is not None else PAGE_CHARS,
+            text_format=text_format,
+        )
+        return format_text_page(page)
+    reference = refs.canonicalize(reference)
+    compact = await get_text_segments(reference)
+    if compact is None:
+        raise ValueError(f"Could not retrieve text for {reference}")
+    return compact.render(text_format)
+
+async def get_texts(
+    references: list[str],
+    max_concurrency: int = BATCH_CONCURRENCY,
+    text_format: str = texts.TEXT_FORMAT
+) -> list[tuple[str, str | None, str | None]]:
+    """
+    Retrieves the Hebrew texts of many references at once, rendered in text_format.
+    
+    References are deduplicated and canonicalized, runs of adjacent segments are fetched as one range,
+    and the requests run concurrently, at most max_concurrency at a time.
+    
+    Returns:
+        list: (reference, text, error) for each given reference, in the given order
+    """
+    if len(references) > MAX_BATCH_SIZE:
+        raise ValueError(f"Too many references: {len(references)} (at most {MAX_BATCH_SIZE})")
+    canonical = []
+    invalid = {}
+    for ref in references:
+        try:
+            canonical.append(refs.canonicalize(ref))
+        except refs.InvalidRef as e:
+            canonical.append(None)
+            invalid[ref] = f"Invalid reference: {e}"
+    unique = list(dict.fromkeys(ref for ref in canonical if ref))
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    found: dict[str, tuple[str | None, str | None]] = {}
+
+    async def fetch_one(ref):
+        async with semaphore:
+            compact = await get_text_segments(ref)
+        found[ref] = (compact.render(text_format), None) if compact is not None else (None, f"Could not retrieve text for {ref}")
+
+    async def fetch_range(range_ref, covered):
+        async with semaphore:
+            compact = await get_text_segments(range_ref)
+        if compact is not None and list(compact.refs) == covered:
+            for index, ref in enumerate(covered):
+                found[ref] = (compact.segment(index, text_format), None)
+        else:
+            # The range did not line up with the requested segments; fetch them one by one
+            await asyncio.gather(*(fetch_one(ref) for ref in covered))
+
+    with scheduler.lane(scheduler.BATCH):
+        await asyncio.gather(*(
+            fetch_range(range_ref, covered) if len(covered) > 1 else fetch_one(range_ref)
+            for range_ref, covered in refs.merge_refs(unique)
+        ))
+    return [
+        (original, None, invalid[original]) if ref is None else (original, *found[ref])
+        for original, ref in zip(references, canonical)
+    ]
+
+async def get_calendar_data(
     diaspora: bool = True,
     custom: str = None,
     year: int = None,
     month: int = None,
     day: int = None,
     timezone: str = None
-) -> str:
+) -> dict:
     """
-    Get the daily or weekly learning schedule for a given date from Sefaria's calendar API.
-    
-    Args:
-        diaspora (bool, optional): When True, returns weekly Torah reading for diaspora. 
-                                 When False, returns Torah reading for Israel. Defaults to True.
-        custom (str, optional): If available, the weekly Haftarah will be returned for the selected custom.
-        year (int, optional): Year for the date. Must be used with month and day, or API falls back to current date.
-        month (int, optional): Month for the date. Must be used with year and day, or API falls back to current date.
-        day (int, optional): Day for the date. Must be used with year and month, or API falls back to current date.
-        timezone (str, optional): Timezone name in accordance with IANA Standards. 
-                                Defaults to client's timezone if not specified.
-    
-    Returns:
-        str: Formatted daily/weekly learning schedule
+    Retrieves the raw calendar data for a given date, cached per (diaspora, custom, date, timezone).
+    Raises httpx.HTTPError or json.JSONDecodeError on failure.
     """
-    url = "https://www.sefaria.org/api/calendars"
+    url = f"{SEFARIA_WWW_BASE_URL}/api/calendars"
     
     # Build query parameters
     params = {}
@@ -157,15 +643,83 @@ async def get_daily_learnings(
     # Add timezone parameter if provided
     if timezone:
         params["timezone"] = timezone
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
+
+    async def fetch():
+        response = await http_client.request("GET", url, params=params)
         
-        logging.debug(f"Sefaria's Calendar API response: {response.text}")
+        log_payload(logger, "Sefaria's Calendar API response", lambda: response.text)
         
         # Parse JSON response
-        data = response.json()
+        return response.json()
+
+    key = cache.calendar_key(bool(diaspora), custom, year, month, day, timezone)
+    return await fetch_shared("api/calendars", key, fetch)
+
+LEARNING_FIELDS = ("title", "heTitle", "display", "heDisplay", "ref", "heRef", "category", "order", "description", "aliyot")
+
+def learning_record(item: dict, fields=LEARNING_FIELDS) -> dict:
+    """
+    Returns the requested LEARNING_FIELDS of a calendar item.
+    """
+    values = {
+        "title": lambda: item.get("title", {}).get("en"),
+        "heTitle": lambda: item.get("title", {}).get("he"),
+        "display": lambda: item.get("displayValue", {}).get("en"),
+        "heDisplay": lambda: item.get("displayValue", {}).get("he"),
+        "ref": lambda: item.get("ref"),
+        "heRef": lambda: item.get("heRef"),
+        "category": lambda: item.get("category"),
+        "order": lambda: item.get("order"),
+        "description": lambda: (item.get("description") or {}).get("en"),
+        "aliyot": lambda: (item.get("extraDetails") or {}).get("aliyot"),
+    }
+    record = {}
+    for field in fields:
+        value = values[field]()
+        if value or value == 0:
+            record[field] = value
+    return record
+
+async def get_daily_learnings(
+    diaspora: bool = True,
+    custom: str = None,
+    year: int = None,
+    month: int = None,
+    day: int = None,
+    timezone: str = None,
+    output_format: str = None,
+    fields: list[str] = None
+) -> str:
+    """
+    Get the daily or weekly learning schedule for a given date from Sefaria's calendar API.
+    
+    Args:
+        diaspora (bool, optional): When True, returns weekly Torah reading for diaspora. 
+                                 When False, returns Torah reading for Israel. Defaults to True.
+        custom (str, optional): If available, the weekly Haftarah will be returned for the selected custom.
+        year (int, optional): Year for the date. Must be used with month and day, or API falls back to current date.
+        month (int, optional): Month for the date. Must be used with year and day, or API falls back to current date.
+        day (int, optional): Day for the date. Must be used with year and month, or API falls back to current date.
+        timezone (str, optional): Timezone name in accordance with IANA Standards. 
+                                Defaults to client's timezone if not specified.
+        output_format (str, optional): "text", or "json" for compact JSON. Defaults to SEFARIA_OUTPUT_FORMAT.
+        fields (list, optional): LEARNING_FIELDS of each item in the JSON output. Defaults to all of them.
+    
+    Returns:
+        str: Formatted daily/weekly learning schedule
+    """
+    as_json = output.is_json(output_format)
+    if as_json:
+        fields = output.select_fields(fields, LEARNING_FIELDS)
+    try:
+        data = await get_calendar_data(diaspora, custom, year, month, day, timezone)
+        
+        if as_json:
+            return output.dumps({
+                "date": data.get("date"),
+                "timezone": data.get("timezone"),
+                "items": [learning_record(item, fields) for item in data.get("calendar_items", [])],
+            })
         
         # Format the results
         result_lines = []
@@ -225,28 +779,130 @@ async def get_daily_learnings(
     
     except json.JSONDecodeError as e:
         return f"Error: Failed to parse JSON response: {str(e)}"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return f"Error during calendar API request: {str(e)}"
 
-async def search_texts(query: str, slop: int =2, filters=None, size=10):
+def _parse_date(value, name: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value!r}, expected YYYY-MM-DD")
+
+def _matches_cycle(item: dict, cycles) -> bool:
+    titles = [item.get("title", {}).get("en", ""), item.get("title", {}).get("he", "")]
+    return any(c.lower() in title.lower() for c in cycles for title in titles if title)
+
+async def get_learning_schedule(
+    start_date: str = None,
+    end_date: str = None,
+    days: int = None,
+    diaspora: bool = True,
+    custom: str = None,
+    timezone: str = None,
+    cycles: list[str] = None,
+    max_concurrency: int = BATCH_CONCURRENCY
+) -> str:
     """
-    Search for texts in the Sefaria library.
+    Get the learning schedule of a range of days as a compact table, one row per day and one column per cycle.
+    The days are fetched concurrently, and days already fetched are served from the cache.
     
     Args:
-        query (str): The search query
-        slop (int, optional): The maximum distance between each query word in the resulting document. 0 means an exact match must be found. defaults to 2
-        filters (list, optional): Filters to apply to the text path in English (Examples: "Shulkhan Arukh", "maimonides", "talmud").
-        size (int, optional): Number of results to return. defaults to 10.
-        
+        start_date (str, optional): First day, as YYYY-MM-DD. Defaults to today.
+        end_date (str, optional): Last day, as YYYY-MM-DD. Defaults to start_date + days - 1.
+        days (int, optional): Number of days, when end_date is not given. Defaults to 7.
+        diaspora (bool, optional): Torah reading for diaspora (True) or Israel (False). Defaults to True.
+        custom (str, optional): Custom of the Haftarah.
+        timezone (str, optional): IANA timezone, used for today's date and by the calendar API.
+        cycles (list, optional): Only include these cycles (matched against the cycle title, e.g. "Daf Yomi", "Parashat Hashavua").
+        max_concurrency (int, optional): Maximum number of days fetched at the same time.
+    
     Returns:
-        str: Formatted search results
+        str: The schedule table
+    """
+    start = _parse_date(start_date, "start_date") if start_date else cache.today(timezone)
+    if end_date:
+        end = _parse_date(end_date, "end_date")
+    else:
+        end = start + datetime.timedelta(days=(days or 7) - 1)
+    count = (end - start).days + 1
+    if count < 1:
+        raise ValueError("end_date is before start_date")
+    if count > MAX_SCHEDULE_DAYS:
+        raise ValueError(f"Too many days: {count} (at most {MAX_SCHEDULE_DAYS})")
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch(date):
+        async with semaphore:
+            try:
+                return await get_calendar_data(diaspora, custom, date.year, date.month, date.day, timezone)
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                logger.warning(f"Could not retrieve the calendar of {date}: {e}")
+                return None
+
+    dates = [start + datetime.timedelta(days=i) for i in range(count)]
+    with scheduler.lane(scheduler.BATCH):
+        results = await asyncio.gather(*(fetch(date) for date in dates))
+
+    # One column per cycle, in the calendar's order
+    columns = {}
+    rows = []
+    for date, data in zip(dates, results):
+        if data is None:
+            rows.append((date, None))
+            continue
+        cells = {}
+        for item in sorted(data.get("calendar_items", []), key=lambda item: item.get("order", 0)):
+            if cycles and not _matches_cycle(item, cycles):
+                continue
+            title = item.get("title", {}).get("en") or item.get("title", {}).get("he") or "Unknown"
+            columns.setdefault(title, None)
+            cells[title] = item.get("displayValue", {}).get("en") or item.get("ref", "")
+        rows.append((date, cells))
+
+    if not columns:
+        return f"No learning items found from {start} to {end}" + (f" for {', '.join(cycles)}." if cycles else ".")
+    lines = [
+        f"Learning Schedule from {start} to {end} ({'diaspora' if diaspora else 'Israel'})",
+        " | ".join(["Date", *columns]),
+    ]
+    for date, cells in rows:
+        if cells is None:
+            lines.append(f"{date} | Error: could not retrieve the calendar")
+        else:
+            lines.append(" | ".join([f"{date} {date.strftime('%a')}", *(cells.get(title, "-") for title in columns)]))
+    return "\n".join(lines)
+
+def search_key(query: str, slop: int, filters=None) -> str:
+    """
+    Builds the cache key of a search, whatever its size: the query with its whitespace collapsed
+    and case folded, the slop and the sorted filters.
     """
-    # Use the www subdomain as specified in the documentation
-    url = "https://www.sefaria.org/api/search-wrapper"
+    return cache.make_key("api/search-wrapper", " ".join(query.split()).casefold(), slop, sorted(set(filters or [])))
+
+async def get_search_hits(query: str, slop: int = 2, filters=None, count: int = 10):
+    """
+    Retrieves a search-wrapper response holding at least the first count hits (or all of them, if fewer).
+
+    Results are cached per search_key together with the number of hits fetched: a search for fewer
+    hits than cached is served from the cached hits, and only a search for more fetches again,
+    at least SEARCH_PREFETCH hits.
+    Raises httpx.HTTPError, or ValueError for a body that is not JSON, when the search fails and nothing is cached.
+    """
+    key = search_key(query, slop, filters)
+    response_cache = cache.get_cache()
+    entry = await response_cache.get_async(key)
+    if entry is not cache.MISSING:
+        fetched = len(entry["data"].get("hits", {}).get("hits", []))
+        # A response with fewer hits than asked for holds all of them
+        if entry["size"] >= count or fetched < entry["size"]:
+            return entry["data"]
+
+    size = max(count, SEARCH_PREFETCH)
+    url = f"{SEFARIA_WWW_BASE_URL}/api/search-wrapper"
     
     # Build the request payload
     payload = {
-        "query": query,
+        "query": " ".join(query.split()),
         "type": "text",
         "field":  "naive_lemmatizer",
         "size": size,
@@ -259,70 +915,115 @@ async def search_texts(query: str, slop: int =2, filters=None, size=10):
      
     }
     if filters:
-        payload["filters"] = filters
+        payload["filters"] = sorted(set(filters))
 
     
-    # Make the POST request
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+    async def fetch():
+        response = await http_client.request("POST", url, idempotent=True, json=payload)
         
-        logging.debug(f"Sefaria's Search API response: {response.text}")
+        log_payload(logger, "Sefaria's Search API response", lambda: response.text)
         
         # Parse JSON response
-        data = response.json()
-        
-        print(data)
-        
-        # Format the results
-        results = []
+        return response.json()
+
+    try:
+        data = await singleflight.do(scheduler.flight_key(f"{key}:{size}"), fetch)
+    except (httpx.HTTPError, ValueError):
+        stale = await response_cache.get_stale_async(key)
+        if stale is cache.MISSING:
+            raise
+        logger.info(f"Serving stale search results for {key}")
+        response_cache.stale_hits += 1
+        return stale["data"]
+    await response_cache.set_async(key, {"size": size, "data": data}, cache.ttl_for("api/search-wrapper"))
+    return data
+
+SEARCH_FIELDS = ("ref", "heRef", "path", "snippet")
+
+def _search_snippet(hit: dict) -> str:
+    # Get highlighted text if available (this contains the search term highlighted)
+    for highlights in hit.get("highlight", {}).values():
+        if highlights:
+            # Join multiple highlights with ellipses
+            return " [...] ".join(highlights)
+    # If no highlight, use content from the source
+    source = hit["_source"]
+    for field_name in ["naive_lemmatizer", "exact"]:
+        content = source.get(field_name)
+        if content and isinstance(content, str):
+            # Limit to a reasonable snippet length
+            return content[:300] + ("..." if len(content) > 300 else "")
+    return ""
+
+def search_record(hit: dict, fields=SEARCH_FIELDS) -> dict:
+    """
+    Returns the requested SEARCH_FIELDS of a search hit, computing only those.
+    """
+    source = hit["_source"]
+    record = {}
+    for field in fields:
+        value = _search_snippet(hit) if field == "snippet" else source.get(field)
+        if value:
+            record[field] = value
+    return record
+
+async def search_texts(query: str, slop: int =2, filters=None, size=10, offset=0, output_format=None, fields=None):
+    """
+    Search for texts in the Sefaria library.
+    
+    Args:
+        query (str): The search query
+        slop (int, optional): The maximum distance between each query word in the resulting document. 0 means an exact match must be found. defaults to 2
+        filters (list, optional): Filters to apply to the text path in English (Examples: "Shulkhan Arukh", "maimonides", "talmud").
+        size (int, optional): Number of results to return. defaults to 10.
+        offset (int, optional): Number of results to skip, to get the next page of results. defaults to 0.
+        output_format (str, optional): "text", or "json" for compact JSON. defaults to SEFARIA_OUTPUT_FORMAT.
+        fields (list, optional): SEARCH_FIELDS of each hit in the JSON output. defaults to all of them.
         
-        # Check if we have hits in the response
-        if "hits" in data and "hits" in data["hits"]:
-            # Get the actual total hits count
-            total_hits = data["hits"].get("total", 0)
-            # Handle different response formats
-            if isinstance(total_hits, dict) and "value" in total_hits:
-                total_hits = total_hits["value"]
-         
-            # Process each hit
-            for hit in data["hits"]["hits"]:
-                source = hit["_source"]
-                ref = source["ref"]
-                heRef = source["heRef"]
-                
-                # Get the content snippet
-                text_snippet = ""
-                
-                # Get highlighted text if available (this contains the search term highlighted)
-                if "highlight" in hit:
-                    for field_name, highlights in hit["highlight"].items():
-                        if highlights and len(highlights) > 0:
-                            # Join multiple highlights with ellipses
-                            text_snippet = " [...] ".join(highlights)
-                            break
-                
-                # If no highlight, use content from the source
-                if not text_snippet:
-                    # Try different fields that might contain content
-                    for field_name in ["naive_lemmatizer", "exact"]:
-                        if field_name in source and source[field_name]:
-                            content = source[field_name]
-                            if isinstance(content, str):
-                                # Limit to a reasonable snippet length
-                                text_snippet = content[:300] + ("..." if len(content) > 300 else "")
-                                break
-             
-                # Add the formatted result
-                results.append(f"Reference: {ref}\n Hebrew Reference: {heRef}\n Highlight: {text_snippet}\n")
+    Returns:
+        str: Formatted search results
+    """
+    as_json = output.is_json(output_format)
+    fields = output.select_fields(fields, SEARCH_FIELDS) if as_json else ("ref", "heRef", "snippet")
+
+    # Search the local index if there is one, otherwise Sefaria, unless the same search was made recently
+    try:
+        # The local search runs in a thread, not to block the other requests
+        data = None
+        if search_index.enabled():
+            data = await asyncio.to_thread(search_index.search, query, slop, filters, offset + size)
+        if data is None:
+            data = await get_search_hits(query, slop, filters, offset + size)
         
+        hits = data.get("hits", {})
+        # Get the actual total hits count, handling different response formats
+        total_hits = hits.get("total", 0)
+        if isinstance(total_hits, dict):
+            total_hits = total_hits.get("value", 0)
+        # Process each hit of the page, computing only the fields shown
+        records = [search_record(hit, fields) for hit in hits.get("hits", [])[offset:offset + size]]
+        next_offset = offset + len(records) if isinstance(total_hits, int) and total_hits > offset + len(records) else None
+
+        if as_json:
+            result = {"total": total_hits, "offset": offset, "hits": records}
+            if next_offset is not None:
+                result["next_offset"] = next_offset
+            return output.dumps(result)
+
         # Return a message if no results were found
-        if len(results) <= 1:
+        if not records:
+            if offset:
+                return f"No more results found for '{query}'."
             return f"No results found for '{query}'."
-        logging.debug(f"formated results: {results}")
+        results = [
+            f"Reference: {record.get('ref', '')}\n Hebrew Reference: {record.get('heRef', '')}\n Highlight: {record.get('snippet', '')}\n"
+            for record in records
+        ]
+        if next_offset is not None:
+            results.append(f"Results {offset + 1}-{next_offset} of {total_hits}; use offset {next_offset} for the next page.")
         return "\n".join(results)
     
     except json.JSONDecodeError as e:
         return f"Error: Failed to parse JSON response: {str(e)}"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return f"Error during search API request: {str(e)}"
@@ -7,17 +7,14 @@ import os
 import logging
 import sys
 import json
+import time
+import functools
+import jsonschema
+from mcp.shared.version import SUPPORTED_PROTOCOL_VERSIONS
 from .sefaria_handler import * 
+from . import fast_start, http_client, link_graph, metrics, output, parallels, resilience, scheduler, texts, warmup
+from .logging_config import configure_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr),
-        logging.FileHandler('sefaria_jewish_library.log', encoding='utf-8')
-    ]
-)
 logger = logging.getLogger('sefaria_jewish_library')
 
 SEFARIA_API_URL = "https://sefaria.org"
@@ -25,6 +22,21 @@ SEFARIA_API_URL = "https://sefaria.org"
 
 server = Server("sefaria_jewish_library")
 
+
+def session_id() -> str | None:
+    """
+    Returns the id of the client session of the current request: its Mcp-Session-Id header
+    over HTTP, or the session object otherwise. Used to queue the upstream requests fairly.
+    """
+    try:
+        context = server.request_context
+    except LookupError:
+        return None
+    headers = getattr(context.request, "headers", None)
+    if headers is not None and headers.get("mcp-session-id"):
+        return headers["mcp-session-id"]
+    return str(id(context.session))
+
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
     """
@@ -32,10 +44,17 @@ async def handle_list_tools() -> list[types.Tool]:
     Each tool specifies its arguments using JSON Schema validation.
     """
     logger.debug("Handling list_tools request")
+    return tool_definitions()
+
+@functools.cache
+def tool_definitions() -> list[types.Tool]:
+    """
+    Returns the tool definitions, built once: they only depend on the configuration.
+    """
     return [
         types.Tool(
             name="get_text",
-            description="get a jewish text from the jewish library",
+            description="get a jewish text from the jewish library. Large texts (a whole chapter, siman or tractate) can be read in pages of segments, and several languages can be read side by side.",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -43,13 +62,60 @@ async def handle_list_tools() -> list[types.Tool]:
                         "type": "string",
                         "description": "The reference of the jewish text, e.g. 'שולחן ערוך אורח חיים סימן א' or 'Genesis 1:1'",                               
                     },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Read the text in pages: number of segments to skip. Use the offset given at the end of the previous page.",
+                        "minimum": 0,
+                    },
+                    "max_segments": {
+                        "type": "integer",
+                        "description": f"Read the text in pages: maximum number of segments per page (default {PAGE_SEGMENTS}).",
+                        "minimum": 1,
+                    },
+                    "max_chars": {
+                        "type": "integer",
+                        "description": f"Read the text in pages: maximum number of characters per page (default {PAGE_CHARS}). A page always has at least one segment.",
+                        "minimum": 1,
+                    },
+                    "languages": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": ["hebrew", "english"]},
+                        "description": "Languages to return side by side, segment by segment, e.g. ['hebrew', 'english']. Default: Hebrew only.",
+                    },
+                    "versions": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Specific versions to return side by side, as 'language|version title', e.g. 'english|The Contemporary Torah, Jewish Publication Society, 2006'.",
+                    },
+                    "text_format": texts.schema_property(),
                 },
                 "required": ["reference"],
             },
         ),
+        types.Tool(
+            name="get_texts",
+            description="get many jewish texts from the jewish library at once, e.g. a whole sugya or all the sources of a source sheet",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "references": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "The references of the jewish texts, e.g. ['Genesis 1:1', 'Genesis 1:2', 'Berakhot 2a']",
+                    },
+                    "max_concurrency": {
+                        "type": "integer",
+                        "description": "Maximum number of texts fetched at the same time.",
+                        "default": BATCH_CONCURRENCY
+                    },
+                    "text_format": texts.schema_property(),
+                },
+                "required": ["references"],
+            },
+        ),
         types.Tool(
             name="get_commentaries",
-            description="get a list of references of commentaries for a jewish text",
+            description="get a list of references of commentaries for a jewish text, optionally with the commentary texts",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -57,6 +123,28 @@ async def handle_list_tools() -> list[types.Tool]:
                         "type": "string",
                         "description": "the reference of the jewish text, e.g. 'שולחן ערוך אורח חיים סימן א' or 'Genesis 1:1'",
                     },
+                    "include_text": {
+                        "type": "boolean",
+                        "description": "When true, the texts of the commentaries are returned too.",
+                        "default": False
+                    },
+                    "commentators": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": 'Only return these commentators (Examples: "Rashi", "Ramban", "אבן עזרא").'
+                    },
+                    "max_commentaries": {
+                        "type": "integer",
+                        "description": "Maximum number of commentary texts to return when include_text is true.",
+                        "default": 10
+                    },
+                    "max_chars": {
+                        "type": "integer",
+                        "description": "Maximum number of characters of each commentary text.",
+                        "default": 500
+                    },
+                    "text_format": texts.schema_property(),
+                    **output.schema_properties(COMMENTARY_FIELDS),
                 },
                 "required": ["reference"],
             },
@@ -74,20 +162,30 @@ async def handle_list_tools() -> list[types.Tool]:
                     "slop":{
                         "type": "integer",
                         "description": "The maximum distance between each query word in the resulting document. 0 means an exact match must be found.",
+                        "minimum": 0,
                         "default": 2
                     },
                  
                     "filters":{
-                        "type": "list",
+                        "type": "array",
+                        "items": {"type": "string"},
                         "description": 'Filters to apply to the text path in English (Examples: "Shulkhan Arukh", "maimonides", "talmud").',
-                        "default" : "[]"
+                        "default" : []
 
                     },                        
                     "size": {
                         "type": "integer",
                         "description": "Number of results to return.",
+                        "minimum": 1,
                         "default": 10
-                    }
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Number of results to skip, to get the next page of results of the same search.",
+                        "minimum": 0,
+                        "default": 0
+                    },
+                    **output.schema_properties(SEARCH_FIELDS),
                 },
                 "required": ["query"],
             },
@@ -122,21 +220,201 @@ async def handle_list_tools() -> list[types.Tool]:
                     "timezone": {
                         "type": "string",
                         "description": "Timezone name in accordance with IANA Standards. Defaults to client's timezone if not specified."
+                    },
+                    **output.schema_properties(LEARNING_FIELDS),
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="get_learning_schedule",
+            description="get the learning schedule of a range of days (e.g. a week or a month) from Sefaria's calendar, as a table with one row per day",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "start_date": {
+                        "type": "string",
+                        "description": "First day, as YYYY-MM-DD. Defaults to today."
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "Last day, as YYYY-MM-DD. Defaults to start_date plus days."
+                    },
+                    "days": {
+                        "type": "integer",
+                        "description": f"Number of days, when end_date is not given (at most {MAX_SCHEDULE_DAYS}).",
+                        "default": 7
+                    },
+                    "cycles": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": 'Only include these learning cycles (Examples: "Daf Yomi", "Parashat Hashavua", "Daily Rambam").'
+                    },
+                    "diaspora": {
+                        "type": "boolean",
+                        "description": "When true, returns weekly Torah reading for diaspora. When false, returns Torah reading for Israel.",
+                        "default": True
+                    },
+                    "custom": {
+                        "type": "string",
+                        "description": "If available, the weekly Haftarah will be returned for the selected custom."
+                    },
+                    "timezone": {
+                        "type": "string",
+                        "description": "Timezone name in accordance with IANA Standards."
                     }
                 },
                 "required": [],
             },
         ),
+        types.Tool(
+            name="traverse_links",
+            description="follow the links between jewish texts over several hops, e.g. a verse, its commentaries and their supercommentaries, or a Talmud passage, the Mishneh Torah and the Shulchan Arukh",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "reference": {
+                        "type": "string",
+                        "description": "the reference of the text to start from, e.g. 'Genesis 1:1' or 'Berakhot 2a:1'",
+                    },
+                    "depth": {
+                        "type": "integer",
+                        "description": f"Number of hops to follow (at most {link_graph.MAX_DEPTH}).",
+                        "default": 2
+                    },
+                    "max_fanout": {
+                        "type": "integer",
+                        "description": "Maximum number of links followed from each text.",
+                        "default": 10
+                    },
+                    "types": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": 'Only follow links of these types (Examples: "commentary", "quotation", "targum", "halakha").'
+                    },
+                    "path": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": 'Filter of each hop, matched against the title or category of the linked texts; sets the depth (Example: ["Mishneh Torah", "Shulchan Arukh"]).'
+                    },
+                    "max_nodes": {
+                        "type": "integer",
+                        "description": f"Maximum number of linked texts returned (at most {link_graph.MAX_NODES}).",
+                        "default": 100
+                    },
+                    "order": {
+                        "type": "string",
+                        "enum": ["bfs", "dfs"],
+                        "description": "Visit the texts breadth-first (all the texts of a hop before the next hop) or depth-first (as a tree).",
+                        "default": "bfs"
+                    },
+                    **output.schema_properties(link_graph.LINK_FIELDS),
+                },
+                "required": ["reference"],
+            },
+        ),
+        types.Tool(
+            name="find_parallels",
+            description="find the passages of the local corpus most similar to a jewish text or to a given passage (TF-IDF similarity)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "reference": {
+                        "type": "string",
+                        "description": "the reference of the text, e.g. 'Berakhot 2a:1' or 'Genesis 1:1-5'",
+                    },
+                    "text": {
+                        "type": "string",
+                        "description": "A passage to find parallels of, when no reference is given.",
+                    },
+                    "k": {
+                        "type": "integer",
+                        "description": "Number of parallel passages to return.",
+                        "default": 10
+                    },
+                    "filters": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": 'Filters to apply to the text path in English (Examples: "Shulkhan Arukh", "maimonides", "talmud").',
+                        "default": []
+                    },
+                    "per_segment": {
+                        "type": "boolean",
+                        "description": "When true, returns the parallels of every segment of the reference instead of the whole reference.",
+                        "default": False
+                    },
+                    **output.schema_properties(parallels.PARALLEL_FIELDS),
+                },
+                "required": [],
+            },
+        ),
+        types.Tool(
+            name="get_diagnostics",
+            description="get the server's latency, error and cache statistics",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "format": {
+                        "type": "string",
+                        "enum": ["text", "prometheus"],
+                        "description": "Output format: a readable report, or the Prometheus text exposition format.",
+                        "default": "text"
+                    },
+                },
+                "required": [],
+            },
+        ),
     ]
 
-@server.call_tool()
+_validators: dict[str, jsonschema.protocols.Validator] = {}
+
+def input_error(name: str, arguments: dict) -> str | None:
+    """
+    Returns why the arguments do not match the input schema of the tool, or None if they do.
+    The validator of each tool is built once, where the SDK would build one on every call.
+    """
+    validator = _validators.get(name)
+    if validator is None:
+        tool = next((tool for tool in tool_definitions() if tool.name == name), None)
+        if tool is None:
+            return None
+        validator_class = jsonschema.validators.validator_for(tool.inputSchema)
+        validator_class.check_schema(tool.inputSchema)
+        validator = _validators[name] = validator_class(tool.inputSchema)
+    error = jsonschema.exceptions.best_match(validator.iter_errors(arguments))
+    return None if error is None else error.message
+
+@server.call_tool(validate_input=False)
 async def handle_call_tool(
     name: str, arguments: dict | None
 ) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
     """
     Handle tool execution requests.
     Tools can search the Jewish library and return formatted results.
+    The latency of every call is recorded per tool; results starting with "Error" count as errors.
+    Every call runs under the deadline of its tool, which also bounds its upstream requests,
+    and its upstream requests take turns with those of the other sessions.
     """
+    start = time.perf_counter()
+    error = input_error(name, arguments or {})
+    if error is not None:
+        metrics.observe("tool", name, time.perf_counter() - start, error=True)
+        return [types.TextContent(type="text", text=f"Error: Input validation error: {error}")]
+    seconds = resilience.tool_deadline(name)
+    try:
+        with resilience.deadline(seconds), scheduler.session(session_id()):
+            async with asyncio.timeout(seconds):
+                result = await call_tool(name, arguments)
+    except TimeoutError:
+        logger.warning(f"Tool {name} did not complete within {seconds:g}s")
+        result = [types.TextContent(type="text", text=f"Error: {name} did not complete within {seconds:g}s, please retry later")]
+    failed = bool(result) and isinstance(result[0], types.TextContent) and result[0].text.startswith("Error")
+    metrics.observe("tool", name, time.perf_counter() - start, error=failed)
+    return result
+
+async def call_tool(
+    name: str, arguments: dict | None
+) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
     logger.debug(f"Handling call_tool request for {name} with arguments {arguments}")
     
     try:
@@ -150,7 +428,15 @@ async def handle_call_tool(
                     raise ValueError("Missing reference parameter")  
                 
                 logger.debug(f"handle_get_text: {reference}")
-                text = await get_text(reference)
+                text = await get_text(
+                    reference,
+                    arguments.get("offset"),
+                    arguments.get("max_segments"),
+                    arguments.get("max_chars"),
+                    arguments.get("languages"),
+                    arguments.get("versions"),
+                    arguments.get("text_format") or texts.TEXT_FORMAT,
+                )
                 
                 
                 return [types.TextContent(
@@ -166,14 +452,69 @@ async def handle_call_tool(
                 
               
         
+        elif name == "get_texts":
+            try:
+                references = arguments.get("references")
+                if not references or not isinstance(references, list):
+                    raise ValueError("Missing references parameter")
+                max_concurrency = arguments.get("max_concurrency") or BATCH_CONCURRENCY
+                
+                logger.debug(f"handle_get_texts: {len(references)} references")
+                results = await get_texts(references, max_concurrency, arguments.get("text_format") or texts.TEXT_FORMAT)
+                
+                return [types.TextContent(
+                    type="text",
+                    text="\n\n".join(
+                        f"Reference: {reference}\n{text if error is None else f'Error: {error}'}"
+                        for reference, text, error in results
+                    )
+                )]
+            except Exception as err:
+                logger.error(f"retreive texts error: {err}", exc_info=True)
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error: {str(err)}"
+                )]
+        
         elif name == "get_commentaries":
             try:
                 reference = arguments.get("reference")
                 if not reference:
                     raise ValueError("Missing  parameter")
                 
+                commentators = arguments.get("commentators") or None
+                
                 logger.debug(f"handle_get_commentaries: {reference}")
-                commentaries = await get_commentaries(reference)
+                if output.is_json(arguments.get("format")):
+                    return [types.TextContent(
+                        type="text",
+                        text=await get_commentaries_json(
+                            reference,
+                            commentators,
+                            arguments.get("fields"),
+                            bool(arguments.get("include_text")),
+                            arguments.get("max_commentaries") or 10,
+                            arguments.get("max_chars") or 500,
+                            arguments.get("text_format") or texts.TEXT_FORMAT,
+                        )
+                    )]
+                if arguments.get("include_text"):
+                    commentaries = await get_commentaries_with_text(
+                        reference,
+                        commentators,
+                        arguments.get("max_commentaries") or 10,
+                        arguments.get("max_chars") or 500,
+                        text_format=arguments.get("text_format") or texts.TEXT_FORMAT,
+                    )
+                    return [types.TextContent(
+                        type="text",
+                        text="\n\n".join(
+                            f"{he_ref}\n{text if text is not None else 'Error: could not retrieve commentary text'}"
+                            for he_ref, text in commentaries
+                        )
+                    )]
+                
+                commentaries = await get_commentaries(reference, commentators)
                 
                 return [types.TextContent(
                     type="text",
@@ -193,17 +534,22 @@ async def handle_call_tool(
                     raise ValueError("Missing query parameter")
                     
                 slop = arguments.get("slop")
-                if not slop : # Use 'is None' to distinguish between explicitly provided null and missing key
+                if slop is None: # An explicit 0 asks for an exact match
                     slop = 2
                 filters = arguments.get("filters")
                 if not filters:
                     filters = None
                 size = arguments.get("size")
-                if not size:
+                if size is None:
                     size = 10
+                offset = arguments.get("offset")
+                if offset is None:
+                    offset = 0
                 
                 logger.debug(f"handle_search_texts: {query}")
-                results = await search_texts(query, slop, filters, size)
+                results = await search_texts(
+                    query, slop, filters, size, offset, arguments.get("format"), arguments.get("fields")
+                )
                 
                 return [types.TextContent(
                     type="text",
@@ -226,7 +572,9 @@ async def handle_call_tool(
                 timezone = arguments.get("timezone")
                 
                 logger.debug(f"handle_get_daily_learnings: diaspora={diaspora}, year={year}, month={month}, day={day}")
-                results = await get_daily_learnings(diaspora, custom, year, month, day, timezone)
+                results = await get_daily_learnings(
+                    diaspora, custom, year, month, day, timezone, arguments.get("format"), arguments.get("fields")
+                )
                 
                 return [types.TextContent(
                     type="text",
@@ -239,6 +587,117 @@ async def handle_call_tool(
                     text=f"Error: {str(err)}"
                 )]
            
+        elif name == "get_learning_schedule":
+            try:
+                logger.debug(f"handle_get_learning_schedule: {arguments}")
+                results = await get_learning_schedule(
+                    arguments.get("start_date"),
+                    arguments.get("end_date"),
+                    arguments.get("days"),
+                    arguments.get("diaspora", True),
+                    arguments.get("custom"),
+                    arguments.get("timezone"),
+                    arguments.get("cycles") or None,
+                )
+                
+                return [types.TextContent(
+                    type="text",
+                    text=results
+                )]
+            except Exception as err:
+                logger.error(f"get learning schedule error: {err}", exc_info=True)
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error: {str(err)}"
+                )]
+        
+        elif name == "traverse_links":
+            try:
+                reference = arguments.get("reference")
+                if not reference:
+                    raise ValueError("Missing reference parameter")
+                order = arguments.get("order") or "bfs"
+                as_json = output.is_json(arguments.get("format"))
+                fields = output.select_fields(arguments.get("fields"), link_graph.LINK_FIELDS) if as_json else None
+                
+                logger.debug(f"handle_traverse_links: {arguments}")
+                links = await link_graph.traverse(
+                    reference,
+                    arguments.get("depth") or 2,
+                    arguments.get("max_fanout") or 10,
+                    arguments.get("types") or None,
+                    arguments.get("path") or None,
+                    arguments.get("max_nodes") or 100,
+                    order,
+                )
+                
+                if as_json:
+                    text = output.dumps([{field: link[field] for field in fields if link[field]} for link in links])
+                else:
+                    text = link_graph.format_links(reference, links, order)
+                return [types.TextContent(
+                    type="text",
+                    text=text
+                )]
+            except Exception as err:
+                logger.error(f"traverse links error: {err}", exc_info=True)
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error: {str(err)}"
+                )]
+        
+        elif name == "find_parallels":
+            try:
+                as_json = output.is_json(arguments.get("format"))
+                fields = output.select_fields(arguments.get("fields"), parallels.PARALLEL_FIELDS) if as_json else None
+                
+                logger.debug(f"handle_find_parallels: {arguments}")
+                # The similarity products run in a thread, not to block the other requests
+                results = await asyncio.to_thread(
+                    parallels.find_parallels,
+                    arguments.get("reference"),
+                    arguments.get("text"),
+                    arguments.get("k") or 10,
+                    arguments.get("filters") or None,
+                    bool(arguments.get("per_segment")),
+                )
+                
+                if as_json:
+                    text = output.dumps([
+                        {"query": query, "parallels": [{field: p[field] for field in fields} for p in found]}
+                        for query, found in results
+                    ])
+                else:
+                    text = parallels.format_parallels(results)
+                return [types.TextContent(
+                    type="text",
+                    text=text
+                )]
+            except Exception as err:
+                logger.error(f"find parallels error: {err}", exc_info=True)
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error: {str(err)}"
+                )]
+        
+        elif name == "get_diagnostics":
+            try:
+                if arguments.get("format") == "prometheus":
+                    text = metrics.render_prometheus()
+                else:
+                    text = metrics.render_text()
+                
+                return [types.TextContent(
+                    type="text",
+                    text=text
+                )]
+            except Exception as err:
+                logger.error(f"get diagnostics error: {err}", exc_info=True)
+                return [types.TextContent(
+                    type="text",
+                    text=f"Error: {str(err)}"
+                )]
+           
         else:
             raise ValueError(f"Unknown tool: {name}")
             
@@ -249,27 +708,62 @@ async def handle_call_tool(
             text=f"Error: {str(e)}"
         )]
     
-async def main():
+def initialization_options() -> InitializationOptions:
+    return InitializationOptions(
+        server_name="sefaria_jewish_library",
+        server_version="0.1.0",
+        capabilities=server.get_capabilities(
+            notification_options=NotificationOptions(),
+            experimental_capabilities={},
+        ),
+    )
+
+def startup_responses() -> dict:
+    """
+    Returns the results of the initialize and tools/list requests, saved for fast starts.
+    """
+    options = initialization_options()
+    initialize = types.InitializeResult(
+        protocolVersion=types.LATEST_PROTOCOL_VERSION,
+        capabilities=options.capabilities,
+        serverInfo=types.Implementation(
+            name=options.server_name,
+            version=options.server_version,
+            websiteUrl=options.website_url,
+            icons=options.icons,
+        ),
+        instructions=options.instructions,
+    )
+    return {
+        "protocol_versions": list(SUPPORTED_PROTOCOL_VERSIONS),
+        "initialize": initialize.model_dump(by_alias=True, mode="json", exclude_none=True),
+        "tools/list": types.ListToolsResult(tools=tool_definitions()).model_dump(by_alias=True, mode="json", exclude_none=True),
+    }
+
+async def main(stdin=None, stdout=None):
+    """
+    Serves a client over stdio, or over the given replacements of stdin and stdout (see fast_start).
+    """
+    # Configure logging: level, log file and payload sampling are set with SEFARIA_LOG_* variables
+    configure_logging()
+    warmup_task = None
     try:
         logger.info("Starting Jewish Library MCP server...")
-            
+        warmup_task = warmup.start()
+        if fast_start.FAST_START:
+            fast_start.save(startup_responses())
+
         # Run the server using stdin/stdout streams
-        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-            await server.run(
-                read_stream,
-                write_stream,
-                InitializationOptions(
-                    server_name="sefaria_jewish_library",
-                    server_version="0.1.0",
-                    capabilities=server.get_capabilities(
-                        notification_options=NotificationOptions(),
-                        experimental_capabilities={},
-                    ),
-                ),
-            )
+        async with mcp.server.stdio.stdio_server(stdin, stdout) as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, initialization_options())
     except Exception as e:
         logger.error(f"Server error: {e}", exc_info=True)
         raise
+    finally:
+        if warmup_task is not None:
+            warmup_task.cancel()
+        logger.info(f"Metrics:\n{metrics.render_text()}")
+        await http_client.aclose()
 
 if __name__ == "__main__":
     try:
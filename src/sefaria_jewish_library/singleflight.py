@@ -0,0 +1,102 @@
+import asyncio
+import contextvars
+
+from . import resilience
+
+
+def shared_context() -> contextvars.Context:
+    """
+    Returns the context a shared call runs in: the first caller's, without its deadline.
+    A shared call serves every waiter, so each waiter's deadline is applied to its own wait instead;
+    the call keeps the lane and session of the first caller, so it is queued fairly with the others.
+    """
+    context = contextvars.copy_context()
+    context.run(resilience._deadline.set, None)
+    return context
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution.
+
+    The first caller starts the call; callers arriving while it is in flight await the
+    same task and share its result or exception. A caller being cancelled, or reaching
+    its deadline, does not cancel the shared call for the others, but the call is
+    cancelled once all of its callers left, so abandoned tool calls stop their upstream
+    requests. The call itself runs without the first caller's deadline, so it lasts as
+    long as its longest waiting caller.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: str, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(fn(), context=shared_context())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        self._waiters[key] += 1
+        timeout = asyncio.timeout(resilience.remaining())
+        try:
+            async with timeout:
+                return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            self._leave(key, task)
+            raise
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            self._leave(key, task)
+            raise resilience.DeadlineExceeded(f"Deadline exceeded while waiting for {key}") from None
+
+    def _leave(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            self._waiters[key] -= 1
+            if self._waiters[key] == 0 and not task.done():
+                self.abandoned += 1
+                task.cancel()
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, in case every caller was cancelled
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "in_flight": self.in_flight(),
+        }
+
+
+_flights = SingleFlight()
+
+
+async def do(key: str, fn):
+    """
+    Runs fn() once for all concurrent callers with the same key.
+    """
+    return await _flights.do(key, fn)
+
+
+def stats() -> dict:
+    """
+    Returns how many upstream calls were executed and how many were saved by coalescing.
+    """
+    return _flights.stats()
@@ -0,0 +1,218 @@
+"""
+Compact storage and clean rendering of texts.
+
+Sefaria returns texts as nested arrays of segments marked up with HTML: bold and italics, line
+breaks, footnote markers followed by the footnote, entities. Texts read by the tools are kept in a
+CompactText: the segments in one UTF-8 buffer with an array of offsets, and their interned refs,
+which takes a fraction of the memory of the API response, and is rendered without walking nested
+lists again. Segments are rendered in one of TEXT_FORMATS by a pipeline compiled once per format:
+
+- plain: no markup, niqqud, cantillation or footnotes
+- niqqud: no markup, cantillation or footnotes, keeping the vowel points (the default)
+- footnotes: like niqqud, with the footnotes in brackets after their marker
+- raw: the segments as Sefaria returns them
+"""
+import html
+import os
+import re
+import sys
+import time
+from array import array
+from collections import OrderedDict
+
+TEXT_FORMATS = ("plain", "niqqud", "footnotes", "raw")
+TEXT_FORMAT = os.environ.get("SEFARIA_TEXT_FORMAT", "niqqud")
+# Memory budget of the compact texts kept in memory
+SEGMENT_CACHE_BYTES = int(float(os.environ.get("SEFARIA_SEGMENT_CACHE_MB", "64")) * 1024 * 1024)
+
+# Cantillation marks (with the meteg), and vowel points and dots
+CANTILLATION = [*range(0x0591, 0x05B0), 0x05BD]
+NIQQUD = [*range(0x05B0, 0x05BD), 0x05BF, 0x05C1, 0x05C2, 0x05C4, 0x05C5, 0x05C7]
+# Tags breaking the line, rendered as a space rather than removed
+_BLOCK_TAGS = {"br", "p", "div", "li"}
+
+# One pass over a segment: a footnote marker and its footnote (which may hold one level of nested
+# tags), or any other tag with the whitespace around it, or an entity
+_MARKUP_RE = re.compile(
+    r"\s*<sup[^>]*>(?:(?!</sup>).)*</sup>\s*<i [^>]*class=\"footnote\"[^>]*>"
+    r"(?P<footnote>(?:[^<]|<(?!/?i[\s>])[^>]*>|<i[^>]*>(?:(?!</i>).)*</i>)*)</i>"
+    r"|(?P<tag>\s*</?(?P<name>[a-zA-Z][a-zA-Z0-9]*)[^>]*>\s*)"
+    r"|(?P<entity>&(?:#\d+|#x[0-9a-fA-F]+|[a-zA-Z]+);)",
+    re.DOTALL,
+)
+_SPACES_RE = re.compile(r"\s{2,}")
+
+# Translation tables deleting the marks each format leaves out
+_DELETIONS = {
+    "plain": dict.fromkeys(CANTILLATION + NIQQUD),
+    "niqqud": dict.fromkeys(CANTILLATION),
+    "footnotes": dict.fromkeys(CANTILLATION),
+}
+
+
+def _replacement(footnotes: bool):
+    def replace(match: re.Match) -> str:
+        if match.group("entity"):
+            return html.unescape(match.group("entity"))
+        if match.group("tag"):
+            tag = match.group("tag")
+            if match.group("name").lower() in _BLOCK_TAGS or tag[0].isspace() or tag[-1].isspace():
+                return " "
+            return ""
+        if footnotes:
+            note = _MARKUP_RE.sub(_REPLACEMENTS["niqqud"], match.group("footnote")).strip()
+            return f" [{note}]" if note else ""
+        return ""
+    return replace
+
+
+_REPLACEMENTS = {"plain": _replacement(False), "niqqud": _replacement(False), "footnotes": _replacement(True)}
+
+
+def clean(segment: str, text_format: str = TEXT_FORMAT) -> str:
+    """
+    Renders a segment in the given TEXT_FORMATS format: its markup replaced in one regular expression
+    pass, then the marks the format leaves out deleted with a translation table.
+    """
+    if text_format == "raw":
+        return segment
+    replace = _REPLACEMENTS.get(text_format)
+    if replace is None:
+        raise ValueError(f"Unknown text format: {text_format} (available: {', '.join(TEXT_FORMATS)})")
+    if "<" in segment or "&" in segment:
+        segment = _MARKUP_RE.sub(replace, segment)
+        segment = _SPACES_RE.sub(" ", segment)
+    return segment.translate(_DELETIONS[text_format]).strip()
+
+
+def schema_property() -> dict:
+    """
+    Returns the "text_format" input schema property of the tools returning texts.
+    """
+    return {
+        "type": "string",
+        "enum": list(TEXT_FORMATS),
+        "description": "Rendering of the texts: plain (no markup, niqqud or cantillation), niqqud (keeps the vowel points), "
+                       "footnotes (niqqud with the footnotes in brackets), or raw (Sefaria's HTML).",
+        "default": TEXT_FORMAT,
+    }
+
+
+class CompactText:
+    """
+    The segments of a text, flattened into one UTF-8 buffer with the offsets of their ends,
+    and the interned refs of the segments.
+    """
+
+    __slots__ = ("ref", "refs", "buffer", "offsets")
+
+    def __init__(self, ref: str, refs: tuple[str, ...], buffer: bytes, offsets: array):
+        self.ref = ref
+        self.refs = refs
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_segments(cls, ref: str, segments) -> "CompactText":
+        """
+        Builds a compact text from (segment ref, segment) pairs, e.g. of sefaria_handler.iter_segment_refs.
+        """
+        refs = []
+        parts = []
+        offsets = array("L", [0])
+        end = 0
+        for segment_ref, segment in segments:
+            data = segment.encode("utf-8")
+            end += len(data)
+            parts.append(data)
+            offsets.append(end)
+            refs.append(sys.intern(segment_ref))
+        return cls(sys.intern(ref), tuple(refs), b"".join(parts), offsets)
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    def segment(self, index: int, text_format: str = "raw") -> str:
+        return clean(self.buffer[self.offsets[index]:self.offsets[index + 1]].decode("utf-8"), text_format)
+
+    def segments(self, text_format: str = "raw", start: int = 0):
+        """
+        Yields the (segment ref, segment) pairs from start on, rendered in the given format.
+        """
+        for index in range(start, len(self.refs)):
+            yield self.refs[index], self.segment(index, text_format)
+
+    def render(self, text_format: str = TEXT_FORMAT, separator: str = "\n") -> str:
+        """
+        Returns the segments rendered in the given format, joined with separator.
+        """
+        return separator.join(segment for _ref, segment in self.segments(text_format) if segment)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory of the text: its buffer, offsets and refs (shared refs are counted each time).
+        """
+        return (
+            sys.getsizeof(self.buffer) + sys.getsizeof(self.offsets)
+            + sys.getsizeof(self.refs) + sum(map(sys.getsizeof, self.refs))
+        )
+
+
+class SegmentCache:
+    """
+    LRU cache of compact texts, bounded by their memory.
+    """
+
+    def __init__(self, max_bytes: int = SEGMENT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, CompactText]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> CompactText | None:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, text: CompactText, ttl: float):
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1].nbytes
+        if text.nbytes > self.max_bytes:
+            return
+        self._entries[key] = (time.time() + ttl, text)
+        self.bytes += text.nbytes
+        while self.bytes > self.max_bytes:
+            _key, (_expires_at, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+_segment_cache: SegmentCache | None = None
+
+
+def get_segment_cache() -> SegmentCache:
+    global _segment_cache
+    if _segment_cache is None:
+        _segment_cache = SegmentCache()
+    return _segment_cache
+
+
+def stats() -> dict:
+    return get_segment_cache().stats()
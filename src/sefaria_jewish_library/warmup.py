@@ -0,0 +1,135 @@
+"""
+Background warm-up of the day's hot content.
+
+When enabled (SEFARIA_WARMUP=1), a background task pre-fetches today's calendar, the texts of
+its main learning cycles (the parasha, the haftarah, the daf yomi...) and the commentaries on the
+first verse of the parasha into the response cache, at startup and again shortly after every
+midnight of the configured timezone, so the first requests of the day are served warm.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import time
+
+from . import cache, refs, scheduler
+from .sefaria_handler import (
+    get_calendar_data,
+    get_commentary_links,
+    get_first_verse,
+    get_parasha_data,
+    get_text_segments,
+)
+
+logger = logging.getLogger('sefaria_jewish_library')
+
+WARMUP_ENABLED = os.environ.get("SEFARIA_WARMUP", "0") == "1"
+WARMUP_TIMEZONE = os.environ.get("SEFARIA_WARMUP_TIMEZONE") or None
+WARMUP_DIASPORA = os.environ.get("SEFARIA_WARMUP_DIASPORA", "1") != "0"
+# Calendar cycles whose texts are pre-fetched, matched against the cycle title
+WARMUP_CYCLES = [c.strip() for c in os.environ.get("SEFARIA_WARMUP_CYCLES", "Parashat Hashavua,Haftarah,Daf Yomi").split(",") if c.strip()]
+# Maximum number of texts and link lists fetched per warm-up
+WARMUP_BUDGET = int(os.environ.get("SEFARIA_WARMUP_BUDGET", "30"))
+# Warm-up fetches run at low concurrency, to leave room for the requests of the clients
+WARMUP_CONCURRENCY = int(os.environ.get("SEFARIA_WARMUP_CONCURRENCY", "2"))
+# Seconds after midnight at which the next day is warmed up
+WARMUP_ROLLOVER_DELAY = int(os.environ.get("SEFARIA_WARMUP_ROLLOVER_DELAY", "60"))
+
+
+async def warm_up(timezone: str = WARMUP_TIMEZONE, budget: int = WARMUP_BUDGET) -> dict:
+    """
+    Pre-fetches today's calendar, the texts of its WARMUP_CYCLES items and the commentaries on the
+    first verse of the parasha, fetching at most budget texts and link lists.
+
+    Returns:
+        dict: how many items were fetched and how many failed
+    """
+    stats = {"fetched": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(max(1, WARMUP_CONCURRENCY))
+
+    async def fetch(coroutine_fn, *args):
+        async with semaphore:
+            try:
+                result = await coroutine_fn(*args)
+            except Exception as e:
+                logger.debug(f"Warm-up fetch {coroutine_fn.__name__}{args} failed: {e}")
+                result = None
+        failed = result is None or (isinstance(result, tuple) and result[-1] is None)
+        stats["failed" if failed else "fetched"] += 1
+        return result
+
+    # The calendar, as fetched by get_daily_learnings (with and without the timezone) and by get_parasha_data
+    calendar = await fetch(get_calendar_data, WARMUP_DIASPORA, None, None, None, None, timezone)
+    if timezone:
+        await fetch(get_calendar_data, WARMUP_DIASPORA, None, None, None, None, None)
+    # None when the calendar could not be fetched, the parasha step is then skipped
+    parasha_ref, _parasha_name = (await fetch(get_parasha_data)) or (None, None)
+    if calendar is None:
+        return stats
+
+    texts = []
+    for item in calendar.get("calendar_items", []):
+        title = item.get("title", {}).get("en", "")
+        if item.get("ref") and any(cycle.lower() in title.lower() for cycle in WARMUP_CYCLES):
+            try:
+                texts.append(refs.canonicalize(item["ref"]))
+            except refs.InvalidRef:
+                pass
+    first_verse = get_first_verse(parasha_ref or next(
+        (item.get("ref") for item in calendar.get("calendar_items", [])
+         if item.get("title", {}).get("en") == "Parashat Hashavua"), None
+    ))
+
+    text_refs = list(dict.fromkeys(texts))[:budget]
+    remaining = budget - len(text_refs)
+
+    async def warm_commentaries():
+        # The links of the first verse, then the texts of its commentaries with what is left of the budget
+        if not first_verse or remaining < 1:
+            return
+        links = await fetch(get_commentary_links, first_verse) or []
+        sources = [link["sourceRef"] for link in links if link.get("sourceRef")][:remaining - 1]
+        await asyncio.gather(*(fetch(get_text_segments, ref) for ref in sources))
+
+    await asyncio.gather(*(fetch(get_text_segments, ref) for ref in text_refs), warm_commentaries())
+    return stats
+
+
+def seconds_until_rollover(timezone: str = WARMUP_TIMEZONE) -> float:
+    """
+    Returns the number of seconds until WARMUP_ROLLOVER_DELAY seconds after the next midnight of the timezone.
+    """
+    tomorrow = cache.today(timezone) + datetime.timedelta(days=1)
+    tzinfo = None
+    if timezone:
+        try:
+            from zoneinfo import ZoneInfo
+            tzinfo = ZoneInfo(timezone)
+        except Exception:
+            pass
+    midnight = datetime.datetime.combine(tomorrow, datetime.time(0), tzinfo)
+    return max(1.0, midnight.timestamp() - time.time() + WARMUP_ROLLOVER_DELAY)
+
+
+async def run(timezone: str = WARMUP_TIMEZONE, budget: int = WARMUP_BUDGET):
+    """
+    Warms up at startup, then again after every midnight, until cancelled.
+    """
+    while True:
+        start = time.perf_counter()
+        try:
+            with scheduler.lane(scheduler.BACKGROUND):
+                stats = await warm_up(timezone, budget)
+            logger.info(f"Warm-up done in {time.perf_counter() - start:.1f}s: {stats}")
+        except Exception as e:
+            logger.warning(f"Warm-up failed: {e}", exc_info=True)
+        await asyncio.sleep(seconds_until_rollover(timezone))
+
+
+def start() -> asyncio.Task | None:
+    """
+    Starts the warm-up task when SEFARIA_WARMUP is enabled, and returns it.
+    """
+    if not WARMUP_ENABLED:
+        return None
+    return asyncio.create_task(run())
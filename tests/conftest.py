@@ -0,0 +1,83 @@
+import json
+from urllib.parse import unquote
+
+import httpx
+import pytest
+
+from sefaria_jewish_library import cache, corpus, http_client, resilience, scheduler, search_index, texts
+
+
+class Upstream:
+    """
+    A stand-in for the Sefaria API answering from dicts, recording the requests it receives.
+
+    texts maps a ref to its versions: {"hebrew": text, "english": text}, each text a segment
+    or a nested list of segments. related maps a ref to its links, search is the search-wrapper
+    response, calendars the calendar response. failing makes every request fail with a 500.
+    """
+
+    def __init__(self):
+        self.texts: dict[str, dict] = {}
+        self.related: dict[str, list] = {}
+        self.search: dict = {"hits": {"total": {"value": 0}, "hits": []}}
+        self.calendars: dict = {"calendar_items": []}
+        self.failing = False
+        self.requests: list[httpx.Request] = []
+
+    @property
+    def paths(self) -> list[str]:
+        return [unquote(request.url.path) for request in self.requests]
+
+    def text_refs(self) -> list[str]:
+        return [path.removeprefix("/api/v3/texts/") for path in self.paths if path.startswith("/api/v3/texts/")]
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.failing:
+            return httpx.Response(500, text="Internal error")
+        path = unquote(request.url.path)
+        if path.startswith("/api/v3/texts/"):
+            ref = path.removeprefix("/api/v3/texts/")
+            versions = self.texts.get(ref)
+            if versions is None:
+                return httpx.Response(404, json={"error": f"{ref} not found"})
+            wanted = [spec.partition("|")[0] for spec in request.url.params.get_list("version")] or ["primary"]
+            selected = []
+            for language in wanted:
+                language = "hebrew" if language == "primary" else language
+                if language in versions:
+                    selected.append({
+                        "language": language[:2],
+                        "languageFamilyName": language,
+                        "versionTitle": f"{language} version",
+                        "text": versions[language],
+                    })
+            return httpx.Response(200, json={"ref": ref, "heRef": ref, "title": ref, "versions": selected})
+        if path == "/api/search-wrapper":
+            payload = json.loads(request.content)
+            data = json.loads(json.dumps(self.search))
+            data["hits"]["hits"] = data["hits"]["hits"][:payload.get("size", 10)]
+            return httpx.Response(200, json=data)
+        if path == "/api/calendars":
+            return httpx.Response(200, json=self.calendars)
+        if path.startswith("/api/related/"):
+            return httpx.Response(200, json={"links": self.related.get(path.removeprefix("/api/related/"), [])})
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Routes the upstream requests to an Upstream, with empty caches, no retries and closed circuits.
+    """
+    upstream = Upstream()
+    client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    monkeypatch.setattr(cache, "_cache", cache.TieredCache(cache.LRUCache()))
+    monkeypatch.setattr(texts, "_segment_cache", texts.SegmentCache())
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "RETRIES", 0)
+    monkeypatch.setattr(scheduler, "_families", {})
+    monkeypatch.setattr(corpus, "BACKEND", "remote")
+    monkeypatch.setattr(search_index, "SEARCH_BACKEND", "remote")
+    return upstream
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from sefaria_jewish_library import cache
+
+
+def test_lru_cache_is_bounded_by_entries():
+    lru = cache.LRUCache(max_entries=2, max_bytes=1000)
+    expires_at = time.time() + 60
+    lru.set("a", "1", expires_at)
+    lru.set("b", "2", expires_at)
+    assert lru.get("a") == "1"
+    lru.set("c", "3", expires_at)
+    # "b" was the least recently used
+    assert lru.get("b") is cache.MISSING
+    assert (lru.get("a"), lru.get("c")) == ("1", "3")
+    assert lru.evictions == 1
+
+
+def test_lru_cache_is_bounded_by_bytes():
+    lru = cache.LRUCache(max_entries=100, max_bytes=25)
+    expires_at = time.time() + 60
+    lru.set("a", "x" * 8, expires_at)
+    lru.set("b", "y" * 8, expires_at)
+    assert lru.bytes == 20
+    lru.set("c", "z" * 8, expires_at)
+    assert len(lru) == 2 and lru.bytes == 20
+    assert lru.get("a") is cache.MISSING
+    # Replacing an entry does not count it twice
+    lru.set("c", "z", expires_at)
+    assert lru.bytes == 13
+    # Values larger than the budget are not cached at all
+    lru.set("d", "w" * 30, expires_at)
+    assert lru.get("d") is cache.MISSING and len(lru) == 2
+
+
+def test_lru_cache_keeps_expired_entries_as_stale():
+    lru = cache.LRUCache()
+    lru.set("a", "1", time.time() - 1)
+    assert lru.get("a") is cache.MISSING
+    assert lru.get("a", stale=True) == "1"
+
+
+def test_disk_store_round_trip_and_expiry(tmp_path):
+    store = cache.DiskStore(str(tmp_path), budget=1024 * 1024)
+    expires_at = time.time() + 60
+    store.set("key", {"text": "בראשית"}, expires_at)
+    assert store.get("key") == (expires_at, {"text": "בראשית"})
+    store.set("old", "value", time.time() - 1)
+    assert store.get("old") is cache.MISSING
+    assert store.get("old", stale=True)[1] == "value"
+    assert store.purge_expired() == 1
+    assert store.get("old", stale=True) is cache.MISSING
+
+
+def test_disk_store_evicts_expired_then_least_recently_read_entries(tmp_path):
+    store = cache.DiskStore(str(tmp_path), budget=10 * 1024 * 1024)
+    now = time.time()
+    value = "x" * 1000
+    for n in range(5):
+        store.set(f"key{n}", value, now + 60)
+        # Read in the order key4, key3, ... key0
+        os.utime(store._path(f"key{n}"), (now - n * 100, now + 60))
+    store.set("expired", value, now - 1)
+    # Over budget by about two entries once the expired one is gone
+    store.budget = int(store.size() * 0.7)
+    store.enforce_budget()
+    assert store.get("expired", stale=True) is cache.MISSING
+    assert store.size() <= store.budget * 0.9
+    assert [n for n in range(5) if store.get(f"key{n}") is not cache.MISSING] == [0, 1, 2]
+    assert store.evictions == 3
+
+
+class Fetcher:
+    """
+    A fetch function answering with the given values or raising the given errors, in turn.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self, *args):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def tiered(tmp_path):
+    return cache.TieredCache(cache.LRUCache(), cache.DiskStore(str(tmp_path)))
+
+
+def expire(tiered, key, seconds_ago):
+    expires_at = time.time() - seconds_ago
+    value = tiered.get_stale(key)
+    tiered.memory.set(key, value, expires_at)
+    tiered.disk.set(key, value, expires_at)
+
+
+def test_get_or_fetch_caches_in_memory_and_on_disk(tiered):
+    fetch = Fetcher("value")
+    assert asyncio.run(tiered.get_or_fetch("key", 60, fetch)) == "value"
+    assert asyncio.run(tiered.get_or_fetch("key", 60, fetch)) == "value"
+    assert fetch.calls == 1 and tiered.memory_hits == 1
+    tiered.memory.clear()
+    assert asyncio.run(tiered.get_or_fetch("key", 60, fetch)) == "value"
+    assert tiered.disk_hits == 1
+
+
+def test_get_or_fetch_does_not_cache_failures(tiered):
+    fetch = Fetcher(None, "value")
+    assert asyncio.run(tiered.get_or_fetch("key", 60, fetch)) is None
+    assert asyncio.run(tiered.get_or_fetch("key", 60, fetch)) == "value"
+    with pytest.raises(ValueError):
+        asyncio.run(tiered.get_or_fetch("other", 60, Fetcher(ValueError("down"))))
+
+
+def test_get_or_fetch_serves_stale_entries_when_the_fetch_fails(tiered):
+    asyncio.run(tiered.get_or_fetch("key", 60, Fetcher("old")))
+    expire(tiered, "key", 10)
+    assert asyncio.run(tiered.get_or_fetch("key", 60, Fetcher(ValueError("down")))) == "old"
+    assert asyncio.run(tiered.get_or_fetch("key", 60, Fetcher(None))) == "old"
+    assert tiered.stale_hits == 2
+
+
+def test_get_or_fetch_revalidates_recently_expired_entries_in_the_background(tiered):
+    revalidate = Fetcher("new")
+
+    async def main():
+        await tiered.get_or_fetch("key", 60, Fetcher("old"))
+        expire(tiered, "key", 10)
+        # Served stale at once, refreshed in the background
+        assert await tiered.get_or_fetch("key", 60, Fetcher(), revalidate) == "old"
+        await asyncio.gather(*tiered._revalidating.values())
+        assert await tiered.get_or_fetch("key", 60, Fetcher(), revalidate) == "new"
+
+    asyncio.run(main())
+    assert revalidate.calls == 1
+    assert tiered.revalidations == 1 and tiered.stale_hits == 1
+
+
+def test_get_or_fetch_revalidates_long_expired_entries_before_answering(tiered):
+    async def main():
+        await tiered.get_or_fetch("key", 60, Fetcher("old"))
+        expire(tiered, "key", cache.STALE_WHILE_REVALIDATE + 10)
+        stale = tiered.get_stale("key")
+        # Not modified: the revalidation answers with the stale value, which gets a new expiry
+        revalidate = Fetcher(stale)
+        assert await tiered.get_or_fetch("key", 60, Fetcher(), revalidate) == "old"
+        assert revalidate.calls == 1
+        assert tiered.memory.get_entry("key")[0] > time.time()
+
+    asyncio.run(main())
+    assert tiered.not_modified == 1
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+
+def test_sqlite_stores_share_entries_across_connections(db_path):
+    first = cache.SQLiteStore(db_path)
+    second = cache.SQLiteStore(db_path)
+    expires_at = time.time() + 60
+    first.set("key", {"text": "בראשית"}, expires_at)
+    assert second.get("key") == (expires_at, {"text": "בראשית"})
+    second.set("key", "replaced", expires_at)
+    assert first.get("key") == (expires_at, "replaced")
+    second.delete("key")
+    assert first.get("key") is cache.MISSING
+    first.close()
+    second.close()
+
+
+def test_sqlite_store_expiry(db_path):
+    store = cache.SQLiteStore(db_path)
+    store.set("old", "value", time.time() - 1)
+    store.set("new", "value", time.time() + 60)
+    assert store.get("old") is cache.MISSING
+    assert store.get("old", stale=True)[1] == "value"
+    assert store.purge_expired() == 1
+    assert store.get("old", stale=True) is cache.MISSING
+    assert store.count() == 1
+    store.close()
+
+
+def test_sqlite_store_gives_up_quickly_on_a_locked_database(db_path):
+    store = cache.SQLiteStore(db_path, busy_timeout=0.2)
+    store.set("key", "value", time.time() + 60)
+    # Another process holding the write lock
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    start = time.monotonic()
+    store.set("other", "value", time.time() + 60)
+    assert time.monotonic() - start < 2
+    assert store.busy == 1
+    # Readers are not blocked in WAL mode
+    assert store.get("key")[1] == "value"
+    other.execute("ROLLBACK")
+    other.close()
+    assert store.get("other") is cache.MISSING
+    store.set("other", "value", time.time() + 60)
+    assert store.get("other")[1] == "value"
+    store.close()
+
+
+def test_sqlite_store_concurrent_writers(db_path):
+    stores = [cache.SQLiteStore(db_path, busy_timeout=5) for _ in range(2)]
+    expires_at = time.time() + 60
+
+    def write(store, prefix):
+        for n in range(50):
+            store.set(f"{prefix}{n}", n, expires_at)
+
+    threads = [threading.Thread(target=write, args=(store, prefix)) for store, prefix in zip(stores, "ab")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stores[0].count() == 100
+    assert stores[1].get("a49") == (expires_at, 49)
+    for store in stores:
+        store.close()
+
+
+def test_sqlite_store_evicts_least_recently_used_entries_over_budget(db_path):
+    store = cache.SQLiteStore(db_path, budget=100 * 1024)
+    now = time.time()
+    for n in range(10):
+        store.set(f"key{n}", "x" * 1000, now + 60)
+    store._conn.execute("UPDATE entries SET accessed_at = ? - CAST(SUBSTR(key, 4) AS INTEGER)", (now,))
+    store.budget = store.size() // 2
+    store.enforce_budget()
+    assert store.size() <= store.budget * 0.9
+    assert [n for n in range(10) if store.get(f"key{n}") is not cache.MISSING] == list(range(store.count()))
+    store.close()
@@ -0,0 +1,48 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+from sefaria_jewish_library import corpus
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "corpus.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(corpus.SCHEMA)
+    conn.execute("INSERT INTO books VALUES (1, 'Genesis', 'Genesis', 'בראשית', ?, ?)", ('["Tanakh"]', '["Chapter", "Verse"]'))
+    conn.execute("INSERT INTO versions VALUES (1, 1, 'he', 'v')")
+    conn.executemany("INSERT INTO segments VALUES (1, ?, ?, ?, ?)", [
+        (seq, f"Genesis 1:{seq + 1}", json.dumps([0, seq]), f"פסוק {seq + 1}") for seq in range(3)
+    ])
+    conn.commit()
+    conn.close()
+    store = corpus.CorpusStore(path)
+    yield store
+    store.close()
+
+
+def test_get_text_and_he_ref(store):
+    text = store.get_text("Genesis 1:2-3")
+    assert text["heRef"] == "בראשית א:ב"
+    assert text["versions"][0]["text"] == ["פסוק 2", "פסוק 3"]
+    assert store.he_ref("Genesis 1:3") == "בראשית א:ג"
+
+
+def test_every_thread_reads_through_its_own_connection(store):
+    connections = {}
+
+    def read(name):
+        connections[name] = store.conn
+        assert store.get_text("Genesis 1:1")["versions"][0]["text"] == "פסוק 1"
+
+    threads = [threading.Thread(target=read, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    read("main")
+    assert len({id(conn) for conn in connections.values()}) == 5
+    assert store.conn is connections["main"]
@@ -0,0 +1,164 @@
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import mcp.types as types
+import pytest
+
+from sefaria_jewish_library import fast_start, server
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+RESPONSES = {
+    "protocol_versions": ["2025-03-26", "2025-06-18"],
+    "initialize": {"protocolVersion": "2025-06-18", "serverInfo": {"name": "saved"}},
+    "tools/list": {"tools": [{"name": "saved_tool"}]},
+}
+
+
+def message(request_id, method, **params):
+    line = {"jsonrpc": "2.0", "method": method, "params": params}
+    if request_id is not None:
+        line["id"] = request_id
+    return json.dumps(line).encode() + b"\n"
+
+
+class Importer:
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+class Buffer(io.BytesIO):
+    """
+    A BytesIO left readable when the text wrappers around it are closed.
+    """
+
+    def close(self):
+        pass
+
+
+def redirect(monkeypatch):
+    """
+    Replaces the buffers of stdin and stdout, and returns them. Done in the test itself, as the
+    output capture of pytest sets sys.stdout again after the fixtures.
+    """
+    stdin, stdout = Buffer(), Buffer()
+    monkeypatch.setattr(sys, "stdin", SimpleNamespace(buffer=stdin))
+    monkeypatch.setattr(sys, "stdout", SimpleNamespace(buffer=stdout))
+    return stdin, stdout
+
+
+def responses(stdout):
+    return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+
+def test_startup_requests_are_answered_from_the_saved_responses(monkeypatch):
+    stdin, stdout = redirect(monkeypatch)
+    lines = [
+        message(1, "initialize", protocolVersion="2025-03-26"),
+        message(None, "notifications/initialized"),
+        message(2, "tools/list"),
+        message(3, "tools/call", name="get_text", arguments={}),
+        message(4, "tools/list"),
+    ]
+    stdin.write(b"".join(lines))
+    stdin.seek(0)
+    replay, answered = fast_start.answer_startup_requests(RESPONSES, Importer())
+    # The server gets the initialize request and everything from the first request it must answer
+    assert replay == [lines[0], lines[1], lines[3]]
+    assert answered == {1}
+    assert responses(stdout) == [
+        {"jsonrpc": "2.0", "id": 1, "result": {"protocolVersion": "2025-03-26", "serverInfo": {"name": "saved"}}},
+        {"jsonrpc": "2.0", "id": 2, "result": RESPONSES["tools/list"]},
+    ]
+    # The following requests are left for the server
+    assert sys.stdin.buffer.readline() == lines[4]
+
+
+def test_startup_requests_stop_once_the_server_is_imported(monkeypatch):
+    stdin, stdout = redirect(monkeypatch)
+    call = message(2, "tools/call", name="get_text", arguments={})
+    stdin.write(message(1, "initialize", protocolVersion="1999-01-01") + call)
+    stdin.seek(0)
+    replay, answered = fast_start.answer_startup_requests(RESPONSES, Importer(alive=False))
+    assert replay == [message(1, "initialize", protocolVersion="1999-01-01")] and answered == {1}
+    # An unsupported protocol version gets the saved one
+    assert responses(stdout)[0]["result"]["protocolVersion"] == "2025-06-18"
+    assert fast_start.answer_startup_requests(RESPONSES, Importer()) == ([call], set())
+    # Closed stdin
+    assert fast_start.answer_startup_requests(RESPONSES, Importer()) is None
+
+
+def test_the_server_responses_to_answered_requests_are_dropped(monkeypatch):
+    _stdin, stdout = redirect(monkeypatch)
+
+    async def write():
+        output = fast_start.FilteredOutput({1})
+        for line in ({"jsonrpc": "2.0", "id": 1, "result": {}}, {"jsonrpc": "2.0", "id": 3, "result": {}},
+                     {"jsonrpc": "2.0", "id": 1, "method": "ping"}, {"jsonrpc": "2.0", "id": 1, "result": {}}):
+            await output.write(json.dumps(line) + "\n")
+        await output.flush()
+
+    asyncio.run(write())
+    # Only the first response with an answered id is the server's answer to it
+    assert [(line["id"], "method" in line) for line in responses(stdout)] == [(3, False), (1, True), (1, False)]
+
+
+def test_saved_responses_depend_on_the_configuration(monkeypatch, tmp_path):
+    monkeypatch.setattr(fast_start, "STARTUP_DIR", str(tmp_path))
+    assert fast_start.load() is None
+    fast_start.save(RESPONSES)
+    assert fast_start.load() == RESPONSES
+    monkeypatch.setenv("SEFARIA_PAGE_SEGMENTS", "5")
+    assert fast_start.load() is None
+
+
+def run_server(env, lines):
+    process = subprocess.run(
+        [sys.executable, "-c", "import sefaria_jewish_library; sefaria_jewish_library.main()"],
+        input=b"".join(lines), capture_output=True, env=env, timeout=60,
+    )
+    assert process.returncode == 0, process.stderr.decode()
+    return [json.loads(line) for line in process.stdout.splitlines()]
+
+
+def test_fast_start_hands_over_to_the_server(tmp_path):
+    env = {
+        **{name: value for name, value in os.environ.items() if not name.startswith("SEFARIA_")},
+        "PYTHONPATH": SRC_DIR,
+        "SEFARIA_FAST_START": "1",
+        "SEFARIA_CACHE_DIR": str(tmp_path),
+        "SEFARIA_LOG_FILE": str(tmp_path / "server.log"),
+    }
+    lines = [
+        message(1, "initialize", protocolVersion="2025-06-18", capabilities={}, clientInfo={"name": "test", "version": "1"}),
+        message(None, "notifications/initialized"),
+        message(2, "tools/list"),
+        # Fails validation, so no request is made to Sefaria
+        message(3, "tools/call", name="get_text", arguments={"max_segments": 0}),
+    ]
+    # The first run starts normally and saves the startup responses
+    first = run_server(env, lines)
+    assert [path.name for path in tmp_path.glob("startup-*.json")]
+    # The next one answers them from the saved responses, then the server answers the rest, once each
+    second = run_server(env, lines)
+    assert [response["id"] for response in second] == [1, 2, 3]
+    assert second[:2] == first[:2]
+    assert second[2]["result"]["content"][0]["text"] == "Error: Input validation error: 'reference' is a required property"
+
+
+def test_invalid_arguments_are_reported_as_a_tool_error():
+    result = asyncio.run(server.handle_call_tool("get_text", {"reference": "Genesis 1", "max_chars": "many"}))
+    assert result == [types.TextContent(type="text", text="Error: Input validation error: 'many' is not of type 'integer'")]
+    # Through the SDK, whose own validation is off
+    request = types.CallToolRequest(
+        method="tools/call", params=types.CallToolRequestParams(name="search_texts", arguments={"size": 10})
+    )
+    result = asyncio.run(server.server.request_handlers[types.CallToolRequest](request)).root
+    assert result.content[0].text == "Error: Input validation error: 'query' is a required property"
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from sefaria_jewish_library import refs, sefaria_handler
+
+
+@pytest.mark.parametrize("references, expected", [
+    (["Genesis 1:1", "Genesis 1:2", "Genesis 1:3", "Genesis 2:1"], [
+        ("Genesis 1:1-3", ["Genesis 1:1", "Genesis 1:2", "Genesis 1:3"]), ("Genesis 2:1", ["Genesis 2:1"]),
+    ]),
+    (["Genesis 1", "Genesis 2"], [("Genesis 1", ["Genesis 1"]), ("Genesis 2", ["Genesis 2"])]),
+    (["Berakhot 2a", "Berakhot 2b"], [("Berakhot 2a", ["Berakhot 2a"]), ("Berakhot 2b", ["Berakhot 2b"])]),
+    (["Genesis 1:2", "Genesis 1:1"], [("Genesis 1:2", ["Genesis 1:2"]), ("Genesis 1:1", ["Genesis 1:1"])]),
+])
+def test_merge_refs_only_merges_adjacent_segments(references, expected):
+    assert refs.merge_refs(references) == expected
+
+
+def test_get_texts_fetches_adjacent_segments_as_one_range(upstream):
+    upstream.texts = {
+        "Genesis 1:1-3": {"hebrew": ["בראשית", "והארץ", "ויאמר"]},
+        "Genesis 2:1": {"hebrew": "ויכלו"},
+    }
+    results = asyncio.run(sefaria_handler.get_texts(["Genesis 1:1", "Genesis 1:2", "Gen. 1:3", "Genesis 2:1", "Genesis 1:2"]))
+    assert results == [
+        ("Genesis 1:1", "בראשית", None),
+        ("Genesis 1:2", "והארץ", None),
+        ("Gen. 1:3", "ויאמר", None),
+        ("Genesis 2:1", "ויכלו", None),
+        ("Genesis 1:2", "והארץ", None),
+    ]
+    assert sorted(upstream.text_refs()) == ["Genesis 1:1-3", "Genesis 2:1"]
+
+
+def test_get_texts_fetches_sections_one_request_each(upstream):
+    upstream.texts = {"Genesis 1": {"hebrew": ["בראשית", "והארץ"]}, "Genesis 2": {"hebrew": ["ויכלו"]}}
+    results = asyncio.run(sefaria_handler.get_texts(["Genesis 1", "Genesis 2"]))
+    assert [text for _ref, text, _error in results] == ["בראשית\nוהארץ", "ויכלו"]
+    assert sorted(upstream.text_refs()) == ["Genesis 1", "Genesis 2"]
+
+
+def test_get_texts_falls_back_to_single_segments_when_a_range_does_not_line_up(upstream):
+    upstream.texts = {
+        "Genesis 1:1-2": {"hebrew": ["בראשית"]},
+        "Genesis 1:1": {"hebrew": "בראשית"},
+        "Genesis 1:2": {"hebrew": "והארץ"},
+    }
+    results = asyncio.run(sefaria_handler.get_texts(["Genesis 1:1", "Genesis 1:2"]))
+    assert [text for _ref, text, _error in results] == ["בראשית", "והארץ"]
+    assert upstream.text_refs()[0] == "Genesis 1:1-2"
+    assert sorted(upstream.text_refs()[1:]) == ["Genesis 1:1", "Genesis 1:2"]
+
+
+def test_get_texts_reports_errors_per_reference(upstream):
+    upstream.texts = {"Genesis 1:1": {"hebrew": "בראשית"}}
+    results = asyncio.run(sefaria_handler.get_texts(["Genesis 1:1", "Genesis 51:1", "Exodus 1:1"]))
+    assert results[0] == ("Genesis 1:1", "בראשית", None)
+    assert results[1][1] is None and results[1][2].startswith("Invalid reference")
+    assert results[2] == ("Exodus 1:1", None, "Could not retrieve text for Exodus 1:1")
+    assert sorted(upstream.text_refs()) == ["Exodus 1:1", "Genesis 1:1"]
+    with pytest.raises(ValueError):
+        asyncio.run(sefaria_handler.get_texts(["Genesis 1:1"] * (sefaria_handler.MAX_BATCH_SIZE + 1)))
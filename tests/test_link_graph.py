@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import pytest
+
+from sefaria_jewish_library import link_graph, sefaria_handler
+
+LINKS = [
+    ("Genesis 1:1", "Rashi on Genesis 1:1:1", "commentary", "Tanakh", "Commentary"),
+    ("Genesis 1:1", "Ramban on Genesis 1:1:1", "commentary", "Tanakh", "Commentary"),
+    ("Genesis 1:1", "Berakhot 2a", "quotation", "Tanakh", "Talmud"),
+    ("Genesis 1:2", "Rashi on Genesis 1:2:1", "commentary", "Tanakh", "Commentary"),
+    ("Genesis 1:1", "Genesis 1:2", "related", "Tanakh", "Tanakh"),
+    ("Genesis 10:1", "Rashi on Genesis 10:1:1", "commentary", "Tanakh", "Commentary"),
+    ("Rashi on Genesis 1:1:1", "Siftei Chakhamim, Genesis 1:1:1", "commentary", "Commentary", "Commentary"),
+    ("Berakhot 2a", "Mishneh Torah, Reading the Shema 1:9", "halakha", "Talmud", "Halakhah"),
+    ("Mishneh Torah, Reading the Shema 1:9", "Shulchan Arukh, Orach Chayim 235:1", "halakha", "Halakhah", "Halakhah"),
+]
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    graph = link_graph.LinkGraph(":memory:")
+    monkeypatch.setattr(link_graph, "_graph", graph)
+    yield graph
+    graph.close()
+
+
+def refs_of(links):
+    return [link.ref for link in links]
+
+
+def test_import_links_stores_both_directions(graph):
+    assert graph.import_links(LINKS) == len(LINKS)
+    assert graph.complete
+    assert graph.stats() == {"nodes": 11, "edges": len(LINKS), "complete": True}
+    assert refs_of(graph.links("Berakhot 2a")) == ["Genesis 1:1", "Mishneh Torah, Reading the Shema 1:9"]
+    assert graph.links("Berakhot 2a")[0] == link_graph.Link("Genesis 1:1", None, "Tanakh", "quotation")
+    # A new import replaces the store
+    assert graph.import_links(LINKS[:1]) == 1
+    assert graph.stats()["nodes"] == 2
+
+
+def test_links_of_a_complete_graph_include_those_of_the_segments(graph):
+    graph.import_links(LINKS)
+    # Not Genesis 10:1, and not the link between two verses of the chapter
+    assert sorted(refs_of(graph.links("Genesis 1"))) == [
+        "Berakhot 2a", "Ramban on Genesis 1:1:1", "Rashi on Genesis 1:1:1", "Rashi on Genesis 1:2:1",
+    ]
+    assert "Genesis 1:2" in refs_of(graph.links("Genesis 1:1"))
+
+
+def test_links_of_an_incomplete_graph_are_those_of_the_ref_only(graph):
+    graph.add_links("Genesis 1:1", [
+        {"sourceRef": "Rashi on Genesis 1:1:1", "sourceHeRef": 'רש"י על בראשית א:א:א', "type": "commentary", "category": "Commentary"},
+        {"sourceRef": "Berakhot 2a", "type": "quotation", "category": "Talmud"},
+    ])
+    graph.add_links("Genesis 1:2", [{"sourceRef": "Rashi on Genesis 1:2:1", "type": "commentary"}])
+    assert not graph.complete
+    assert graph.links("Genesis 1") == []
+    assert graph.links("Genesis 1:1")[0] == link_graph.Link(
+        "Rashi on Genesis 1:1:1", 'רש"י על בראשית א:א:א', "Commentary", "commentary"
+    )
+    assert refs_of(graph.links("Berakhot 2a")) == ["Genesis 1:1"]
+
+
+def test_is_known_expires_after_the_ttl(graph, monkeypatch):
+    assert not graph.is_known("Genesis 1:1")
+    graph.add_links("Genesis 1:1", [{"sourceRef": "Berakhot 2a", "type": "quotation"}])
+    assert graph.is_known("Genesis 1:1")
+    # Linked texts were not fetched themselves
+    assert not graph.is_known("Berakhot 2a")
+    now = link_graph.time.time()
+    monkeypatch.setattr(link_graph.time, "time", lambda: now + link_graph.LINK_GRAPH_TTL + 1)
+    assert not graph.is_known("Genesis 1:1")
+    graph.import_links([])
+    assert graph.is_known("Genesis 1:1") and graph.is_known("Unknown 1:1")
+
+
+def traverse(**kwargs):
+    return [(link["ref"], link["depth"]) for link in asyncio.run(link_graph.traverse("Genesis 1:1", **kwargs))]
+
+
+def test_traverse_breadth_and_depth_first(graph):
+    graph.import_links(LINKS)
+    assert traverse(depth=2) == [
+        ("Rashi on Genesis 1:1:1", 1), ("Ramban on Genesis 1:1:1", 1), ("Berakhot 2a", 1), ("Genesis 1:2", 1),
+        ("Siftei Chakhamim, Genesis 1:1:1", 2), ("Mishneh Torah, Reading the Shema 1:9", 2), ("Rashi on Genesis 1:2:1", 2),
+    ]
+    assert traverse(depth=2, order="dfs")[:3] == [
+        ("Rashi on Genesis 1:1:1", 1), ("Siftei Chakhamim, Genesis 1:1:1", 2), ("Ramban on Genesis 1:1:1", 1),
+    ]
+
+
+def test_traverse_limits(graph):
+    graph.import_links(LINKS)
+    assert traverse(depth=1, max_fanout=2) == [("Rashi on Genesis 1:1:1", 1), ("Ramban on Genesis 1:1:1", 1)]
+    assert len(traverse(depth=3, max_nodes=5)) == 5
+    assert traverse(depth=1, types=["Quotation"]) == [("Berakhot 2a", 1)]
+    # One filter per hop, on the ref or the category; the path sets the depth
+    assert traverse(path=["talmud", "Mishneh Torah", "Shulchan Arukh"]) == [
+        ("Berakhot 2a", 1), ("Mishneh Torah, Reading the Shema 1:9", 2), ("Shulchan Arukh, Orach Chayim 235:1", 3),
+    ]
+    assert traverse(path=["talmud", "Shulchan Arukh"]) == [("Berakhot 2a", 1)]
+
+
+def test_traverse_fetches_links_off_the_event_loop(graph, monkeypatch):
+    related = {
+        "Genesis 1:1": [{"sourceRef": "Rashi on Genesis 1:1:1", "type": "commentary", "category": "Commentary"}],
+        "Rashi on Genesis 1:1:1": [{"sourceRef": "Siftei Chakhamim, Genesis 1:1:1", "type": "commentary"}],
+    }
+    fetched = []
+
+    async def get_request_json_data(endpoint, ref, param=None):
+        fetched.append(ref)
+        return {"links": related.get(ref, [])}
+
+    monkeypatch.setattr(sefaria_handler, "get_request_json_data", get_request_json_data)
+    threads = set()
+    for name in ("is_known", "links", "add_links"):
+        def recorded(*args, method=getattr(graph, name)):
+            threads.add(threading.current_thread())
+            return method(*args)
+        monkeypatch.setattr(graph, name, recorded)
+    assert traverse(depth=2) == [("Rashi on Genesis 1:1:1", 1), ("Siftei Chakhamim, Genesis 1:1:1", 2)]
+    assert fetched == ["Genesis 1:1", "Rashi on Genesis 1:1:1"]
+    assert threads and threading.main_thread() not in threads
+    # Known links are not fetched again
+    assert traverse(depth=2) == [("Rashi on Genesis 1:1:1", 1), ("Siftei Chakhamim, Genesis 1:1:1", 2)]
+    assert len(fetched) == 2
@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from sefaria_jewish_library import link_graph, output, parallels, server
+
+RASHI = {
+    "sourceRef": "Rashi on Genesis 1:1:1", "sourceHeRef": 'רש"י על בראשית א:א:א', "type": "commentary",
+    "category": "Commentary", "collectiveTitle": {"en": "Rashi", "he": 'רש"י'},
+}
+RAMBAN = {
+    "sourceRef": "Ramban on Genesis 1:1:1", "sourceHeRef": 'רמב"ן על בראשית א:א:א', "type": "commentary",
+    "category": "Commentary", "collectiveTitle": {"en": "Ramban", "he": 'רמב"ן'},
+}
+
+
+def call(name, **arguments):
+    [content] = asyncio.run(server.handle_call_tool(name, arguments))
+    assert not content.text.startswith("Error"), content.text
+    result = json.loads(content.text)
+    # Compact, with the Hebrew unescaped
+    assert content.text == output.dumps(result)
+    return result
+
+
+def test_search_texts_json(upstream):
+    upstream.search = {"hits": {"total": {"value": 30}, "hits": [
+        {"_source": {"ref": f"Genesis 1:{n}", "heRef": f"בראשית א:{n}", "path": "Tanakh/Torah/Genesis"},
+         "highlight": {"naive_lemmatizer": [f"<b>אור</b> {n}"]}}
+        for n in range(1, 4)
+    ]}}
+    result = call("search_texts", query="אור", size=2, format="json")
+    assert result["total"] == 30 and result["offset"] == 0 and result["next_offset"] == 2
+    assert [set(hit) for hit in result["hits"]] == [{"ref", "heRef", "path", "snippet"}] * 2
+    assert result["hits"][0]["heRef"] == "בראשית א:1"
+    result = call("search_texts", query="אור", size=2, offset=2, format="json", fields=["ref"])
+    assert result["hits"] == [{"ref": "Genesis 1:3"}]
+
+
+def test_get_commentaries_json(upstream):
+    upstream.related = {"Genesis 1:1": [RASHI, RAMBAN, {"sourceRef": "Berakhot 2a", "type": "quotation"}]}
+    result = call("get_commentaries", reference="Genesis 1:1", format="json")
+    assert result == [
+        {"ref": "Rashi on Genesis 1:1:1", "heRef": 'רש"י על בראשית א:א:א', "commentator": "Rashi", "heCommentator": 'רש"י', "category": "Commentary"},
+        {"ref": "Ramban on Genesis 1:1:1", "heRef": 'רמב"ן על בראשית א:א:א', "commentator": "Ramban", "heCommentator": 'רמב"ן', "category": "Commentary"},
+    ]
+    upstream.texts = {"Rashi on Genesis 1:1:1": {"hebrew": ["בראשית", "אמר רבי יצחק"]}}
+    result = call("get_commentaries", reference="Genesis 1:1", format="json", commentators=["Rashi"],
+                  include_text=True, fields=["commentator", "text"])
+    assert result == [{"commentator": "Rashi", "text": "בראשית אמר רבי יצחק"}]
+
+
+def test_get_daily_learnings_json(upstream):
+    upstream.calendars = {"date": "2025-10-17", "timezone": "Asia/Jerusalem", "calendar_items": [
+        {"title": {"en": "Parashat Hashavua", "he": "פרשת השבוע"}, "displayValue": {"en": "Bereshit", "he": "בראשית"},
+         "ref": "Genesis 1:1-6:8", "heRef": "בראשית א:א-ו:ח", "category": "Tanakh", "order": 1},
+        {"title": {"en": "Daf Yomi", "he": "דף יומי"}, "ref": "Berakhot 2", "order": 0},
+    ]}
+    result = call("get_daily_learnings", format="json")
+    assert result["date"] == "2025-10-17" and result["timezone"] == "Asia/Jerusalem"
+    assert set(result["items"][0]) == {"title", "heTitle", "display", "heDisplay", "ref", "heRef", "category", "order"}
+    # Empty fields are left out, a zero is kept
+    assert result["items"][1] == {"title": "Daf Yomi", "heTitle": "דף יומי", "ref": "Berakhot 2", "order": 0}
+    result = call("get_daily_learnings", format="json", fields=["ref"])
+    assert result["items"] == [{"ref": "Genesis 1:1-6:8"}, {"ref": "Berakhot 2"}]
+
+
+def test_traverse_links_json(upstream, monkeypatch):
+    graph = link_graph.LinkGraph(":memory:")
+    monkeypatch.setattr(link_graph, "_graph", graph)
+    graph.import_links([
+        ("Genesis 1:1", "Rashi on Genesis 1:1:1", "commentary", "Tanakh", "Commentary"),
+        ("Rashi on Genesis 1:1:1", "Siftei Chakhamim, Genesis 1:1:1", "commentary", "Commentary", "Commentary"),
+    ])
+    result = call("traverse_links", reference="Genesis 1:1", format="json")
+    assert result == [
+        {"ref": "Rashi on Genesis 1:1:1", "parent": "Genesis 1:1", "depth": 1, "type": "commentary", "category": "Commentary"},
+        {"ref": "Siftei Chakhamim, Genesis 1:1:1", "parent": "Rashi on Genesis 1:1:1", "depth": 2, "type": "commentary", "category": "Commentary"},
+    ]
+    assert call("traverse_links", reference="Genesis 1:1", depth=1, format="json", fields=["ref", "depth"]) == [
+        {"ref": "Rashi on Genesis 1:1:1", "depth": 1},
+    ]
+    graph.close()
+
+
+def test_find_parallels_json(monkeypatch):
+    found = [{"ref": "Psalms 1:2", "heRef": "תהילים א:ב", "path": "Tanakh/Writings/Psalms", "score": 0.5, "text": "In the beginning"}]
+    monkeypatch.setattr(parallels, "find_parallels", lambda *args: [("Genesis 1:1", found)])
+    assert call("find_parallels", reference="Genesis 1:1", format="json") == [{"query": "Genesis 1:1", "parallels": found}]
+    assert call("find_parallels", reference="Genesis 1:1", format="json", fields=["ref", "score"]) == [
+        {"query": "Genesis 1:1", "parallels": [{"ref": "Psalms 1:2", "score": 0.5}]},
+    ]
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("search_texts", {"query": "אור"}),
+    ("get_commentaries", {"reference": "Genesis 1:1"}),
+    ("get_daily_learnings", {}),
+    ("traverse_links", {"reference": "Genesis 1:1"}),
+    ("find_parallels", {"reference": "Genesis 1:1"}),
+])
+def test_unknown_fields_are_rejected(name, arguments):
+    [content] = asyncio.run(server.handle_call_tool(name, {**arguments, "format": "json", "fields": ["nothing"]}))
+    assert content.text.startswith("Error: Input validation error: 'nothing' is not one of")
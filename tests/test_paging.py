@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from sefaria_jewish_library import sefaria_handler, server
+
+CHAPTER = {"hebrew": [f"פסוק {n}" for n in range(1, 8)], "english": [f"Verse {n}" for n in range(1, 8)]}
+
+
+def test_explicit_zero_offset_pages_from_the_start(upstream, monkeypatch):
+    monkeypatch.setattr(sefaria_handler, "PAGE_SEGMENTS", 2)
+    upstream.texts = {"Genesis 1": CHAPTER}
+    text = asyncio.run(sefaria_handler.get_text("Genesis 1", offset=0))
+    assert text == "[Genesis 1:1] פסוק 1\n[Genesis 1:2] פסוק 2\n\n(segments 1-2 of Genesis 1; more with offset=2)"
+    # A limit of its own is kept, the default is only used for the others
+    text = asyncio.run(sefaria_handler.get_text("Genesis 1", offset=0, max_segments=3, languages=["english"]))
+    assert text.endswith("(segments 1-3 of Genesis 1; more with offset=3)")
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("get_text", {"reference": "Genesis 1", "max_segments": 0}),
+    ("get_text", {"reference": "Genesis 1", "max_chars": 0}),
+    ("get_text", {"reference": "Genesis 1", "offset": -1}),
+    ("search_texts", {"query": "אור", "size": 0}),
+    ("search_texts", {"query": "אור", "offset": -5}),
+])
+def test_page_limits_below_their_minimum_are_rejected(name, arguments):
+    assert "less than the minimum" in server.input_error(name, arguments)
+
+
+def test_zero_offset_and_slop_are_valid():
+    assert server.input_error("get_text", {"reference": "Genesis 1", "offset": 0}) is None
+    assert server.input_error("search_texts", {"query": "אור", "slop": 0, "offset": 0}) is None
+
+
+def walk(reference, **kwargs):
+    """
+    Reads a text page by page, following next_offset. Returns the pages' segments.
+    """
+    pages = []
+    offset = 0
+    while offset is not None:
+        page = asyncio.run(sefaria_handler.get_text_page(reference, offset, **kwargs))
+        assert page["offset"] == offset
+        pages.append(page["segments"])
+        offset = page["next_offset"]
+    return pages
+
+
+def test_pages_follow_the_cursor_to_the_end(upstream):
+    upstream.texts = {"Genesis 1": CHAPTER}
+    pages = walk("Genesis 1", max_segments=3, max_chars=None)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [segment for page in pages for segment in page] == [
+        (f"Genesis 1:{n}", f"פסוק {n}") for n in range(1, 8)
+    ]
+    # Pages past the end are empty
+    page = asyncio.run(sefaria_handler.get_text_page("Genesis 1", 7))
+    assert page["segments"] == [] and page["next_offset"] is None
+    # The text is fetched once for all the pages
+    assert upstream.text_refs() == ["Genesis 1"]
+
+
+def test_pages_are_limited_by_characters(upstream):
+    upstream.texts = {"Genesis 1": {"hebrew": ["א" * 10, "ב" * 10, "ג" * 25, "ד" * 5]}}
+    pages = walk("Genesis 1", max_segments=None, max_chars=20)
+    # A segment longer than the limit still gets a page of its own
+    assert [[len(segment) for _ref, segment in page] for page in pages] == [[10, 10], [25], [5]]
+
+
+def test_pages_of_a_daf(upstream):
+    upstream.texts = {"Berakhot 2a": {"hebrew": ["מאימתי", "", "קורין", "את שמע"]}}
+    pages = walk("Berakhot 2a", max_segments=2, max_chars=None)
+    # Empty segments are skipped, and keep their numbers
+    assert pages == [
+        [("Berakhot 2a:1", "מאימתי"), ("Berakhot 2a:3", "קורין")],
+        [("Berakhot 2a:4", "את שמע")],
+    ]
+
+
+def test_pages_of_a_range_across_sections(upstream):
+    upstream.texts = {"Genesis 1:30-2:2": {"hebrew": [["ל", "לא"], ["א", "ב"]]}}
+    pages = walk("Genesis 1:30-2:2", max_segments=3, max_chars=None)
+    assert [[ref for ref, _segment in page] for page in pages] == [
+        ["Genesis 1:30", "Genesis 1:31", "Genesis 2:1"], ["Genesis 2:2"],
+    ]
+
+
+def test_pages_of_several_versions(upstream):
+    upstream.texts = {"Genesis 1": CHAPTER}
+    pages = walk("Genesis 1", max_segments=4, max_chars=None, versions=["hebrew", "english"])
+    assert [len(page) for page in pages] == [4, 3]
+    assert pages[1][-1] == ("Genesis 1:7", ["פסוק 7", "Verse 7"])
+    # The characters of all the versions count
+    pages = walk("Genesis 1", max_segments=None, max_chars=30, versions=["hebrew", "english"])
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
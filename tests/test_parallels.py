@@ -0,0 +1,93 @@
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy.sparse")
+
+from sefaria_jewish_library import corpus, parallels  # noqa: E402
+
+BOOKS = [
+    (1, "Genesis", ["Tanakh", "Torah"], [
+        "In the beginning God created the heaven and the earth",
+        "And the earth was without form and void",
+        "And God said let there be light and there was light",
+    ]),
+    (2, "Psalms", ["Tanakh", "Writings"], [
+        "The heavens declare the glory of God",
+        "In the beginning the Lord created the heaven and the earth",
+    ]),
+    (3, "Berakhot", ["Talmud", "Bavli"], [
+        "From when do we recite the Shema in the evening",
+        "The sage said let there be light in the house of study",
+    ]),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "corpus.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(corpus.SCHEMA)
+    for book_id, title, categories, segments in BOOKS:
+        conn.execute("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?)", (book_id, title, title, None, json.dumps(categories), '["Chapter", "Verse"]'))
+        conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?)", (book_id, book_id, "en", "v"))
+        conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?)", [
+            (book_id, seq, f"{title} 1:{seq + 1}", json.dumps([0, seq]), text) for seq, text in enumerate(segments)
+        ])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def index(db_path, tmp_path):
+    directory = str(tmp_path / "parallels")
+    stats = parallels.build(db_path, directory)
+    assert stats["segments"] == 7 and stats["terms"] > 0
+    # Rebuilding replaces the index in place
+    assert parallels.build(db_path, directory) == stats
+    return parallels.ParallelsIndex.load(directory)
+
+
+def test_load_keeps_the_matrix_memory_mapped(index):
+    assert index.matrix.shape == (7, len(index.terms))
+    assert index.terms == sorted(index.terms)
+    # Terms in a single segment, or in more than half of them, are left out
+    assert "glory" not in index.terms and "the" not in index.terms
+    assert "beginning" in index.terms
+    assert index.keys[0] == 1 << 32 and index.keys[-1] == 3 << 32 | 1
+    assert index.versions[3]["path"] == "Talmud/Bavli/Berakhot"
+
+
+def test_top_k_ranks_rows_by_cosine_similarity(index):
+    queries = index.vectorize([(BOOKS[0][3][0], "en"), ("let there be light", "en"), ("unknown words", "en")])
+    first, second, third = index.top_k(queries, k=2)
+    assert [row for row, _score in first] == [0, 4]
+    assert first[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert first[0][1] > first[1][1] > 0
+    assert {row for row, _score in second} == {2, 6}
+    assert third == []
+
+
+def test_row_mask_filters_and_excludes(index):
+    assert index.row_mask().tolist() == [True] * 7
+    assert index.row_mask(["talmud"]).tolist() == [False] * 5 + [True] * 2
+    assert index.row_mask(exclude=[(1, 0, 1)]).tolist() == [False, False] + [True] * 5
+    queries = index.vectorize([("let there be light", "en")])
+    assert [row for row, _score in index.top_k(queries, 5, index.row_mask(["Talmud"]))[0]] == [6]
+
+
+def test_find_parallels_leaves_out_the_reference(index, db_path, monkeypatch):
+    store = corpus.CorpusStore(db_path)
+    monkeypatch.setattr(corpus, "_store", store)
+    monkeypatch.setattr(parallels, "_index", index)
+    [(name, found)] = parallels.find_parallels("Genesis 1:1", k=1)
+    assert name == "Genesis 1:1"
+    assert [parallel["ref"] for parallel in found] == ["Psalms 1:2"]
+    assert found[0]["path"] == "Tanakh/Writings/Psalms"
+    per_segment = parallels.find_parallels("Genesis 1:1-3", k=1, filters=["Talmud"], per_segment=True)
+    assert [name for name, _found in per_segment] == ["Genesis 1:1", "Genesis 1:2", "Genesis 1:3"]
+    assert [parallel["ref"] for parallel in per_segment[2][1]] == ["Berakhot 1:2"]
+    store.close()
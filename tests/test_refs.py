@@ -0,0 +1,67 @@
+import pytest
+
+from sefaria_jewish_library import refs
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("Genesis 1:1", "Genesis 1:1"),
+    ("Gen. 1.1", "Genesis 1:1"),
+    ("בראשית פרק א פסוק א", "Genesis 1:1"),
+    ("Genesis 1:1-5", "Genesis 1:1-5"),
+    ("Genesis 50:26", "Genesis 50:26"),
+    ("Berakhot 64a", "Berakhot 64a"),
+    ("Berakhot 2a:3", "Berakhot 2a:3"),
+    ("ברכות ב.", "Berakhot 2a"),
+    ("ברכות ב:", "Berakhot 2b"),
+    ("1 Samuel 3:4", "I Samuel 3:4"),
+    ("I Samuel 3:4", "I Samuel 3:4"),
+    ("שמואל א ג:ד", "I Samuel 3:4"),
+    ("Rashi on Genesis 1:1:1", "Rashi on Genesis 1:1:1"),
+])
+def test_canonicalize(reference, expected):
+    assert refs.canonicalize(reference) == expected
+
+
+@pytest.mark.parametrize("reference", ["Genesis 51:1", "Berakhot 65a", "Genesis 0:1", "Genesis 1:1-0"])
+def test_canonicalize_rejects_refs_that_cannot_exist(reference):
+    with pytest.raises(refs.InvalidRef):
+        refs.canonicalize(reference)
+
+
+def test_unknown_titles_are_passed_through():
+    assert refs.canonicalize("Unknown Book 3:4") == "Unknown Book 3:4"
+
+
+def test_hebrew_numerals():
+    assert refs.hebrew_numeral(15) == "טו"
+    assert refs.hebrew_numeral(16) == "טז"
+    assert refs.parse_hebrew_numeral("טו") == 15
+    assert refs.parse("Genesis 1:1-5").he_normal() == "בראשית א:א-ה"
+
+
+def test_split_and_merge_ranges():
+    assert refs.split_range("Genesis 1:1-3") == ["Genesis 1:1", "Genesis 1:2", "Genesis 1:3"]
+    assert refs.merge_refs(["Genesis 1:1", "Genesis 1:2", "Genesis 1:3", "Berakhot 2a"]) == [
+        ("Genesis 1:1-3", ["Genesis 1:1", "Genesis 1:2", "Genesis 1:3"]),
+        ("Berakhot 2a", ["Berakhot 2a"]),
+    ]
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("JPS 1985 Footnotes on Genesis 1:1", "JPS 1985 Footnotes on Genesis 1:1"),
+    ("Be'er Heitev on Genesis 1:1", "Be'er Heitev on Genesis 1:1"),
+    ("Notes by Rabbi Yehuda Leib Ginsburg on Gen. 1:1", "Notes by Rabbi Yehuda Leib Ginsburg on Genesis 1:1"),
+    ("jps  1985 footnotes on Genesis 1:1", "jps 1985 footnotes on Genesis 1:1"),
+])
+def test_unknown_commentators_are_kept_as_written(reference, expected):
+    assert refs.canonicalize(reference) == expected
+
+
+@pytest.mark.parametrize("reference, expected", [
+    ("Taz on Genesis 1:1", "Turei Zahav on Genesis 1:1"),
+    ('ש"ך על בראשית א:א', "Siftei Kohen on Genesis 1:1"),
+    ("Be'er Hetev on Genesis 1:1", "Be'er Heitev on Genesis 1:1"),
+])
+def test_commentator_names_resolve_to_sefaria_titles(reference, expected):
+    assert refs.canonicalize(reference) == expected
+    assert refs.parse(reference).he_normal().startswith(("טורי זהב על", "שפתי כהן על", "באר היטב על"))
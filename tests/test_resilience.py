@@ -0,0 +1,189 @@
+import asyncio
+
+import httpx
+import pytest
+
+from sefaria_jewish_library import resilience
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def status_error(status_code):
+    request = httpx.Request("GET", "https://sefaria.org/api/v3/texts/Genesis")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def test_deadlines_nest_and_bound_request_timeouts(clock):
+    assert resilience.remaining() is None
+    assert resilience.request_timeout(10) == 10
+    with resilience.deadline(5):
+        assert resilience.request_timeout(10) == 5
+        with resilience.deadline(30):
+            # The enclosing earlier deadline still applies
+            assert resilience.remaining() == 5
+        with resilience.deadline(2):
+            assert resilience.remaining() == 2
+        clock.now += 5
+        with pytest.raises(resilience.DeadlineExceeded):
+            resilience.request_timeout(10)
+    assert resilience.remaining() is None
+
+
+def test_retryable_errors():
+    assert resilience.is_retryable(httpx.ConnectError("refused"))
+    assert resilience.is_retryable(status_error(503))
+    assert resilience.is_retryable(status_error(429))
+    assert not resilience.is_retryable(status_error(404))
+    assert not resilience.is_retryable(resilience.DeadlineExceeded("late"))
+    assert not resilience.is_retryable(resilience.CircuitOpenError("open"))
+
+
+def test_backoff_is_jittered_up_to_its_cap(monkeypatch):
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    assert resilience.backoff(0) == resilience.RETRY_BACKOFF
+    assert resilience.backoff(1) == resilience.RETRY_BACKOFF * 2
+    assert resilience.backoff(20) == resilience.RETRY_BACKOFF_MAX
+
+
+def test_circuit_opens_probes_and_closes(clock):
+    breaker = resilience.CircuitBreaker(threshold=2, cooldown=30)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    clock.now += 30
+    # One probe after the cooldown
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow() and breaker.failures == 0
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "backoff", lambda attempt: 0)
+    monkeypatch.setattr(resilience, "RETRIES", 2)
+
+
+def sender(*outcomes):
+    """
+    Returns a send() answering with the given responses or raising the given errors, in turn.
+    """
+    calls = []
+
+    async def send():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send, calls
+
+
+def test_idempotent_requests_are_retried(breakers):
+    send, calls = sender(httpx.ConnectError("refused"), status_error(502), "response")
+    assert asyncio.run(resilience.call("api/v3/texts", send, idempotent=True)) == "response"
+    assert len(calls) == 3
+
+
+def test_retries_stop_at_client_errors_and_non_idempotent_requests(breakers):
+    send, calls = sender(status_error(404), "response")
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(resilience.call("api/v3/texts", send, idempotent=True))
+    assert len(calls) == 1
+    send, calls = sender(httpx.ConnectError("refused"), "response")
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(resilience.call("api/v3/texts", send, idempotent=False))
+    assert len(calls) == 1
+
+
+def test_retries_give_up_after_the_limit_and_open_the_circuit(breakers, monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {"api/related": resilience.CircuitBreaker(threshold=3)})
+    send, calls = sender(*[status_error(503)] * 3)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(resilience.call("api/related", send, idempotent=True))
+    assert len(calls) == 3
+    assert resilience.get_breaker("api/related").is_open
+    with pytest.raises(resilience.CircuitOpenError):
+        asyncio.run(resilience.call("api/related", send, idempotent=True))
+    assert len(calls) == 3
+
+
+def test_hedged_returns_a_fast_answer_without_hedging():
+    async def send():
+        return "first"
+
+    assert asyncio.run(resilience.hedged(send, 1)) == "first"
+
+
+def test_hedged_sends_a_second_request_and_cancels_the_slower_one():
+    cancelled = []
+    delays = [1, 0.01]
+
+    async def send():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    assert asyncio.run(resilience.hedged(send, 0.02)) == 0.01
+    assert cancelled == [1]
+
+
+def test_hedged_waits_for_the_other_request_when_one_fails():
+    delays = [0.05, 0.01]
+
+    async def send():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        if delay == 0.01:
+            raise httpx.ConnectError("refused")
+        return "first"
+
+    assert asyncio.run(resilience.hedged(send, 0.005)) == "first"
+
+
+def test_hedged_cancels_the_request_when_the_caller_is_cancelled():
+    cancelled = []
+
+    async def send():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        task = asyncio.create_task(resilience.hedged(send, 5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [1]
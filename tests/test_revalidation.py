@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from sefaria_jewish_library import cache, http_client, sefaria_handler
+
+BODY = {"ref": "Genesis 1:1", "versions": [{"language": "he", "text": "בראשית ברא אלהים"}]}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    A stand-in for Sefaria answering with an ETag, and with 304 to a matching If-None-Match.
+    Returns the headers of the requests it received.
+    """
+    requests = []
+
+    def handle(request):
+        requests.append(request.headers)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(200, json=BODY, headers={"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    monkeypatch.setattr(cache, "_cache", cache.TieredCache(cache.LRUCache()))
+    return requests
+
+
+def test_http_client_passes_304_through(upstream):
+    response = asyncio.run(http_client.request("GET", "https://sefaria.org/api/v3/texts/Genesis 1:1", headers={"If-None-Match": '"v1"'}))
+    assert response.status_code == 304
+
+
+def test_expired_entries_are_revalidated_with_a_conditional_request(upstream):
+    key = sefaria_handler._cache_key("api/v3/texts/", "Genesis 1:1")
+    response_cache = cache.get_cache()
+
+    async def main():
+        assert await sefaria_handler.get_request_json_data("api/v3/texts/", "Genesis 1:1") == BODY
+        assert response_cache.get(f"{key}:validators") == {"etag": '"v1"', "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        # Expired for longer than the stale-while-revalidate window, so revalidated before answering
+        response_cache.memory.set(key, BODY, time.time() - cache.STALE_WHILE_REVALIDATE - 10)
+        assert await sefaria_handler.get_request_json_data("api/v3/texts/", "Genesis 1:1") == BODY
+
+    asyncio.run(main())
+    assert len(upstream) == 2
+    assert "If-None-Match" not in upstream[0]
+    assert upstream[1]["If-None-Match"] == '"v1"'
+    assert upstream[1]["If-Modified-Since"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert response_cache.not_modified == 1
+    expires_at, value = response_cache.memory.get_entry(key)
+    assert value == BODY
+    assert expires_at > time.time() + cache.ttl_for("api/v3/texts/") - 60
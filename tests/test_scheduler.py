@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from sefaria_jewish_library import resilience, scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_at_its_rate_up_to_the_burst(clock):
+    family = scheduler.EndpointFamily("api/v3/texts", rate=10, burst=2)
+    for _ in range(2):
+        assert family._delay() == 0
+        family._take()
+    assert family._delay() == pytest.approx(0.1)
+    clock.now += 0.05
+    assert family._delay() == pytest.approx(0.05)
+    clock.now += 0.05
+    assert family._delay() == pytest.approx(0)
+    clock.now += 60
+    family._delay()
+    assert family.tokens == 2
+
+
+def test_throttle_pauses_and_halves_the_rate(clock):
+    family = scheduler.EndpointFamily("api/related", rate=10, burst=2)
+    family.throttle(5)
+    assert family._delay() == pytest.approx(5)
+    assert family.rate == 5
+    for _ in range(scheduler.RATE_RECOVERY):
+        family.record_success()
+    assert family.rate == 10
+
+
+def test_retry_after():
+    assert scheduler.retry_after(httpx.Response(429, headers={"Retry-After": "3"})) == 3
+    assert scheduler.retry_after(httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert scheduler.retry_after(httpx.Response(429)) is None
+
+
+async def acquire_in_order(family, requests):
+    """
+    Queues (lane, session, name) requests on an empty bucket, and returns the names in the order they got a token.
+    """
+    order = []
+
+    async def acquire(lane_name, session_id, name):
+        await family.acquire(lane_name, session_id)
+        order.append(name)
+
+    family.tokens = 0
+    await asyncio.gather(*(acquire(*request) for request in requests))
+    return order
+
+
+def test_lanes_by_priority_and_sessions_in_turn():
+    family = scheduler.EndpointFamily("api/calendars", rate=200, burst=1)
+    order = asyncio.run(acquire_in_order(family, [
+        (scheduler.BACKGROUND, None, "warm-up"),
+        (scheduler.BATCH, "a", "batch a"),
+        (scheduler.INTERACTIVE, "a", "a1"),
+        (scheduler.INTERACTIVE, "a", "a2"),
+        (scheduler.INTERACTIVE, "a", "a3"),
+        (scheduler.INTERACTIVE, "b", "b1"),
+    ]))
+    assert order == ["a1", "b1", "a2", "a3", "batch a", "warm-up"]
+
+
+def test_waiting_past_the_deadline_fails_fast():
+    family = scheduler.EndpointFamily("api/search-wrapper", rate=1, burst=1)
+    family.throttle(30)
+
+    async def acquire():
+        with resilience.deadline(0.1):
+            await family.acquire()
+
+    with pytest.raises(resilience.DeadlineExceeded):
+        asyncio.run(acquire())
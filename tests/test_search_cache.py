@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from sefaria_jewish_library import cache, sefaria_handler
+
+
+def hit(n):
+    return {"_id": f"Genesis 1:{n} (hebrew)", "_source": {"ref": f"Genesis 1:{n}", "heRef": f"בראשית א:{n}", "path": "Tanakh/Torah/Genesis"}}
+
+
+@pytest.fixture
+def search(upstream):
+    upstream.search = {"hits": {"total": {"value": 25}, "hits": [hit(n) for n in range(1, 26)]}}
+    return upstream
+
+
+def hit_refs(data):
+    return [h["_source"]["ref"] for h in data["hits"]["hits"]]
+
+
+def test_smaller_searches_are_served_from_the_cache(search):
+    first = asyncio.run(sefaria_handler.get_search_hits("בראשית  ברא", 2, None, 5))
+    assert len(hit_refs(first)) == sefaria_handler.SEARCH_PREFETCH
+    assert json.loads(search.requests[0].content)["size"] == sefaria_handler.SEARCH_PREFETCH
+    # Same search, whatever the whitespace and case, for fewer hits than fetched
+    again = asyncio.run(sefaria_handler.get_search_hits("בראשית ברא", 2, None, 10))
+    assert again == first
+    assert len(search.requests) == 1
+    # Another slop is another search
+    asyncio.run(sefaria_handler.get_search_hits("בראשית ברא", 0, None, 5))
+    assert len(search.requests) == 2
+
+
+def test_larger_searches_fetch_again(search):
+    asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 5))
+    data = asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 25))
+    assert len(hit_refs(data)) == 25
+    assert [json.loads(r.content)["size"] for r in search.requests] == [sefaria_handler.SEARCH_PREFETCH, 25]
+    # Fewer hits than asked for means all of them were fetched
+    asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 40))
+    assert len(search.requests) == 3
+    asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 50))
+    assert len(search.requests) == 3
+
+
+def test_stale_results_are_served_when_the_search_fails(search, monkeypatch):
+    monkeypatch.setattr(cache, "ttl_for", lambda endpoint: -1)
+    first = asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 5))
+    search.failing = True
+    assert asyncio.run(sefaria_handler.get_search_hits("אור", 2, None, 5)) == first
+    assert len(search.requests) == 2
+    assert cache.get_cache().stale_hits == 1
+    # Nothing to fall back on for another search
+    with pytest.raises(httpx.HTTPError):
+        asyncio.run(sefaria_handler.get_search_hits("חושך", 2, None, 5))
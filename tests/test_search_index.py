@@ -0,0 +1,133 @@
+import concurrent.futures
+import json
+import sqlite3
+import time
+
+import pytest
+
+from sefaria_jewish_library import corpus, search_index
+
+
+@pytest.mark.parametrize("postings", [
+    [],
+    [(0, [0])],
+    [(0, [0, 1, 2]), (3, [5]), (200, [127, 128, 16383, 16384, 2_000_000])],
+    [(5_000_000, [1, 300])],
+])
+def test_postings_round_trip(postings):
+    assert search_index.decode_postings(search_index.encode_postings(postings)) == dict(postings)
+
+
+def test_match_phrase_exact_and_with_slop():
+    # "a b c" at positions 0 1 2, then "a x x b c" at 10 13 14
+    positions = [[0, 10], [1, 13], [2, 14]]
+    assert search_index.match_phrase(positions, 0) == [[0, 1, 2]]
+    assert search_index.match_phrase(positions, 2) == [[0, 1, 2], [10, 13, 14]]
+
+
+def test_match_phrase_keeps_the_order_of_the_terms():
+    assert search_index.match_phrase([[5], [3]], 10) == []
+    assert search_index.match_phrase([[3], [3]], 10) == []
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(corpus.SCHEMA)
+    books = [
+        (1, "Genesis", ["Tanakh", "Torah"], "he", ["בְּרֵאשִׁית בָּרָא אֱלֹהִים", "וְהָאָרֶץ הָיְתָה תֹהוּ וָבֹהוּ", "וַיֹּאמֶר אֱלֹהִים יְהִי אוֹר"]),
+        (2, "Berakhot", ["Talmud", "Bavli"], "he", ["מאימתי קורין את שמע בערבין", "אמר רבי אלהים אמר"]),
+        (3, "Exodus", ["Tanakh", "Torah"], "en", ["These are the <b>names</b> of the sons of Israel"]),
+    ]
+    for book_id, title, categories, lang, segments in books:
+        conn.execute("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?)", (book_id, title, title, None, json.dumps(categories), "[]"))
+        conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?)", (book_id, book_id, lang, "v"))
+        conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?)", [
+            (book_id, seq, f"{title} 1:{seq + 1}", json.dumps([0, seq]), text) for seq, text in enumerate(segments)
+        ])
+    return conn
+
+
+@pytest.fixture
+def index(conn):
+    index = search_index.SearchIndex()
+    assert index.update(conn) == {"indexed": 3, "unchanged": 0, "removed": 0}
+    assert index.update(conn) == {"indexed": 0, "unchanged": 3, "removed": 0}
+    return index
+
+
+def hits(index, query, slop=0, filters=None):
+    results, _total = index.search(query, slop, filters, 10)
+    return [(shard.title, doc, match) for _score, shard, doc, match in results]
+
+
+def test_search_ignores_niqqud_and_prefixes(index):
+    assert hits(index, "בראשית ברא") == [("Genesis", 0, [0, 1])]
+    # והארץ is indexed under ארץ too
+    assert hits(index, "ארץ") == [("Genesis", 1, [0])]
+
+
+def test_search_phrase_slop(index):
+    assert hits(index, "אמר אמר") == []
+    assert hits(index, "אמר אמר", slop=2) == [("Berakhot", 1, [0, 3])]
+
+
+def test_search_filters_and_language(index):
+    assert {title for title, _doc, _match in hits(index, "אלהים")} == {"Genesis", "Berakhot"}
+    assert hits(index, "אלהים", filters=["Talmud"]) == [("Berakhot", 1, [2])]
+    assert hits(index, "names of the") == [("Exodus", 0, [3, 4, 5])]
+
+
+def reimport(conn, book_id, new_id, texts=None):
+    """
+    Replaces a version the way corpus.import_texts does: its segments move to a new version id.
+    """
+    lang, = conn.execute("SELECT lang FROM versions WHERE id = ?", (book_id,)).fetchone()
+    rows = conn.execute("SELECT seq, ref, address, text FROM segments WHERE version_id = ?", (book_id,)).fetchall()
+    conn.execute("DELETE FROM segments WHERE version_id = ?", (book_id,))
+    conn.execute("DELETE FROM versions WHERE id = ?", (book_id,))
+    conn.execute("INSERT INTO versions VALUES (?, ?, ?, ?)", (new_id, book_id, lang, "v"))
+    conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?)", [
+        (new_id, seq, ref, address, texts.get(seq, text) if texts else text) for seq, ref, address, text in rows
+    ])
+
+
+def test_update_skips_reimported_books_whose_text_did_not_change(conn, index):
+    reimport(conn, 1, 11)
+    reimport(conn, 2, 12, {1: "אמר רבי אלהים אמר שמע"})
+    assert index.update(conn) == {"indexed": 1, "unchanged": 2, "removed": 0}
+    assert index.shards[("Genesis", "he")].version_id == 11
+    assert hits(index, "שמע") == [("Berakhot", 0, [3]), ("Berakhot", 1, [4])]
+
+
+def test_a_missing_index_is_reported_once(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(search_index, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(search_index, "SEARCH_INDEX", str(tmp_path / "missing.pickle"))
+    monkeypatch.setattr(search_index, "_missing", False)
+    assert search_index.enabled()
+    assert search_index.get_index() is None
+    assert search_index.get_index() is None
+    assert not search_index.enabled()
+    assert len([r for r in caplog.records if "no index found" in r.getMessage()]) == 1
+
+
+def test_concurrent_first_searches_load_the_index_once(monkeypatch, tmp_path, index):
+    path = tmp_path / "index.pickle"
+    index.save(str(path))
+    monkeypatch.setattr(search_index, "SEARCH_BACKEND", "local")
+    monkeypatch.setattr(search_index, "SEARCH_INDEX", str(path))
+    monkeypatch.setattr(search_index, "_index", None)
+    monkeypatch.setattr(search_index, "_missing", False)
+    loads = []
+    load = search_index.SearchIndex.load
+
+    def slow_load(path):
+        loads.append(path)
+        time.sleep(0.05)
+        return load(path)
+
+    monkeypatch.setattr(search_index.SearchIndex, "load", slow_load)
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        indexes = list(pool.map(lambda _: search_index.get_index(), range(4)))
+    assert len(loads) == 1
+    assert all(found is indexes[0] for found in indexes)
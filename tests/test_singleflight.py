@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from sefaria_jewish_library import resilience, scheduler, singleflight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = singleflight.SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "response"
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("key", fetch) for _ in range(5)))
+        assert results == ["response"] * 5
+        # The call is forgotten once done, so a later caller starts a new one
+        assert await flights.do("key", fetch) == "response"
+
+    asyncio.run(main())
+    assert len(calls) == 2
+    assert flights.stats() == {"executed": 2, "coalesced": 4, "abandoned": 0, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter():
+    flights = singleflight.SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [str(error) for error in errors] == ["upstream failed"] * 3
+    assert flights.executed == 1
+
+
+def test_the_call_is_cancelled_only_when_every_waiter_left():
+    flights = singleflight.SingleFlight()
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        waiters = [asyncio.create_task(flights.do("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0)
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled and flights.in_flight() == 1
+        waiters[1].cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert cancelled == [1]
+    assert flights.abandoned == 1
+    assert flights.in_flight() == 0
+
+
+def test_the_call_does_not_run_under_the_first_callers_deadline():
+    flights = singleflight.SingleFlight()
+    seen = []
+
+    async def fetch():
+        seen.append((resilience.remaining(), scheduler._session.get(), scheduler.flight_key("k")))
+        await asyncio.sleep(0.05)
+        return "response"
+
+    async def short():
+        with resilience.deadline(0.01), scheduler.session("a"), scheduler.lane(scheduler.BATCH):
+            return await flights.do("key", fetch)
+
+    async def long():
+        await asyncio.sleep(0)
+        with resilience.deadline(5), scheduler.session("b"), scheduler.lane(scheduler.BATCH):
+            return await flights.do("key", fetch)
+
+    async def main():
+        return await asyncio.gather(short(), long(), return_exceptions=True)
+
+    first, second = asyncio.run(main())
+    assert isinstance(first, resilience.DeadlineExceeded)
+    assert second == "response"
+    # The first caller's lane and session are kept for fair queuing
+    assert seen == [(None, "a", f"{scheduler.BATCH}:k")]
+    assert flights.executed == 1 and flights.abandoned == 0
+
+
+def test_shared_calls_of_different_sessions_take_turns(monkeypatch):
+    flights = singleflight.SingleFlight()
+    family = scheduler.EndpointFamily("api/v3/texts", rate=200, burst=1)
+    monkeypatch.setattr(scheduler, "_families", {"api/v3/texts": family})
+    order = []
+
+    async def request(session_id, name):
+        async def fetch():
+            await scheduler.acquire("api/v3/texts")
+            order.append(name)
+            return name
+
+        with scheduler.session(session_id), scheduler.lane(scheduler.BATCH):
+            return await flights.do(name, fetch)
+
+    async def main():
+        family.tokens = 0
+        await asyncio.gather(
+            request("a", "a1"), request("a", "a2"), request("a", "a3"), request("b", "b1"), request("b", "b2"),
+        )
+
+    asyncio.run(main())
+    assert order == ["a1", "b1", "a2", "b2", "a3"]
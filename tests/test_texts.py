@@ -0,0 +1,78 @@
+import pytest
+
+from sefaria_jewish_library import texts
+
+FOOTNOTE = 'Text<sup class="footnote-marker">*</sup><i class="footnote">A <i>nested</i> note</i> continues'
+
+
+@pytest.mark.parametrize("segment, expected", [
+    ("In the <b>beginning</b> God", "In the beginning God"),
+    ("pre<i>ital</i>post", "preitalpost"),
+    ("word<br>next", "word next"),
+    ("<p>one</p><p>two</p>", "one two"),
+    ("<span>a</span> <b> b </b>c", "a b c"),
+    ("Tom &amp; Jerry&#39;s &nbsp;cat", "Tom & Jerry's cat"),
+    (FOOTNOTE, "Text continues"),
+    ('Text <sup>1</sup> <i class="footnote">Note</i>, continues', "Text, continues"),
+    ("  no markup  ", "no markup"),
+])
+def test_clean_strips_markup_and_footnotes(segment, expected):
+    assert texts.clean(segment, "niqqud") == expected
+
+
+def test_clean_formats():
+    assert texts.clean("בְּרֵאשִׁ֖ית בָּרָ֣א", "niqqud") == "בְּרֵאשִׁית בָּרָא"
+    assert texts.clean("בְּרֵאשִׁ֖ית בָּרָ֣א", "plain") == "בראשית ברא"
+    assert texts.clean(FOOTNOTE, "footnotes") == "Text [A nested note] continues"
+    assert texts.clean(FOOTNOTE, "raw") == FOOTNOTE
+    with pytest.raises(ValueError):
+        texts.clean("text", "html")
+
+
+SEGMENTS = [
+    ("Genesis 1:1", "בְּרֵאשִׁ֖ית בָּרָ֣א <b>אֱלֹהִ֑ים</b>"),
+    ("Genesis 1:2", ""),
+    ("Genesis 1:3", "In the <i>beginning</i>"),
+]
+
+
+def test_compact_text_round_trip():
+    text = texts.CompactText.from_segments("Genesis 1:1-3", SEGMENTS)
+    assert len(text) == 3
+    assert list(text.segments()) == SEGMENTS
+    assert list(text.segments("plain", start=2)) == [("Genesis 1:3", "In the beginning")]
+    assert text.segment(0, "plain") == "בראשית ברא אלהים"
+    # Empty segments are left out of the rendering
+    assert text.render("plain", " | ") == "בראשית ברא אלהים | In the beginning"
+    assert text.refs[0] is texts.CompactText.from_segments("Genesis 1", SEGMENTS[:1]).refs[0]
+    assert text.nbytes > len(text.buffer)
+
+
+def compact(ref, size):
+    return texts.CompactText.from_segments(ref, [(f"{ref}:1", "x" * size)])
+
+
+def test_segment_cache_is_bounded_by_bytes():
+    first, second, third = (compact(f"Genesis {n}", 1000) for n in range(1, 4))
+    cache = texts.SegmentCache(max_bytes=first.nbytes * 2 + 10)
+    cache.set("1", first, 60)
+    cache.set("2", second, 60)
+    assert cache.get("1") is first
+    cache.set("3", third, 60)
+    # "2" was the least recently used
+    assert cache.get("2") is None
+    assert cache.get("1") is first and cache.get("3") is third
+    assert cache.bytes == first.nbytes + third.nbytes
+    # Replacing an entry does not count it twice, and texts over the budget are not kept
+    cache.set("3", third, 60)
+    assert cache.bytes == first.nbytes + third.nbytes
+    cache.set("big", compact("Genesis 4", 10_000), 60)
+    assert cache.get("big") is None
+    assert cache.stats()["entries"] == 2 and cache.evictions == 1
+
+
+def test_segment_cache_expiry():
+    cache = texts.SegmentCache()
+    cache.set("old", compact("Genesis 1", 10), -1)
+    assert cache.get("old") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,50 @@
+import asyncio
+
+from sefaria_jewish_library import sefaria_handler
+
+
+def test_align_versions_pairs_segments_by_ref():
+    hebrew = ["א", "ב", "ג"]
+    english = ["A", "", "C", "D"]
+    assert sefaria_handler.align_versions("Genesis 1", [hebrew, english]) == [
+        ("Genesis 1:1", ["א", "A"]),
+        ("Genesis 1:2", ["ב", ""]),
+        ("Genesis 1:3", ["ג", "C"]),
+        ("Genesis 1:4", ["", "D"]),
+    ]
+
+
+def test_align_versions_of_a_range_across_sections():
+    hebrew = [["ל", "לא"], ["א"]]
+    english = [["Thirty"], ["One", "Two"]]
+    assert sefaria_handler.align_versions("Genesis 1:30-2:2", [hebrew, english]) == [
+        ("Genesis 1:30", ["ל", "Thirty"]),
+        ("Genesis 1:31", ["לא", ""]),
+        ("Genesis 2:1", ["א", "One"]),
+        ("Genesis 2:2", ["", "Two"]),
+    ]
+
+
+def test_get_text_returns_the_versions_side_by_side(upstream):
+    upstream.texts = {"Genesis 1": {"hebrew": ["<b>א</b>", "ב", "ג"], "english": ["A", "B"]}}
+    text = asyncio.run(sefaria_handler.get_text("Genesis 1", languages=["hebrew", "english"]))
+    assert text == (
+        "hebrew: hebrew version\nenglish: english version\n\n"
+        "[Genesis 1:1]\nא\nA\n[Genesis 1:2]\nב\nB\n[Genesis 1:3]\nג\n\n\n"
+        "(segments 1-3 of Genesis 1; end of text)"
+    )
+    # All the versions come in one request
+    assert len(upstream.requests) == 1
+    assert upstream.requests[0].url.params.get_list("version") == ["hebrew", "english"]
+
+
+def test_get_text_of_a_version_by_title(upstream):
+    upstream.texts = {"Genesis 1": {"hebrew": ["א", "ב"], "english": ["A", "B"]}}
+    text = asyncio.run(sefaria_handler.get_text("Genesis 1", versions=["english|english version"]))
+    assert text.startswith("english: english version\n\n[Genesis 1:1]\nA\n[Genesis 1:2]\nB")
+
+
+def test_get_text_leaves_out_missing_versions(upstream):
+    upstream.texts = {"Genesis 2": {"hebrew": ["ויכלו"]}}
+    text = asyncio.run(sefaria_handler.get_text("Genesis 2", languages=["hebrew", "english"]))
+    assert text == "hebrew: hebrew version\n\n[Genesis 2:1]\nויכלו\n\n(segments 1-1 of Genesis 2; end of text)"